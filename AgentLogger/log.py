@@ -1,86 +1,192 @@
-from flask import Blueprint, render_template, request, jsonify
-import anthropic
-from dotenv import load_dotenv
+from flask import Blueprint, request, jsonify
 import os
-import subprocess
+import threading
 import requests
+from Shared.config import config
+from Shared.http_client import anthropic_headers, ANTHROPIC_API_URL
+from Shared.github_tree import GitHubError
+from Shared.github_cache import list_repo_names, list_commits_since
+from Shared.llm_stream import wants_stream, sse_response
+from Shared.llm_cache import post_messages, cache_bypass
+from Shared.jobs import job_queue, wants_async, submit_job_response
+from Shared.response_policy import static_page
 
 logger_bp = Blueprint('logger', __name__, template_folder='templates')
 
-load_dotenv()
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+GITHUB_TOKEN = config.GITHUB_TOKEN  # Set your GitHub token as env var
+REPO_BASE = config.REPO_BASE  # Directory of the local git mirrors (Shared.git_mirror)
 
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Set your GitHub token as env var
-REPO_BASE = "cloned_repos"  # Directory to store cloned repos
-
-def get_github_repos(username):
+def get_github_repos(username, prefix=None):
     headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    url = f"https://api.github.com/users/{username}/repos"
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
+    try:
+        return list_repo_names(username, headers, prefix=prefix)
+    except GitHubError:
         return []
-    return [repo["name"] for repo in resp.json()]
 
-def get_git_log_summary(username, repo_name, token):
-    url = f"https://api.github.com/repos/{username}/{repo_name}/commits?per_page=50"
+# Commits summarized on a repo's first request, and the most fetched for one refresh
+LOGGER_INITIAL_COMMITS = int(os.getenv("LOGGER_INITIAL_COMMITS", 50))
+LOGGER_MAX_DELTA_COMMITS = int(os.getenv("LOGGER_MAX_DELTA_COMMITS", 1000))
+# Commits per LLM call when a delta is too long for one prompt, and partial
+# summaries merged per call when reducing them
+LOGGER_CHUNK_COMMITS = int(os.getenv("LOGGER_CHUNK_COMMITS", 100))
+LOGGER_MERGE_FANIN = int(os.getenv("LOGGER_MERGE_FANIN", 8))
+
+SUMMARY_SYSTEM = "You are an expert AI agent summarizing git logs for a human reader."
+SUMMARY_STYLE = (
+    "Use clear language, bullet points, and highlight the most important changes and their impact. "
+    "Make the summary easy to comprehend and visually organized"
+)
+
+
+class SummaryStore:
+    """Rolling summary per repo with the head SHA it covers"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, username, repo_name):
+        with self._lock:
+            return self._entries.get((username, repo_name))
+
+    def put(self, username, repo_name, head_sha, summary):
+        with self._lock:
+            self._entries[(username, repo_name)] = {"head_sha": head_sha, "summary": summary}
+
+
+summary_store = SummaryStore()
+
+
+def format_commit_lines(commits):
+    logs = []
+    for commit in commits:
+        sha = commit["sha"][:7]
+        author = commit["commit"]["author"]["name"]
+        date = commit["commit"]["author"]["date"][:10]
+        message = commit["commit"]["message"].replace('\n', ' ')
+        logs.append(f"{sha} {author} {date} {message}")
+    return logs
+
+def summary_payload(prompt):
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 1024,
+        "temperature": 0.5,
+        "system": SUMMARY_SYSTEM,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+
+def complete(prompt, bypass_cache=False):
+    resp_json = post_messages(summary_payload(prompt), url=ANTHROPIC_API_URL, headers=anthropic_headers(),
+                              bypass=bypass_cache, module="logger")
+    return resp_json["content"][0]["text"]
+
+def reduce_commit_lines(logs, bypass_cache=False):
+    """
+    Summaries of LOGGER_CHUNK_COMMITS-sized chunks of logs, merged in groups
+    of LOGGER_MERGE_FANIN until at most LOGGER_MERGE_FANIN remain
+    """
+    partials = [
+        complete("Summarize the following git commit logs for a non-technical reader. "
+                 f"{SUMMARY_STYLE}:\n\n" + "\n".join(logs[i:i + LOGGER_CHUNK_COMMITS]) + "\n\nSummary:",
+                 bypass_cache)
+        for i in range(0, len(logs), LOGGER_CHUNK_COMMITS)
+    ]
+    while len(partials) > LOGGER_MERGE_FANIN:
+        partials = [
+            complete("Merge the following summaries of consecutive stretches of git history "
+                     f"(newest first) into one summary. {SUMMARY_STYLE}:\n\n"
+                     + "\n\n---\n\n".join(partials[i:i + LOGGER_MERGE_FANIN]) + "\n\nSummary:",
+                     bypass_cache)
+            for i in range(0, len(partials), LOGGER_MERGE_FANIN)
+        ]
+    return partials
+
+def build_log_summary_payload(username, repo_name, token, bypass_cache=False):
+    """
+    Plan the LLM call that brings the repo's rolling summary up to date.
+    Only commits after the stored head SHA are fetched; long deltas are
+    pre-summarized in chunks before being merged into the stored summary.
+
+    Returns: (payload, head_sha, error). payload is None without an error
+    when the stored summary already covers the current head.
+    """
     headers = {"Authorization": f"token {token}"}
-    
+    state = summary_store.get(username, repo_name)
     try:
-        resp = requests.get(url, headers=headers)
-        if resp.status_code != 200:
-            return f"Error retrieving commit logs: {resp.status_code} - {resp.text}"
-        commits = resp.json()
-        
-        if not commits:
-            return "No commits found in this repository."
-            
-        logs = []
-        for commit in commits:
-            sha = commit["sha"][:7]
-            author = commit["commit"]["author"]["name"]
-            date = commit["commit"]["author"]["date"][:10]
-            message = commit["commit"]["message"].replace('\n', ' ')
-            logs.append(f"{sha} {author} {date} {message}")
-        logs_text = "\n".join(logs)
-
-        if not ANTHROPIC_API_KEY:
-            return "Error: Anthropic API key not configured"
-            
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        if state:
+            commits, found = list_commits_since(username, repo_name, state["head_sha"],
+                                                limit=LOGGER_MAX_DELTA_COMMITS, headers=headers)
+        else:
+            commits, found = list_commits_since(username, repo_name, limit=LOGGER_INITIAL_COMMITS,
+                                                headers=headers)
+    except GitHubError as e:
+        return None, None, f"Error retrieving commit logs: {e.message}"
+    
+    if not commits:
+        if state:
+            return None, state["head_sha"], None
+        return None, None, "No commits found in this repository."
+
+    if not ANTHROPIC_API_KEY:
+        return None, None, "Error: Anthropic API key not configured"
+
+    head_sha = commits[0]["sha"]
+    logs = format_commit_lines(commits)
+    if len(logs) > LOGGER_CHUNK_COMMITS:
+        new_work = "Summaries of the new commits:\n\n" + "\n\n---\n\n".join(reduce_commit_lines(logs, bypass_cache))
+    else:
+        new_work = "New commit logs:\n\n" + "\n".join(logs)
+
+    # A force-push or a gap past LOGGER_MAX_DELTA_COMMITS loses the stored
+    # head, so the old summary no longer lines up and is dropped
+    if state and found:
         prompt = (
-            "Summarize the following git commit logs for a non-technical reader. "
-            "Use clear language, bullet points, and highlight the most important changes and their impact. "
-            "Make the summary easy to comprehend and visually organized:\n\n"
-            f"{logs_text}\n\nSummary:"
+            "Below is the current summary of a repository's git history, followed by the commits "
+            "made since it was written. Update the summary so it also covers the new work, "
+            f"for a non-technical reader. {SUMMARY_STYLE}:\n\n"
+            f"Current summary:\n{state['summary']}\n\n{new_work}\n\nUpdated summary:"
         )
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1024,
-            temperature=0.5,
-            system="You are an expert AI agent summarizing git logs for a human reader.",
-            messages=[{"role": "user", "content": prompt}]
+    else:
+        prompt = (
+            "Summarize the following git commit history for a non-technical reader. "
+            f"{SUMMARY_STYLE}:\n\n{new_work}\n\nSummary:"
         )
-        usage = getattr(response, "usage", None)
-        input_tokens = getattr(usage, "input_tokens", None) if usage else None
-        output_tokens = getattr(usage, "output_tokens", None) if usage else None
-        total_tokens = (input_tokens or 0) + (output_tokens or 0)
-        print(f"Input tokens: {input_tokens}, Output tokens: {output_tokens}, Total: {total_tokens}")
-        summary_text = response.content if isinstance(response.content, str) else response.content[0].text if hasattr(response.content[0], "text") else str(response.content[0])
+    return summary_payload(prompt), head_sha, None
+
+def get_git_log_summary(username, repo_name, token, bypass_cache=False):
+    try:
+        payload, head_sha, error = build_log_summary_payload(username, repo_name, token, bypass_cache)
+        if error:
+            return error
+        if payload is None:
+            return summary_store.get(username, repo_name)["summary"]
+        resp_json = post_messages(payload, url=ANTHROPIC_API_URL, headers=anthropic_headers(),
+                                  bypass=bypass_cache, module="logger")
+        summary_text = resp_json["content"][0]["text"]
+        summary_store.put(username, repo_name, head_sha, summary_text)
         return summary_text
     except requests.exceptions.RequestException as e:
         return f"Network error: {str(e)}"
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
+def summarize_logs_job(params, progress):
+    return {"summary": get_git_log_summary(params["username"], params["repo_name"], GITHUB_TOKEN,
+                                           bypass_cache=bool(params.get("no_cache")))}
+
+job_queue.register('summarize_logs', summarize_logs_job, concurrency=int(os.getenv("JOBS_SUMMARY_CONCURRENCY", 2)))
+
 @logger_bp.route('/')
 def index():
-    return render_template('logger.html')
+    return static_page('logger.html')
 
 @logger_bp.route('/get_repos', methods=['POST'])
 def get_repos():
     data = request.get_json()
     username = data.get("username")
-    repos = get_github_repos(username)
+    repos = get_github_repos(username, data.get("prefix"))
     return jsonify({"repos": repos})
 
 @logger_bp.route('/summarize_logs', methods=['POST'])
@@ -95,7 +201,23 @@ def summarize_logs():
         if not username or not repo_name:
             return jsonify({"error": "Missing username or repo name"}), 400
         
-        summary = get_git_log_summary(username, repo_name, GITHUB_TOKEN)
+        if wants_async(data):
+            return submit_job_response('summarize_logs', data)
+
+        if wants_stream(data):
+            bypass = cache_bypass(data)
+            payload, head_sha, error = build_log_summary_payload(username, repo_name, GITHUB_TOKEN, bypass)
+            if error:
+                return jsonify({"summary": error})
+            if payload is None:
+                return jsonify({"summary": summary_store.get(username, repo_name)["summary"]})
+
+            def remember(summary_text, usage):
+                summary_store.put(username, repo_name, head_sha, summary_text)
+                return {"head_sha": head_sha}
+            return sse_response(payload, on_complete=remember, bypass=bypass, module="logger")
+
+        summary = get_git_log_summary(username, repo_name, GITHUB_TOKEN, bypass_cache=cache_bypass(data))
         return jsonify({"summary": summary})
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
\ No newline at end of file
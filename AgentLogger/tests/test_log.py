@@ -0,0 +1,103 @@
+import pytest
+
+from AgentLogger import log
+from AgentLogger.log import SummaryStore, get_git_log_summary
+
+
+def commit(n):
+    return {"sha": f"{n:07x}".ljust(40, "0"), "commit": {"author": {"name": "dev", "date": "2024-03-0%dT10:00:00Z" % (n % 9 + 1)},
+                                         "message": f"change {n}\n\nbody"}}
+
+
+class FakeGitHub:
+    """list_commits_since over a history held newest first"""
+
+    def __init__(self, history):
+        self.history = history
+        self.calls = []
+
+    def __call__(self, username, repo, since_sha=None, limit=50, headers=None):
+        self.calls.append((since_sha, limit))
+        commits = []
+        for c in self.history:
+            if c["sha"] == since_sha:
+                return commits, True
+            if len(commits) == limit:
+                break
+            commits.append(c)
+        return commits, False
+
+
+@pytest.fixture
+def logger(monkeypatch):
+    prompts = []
+
+    def post_messages(payload, **kwargs):
+        prompts.append(payload["messages"][0]["content"])
+        return {"content": [{"type": "text", "text": f"summary {len(prompts)}"}]}
+
+    github = FakeGitHub([commit(n) for n in range(3, 0, -1)])
+    monkeypatch.setattr(log, "post_messages", post_messages)
+    monkeypatch.setattr(log, "list_commits_since", github)
+    monkeypatch.setattr(log, "summary_store", SummaryStore())
+    return github, prompts
+
+
+def test_commit_lines_are_one_line_each():
+    assert log.format_commit_lines([commit(10)]) == [f"{10:07x} dev 2024-03-02 change 10  body"]
+
+
+def test_first_summary_covers_the_recent_history(logger):
+    github, prompts = logger
+
+    assert get_git_log_summary("u", "r", "token") == "summary 1"
+    assert github.calls == [(None, log.LOGGER_INITIAL_COMMITS)]
+    assert prompts[0].startswith("Summarize the following git commit history")
+    assert log.summary_store.get("u", "r")["head_sha"] == commit(3)["sha"]
+
+
+def test_later_summaries_only_send_new_commits(logger):
+    github, prompts = logger
+    get_git_log_summary("u", "r", "token")
+    github.history = [commit(5), commit(4)] + github.history
+
+    assert get_git_log_summary("u", "r", "token") == "summary 2"
+    assert github.calls[1] == (commit(3)["sha"], log.LOGGER_MAX_DELTA_COMMITS)
+    assert "Current summary:\nsummary 1" in prompts[1]
+    assert f"{5:07x}" in prompts[1] and f"{3:07x}" not in prompts[1]
+    assert log.summary_store.get("u", "r")["head_sha"] == commit(5)["sha"]
+
+
+def test_an_unchanged_head_makes_no_llm_call(logger):
+    _, prompts = logger
+    get_git_log_summary("u", "r", "token")
+
+    assert get_git_log_summary("u", "r", "token") == "summary 1"
+    assert len(prompts) == 1
+
+
+def test_a_lost_head_starts_the_summary_over(logger):
+    github, prompts = logger
+    get_git_log_summary("u", "r", "token")
+    # Force-pushed: the stored head is no longer in the history
+    github.history = [commit(9), commit(8)]
+
+    get_git_log_summary("u", "r", "token")
+
+    assert prompts[1].startswith("Summarize the following git commit history")
+    assert "Current summary" not in prompts[1]
+
+
+def test_long_deltas_are_summarized_in_chunks_then_merged(logger, monkeypatch):
+    github, prompts = logger
+    monkeypatch.setattr(log, "LOGGER_CHUNK_COMMITS", 2)
+    monkeypatch.setattr(log, "LOGGER_MERGE_FANIN", 2)
+    github.history = [commit(n) for n in range(9, 0, -1)]
+
+    get_git_log_summary("u", "r", "token")
+
+    chunks = [p for p in prompts if p.startswith("Summarize the following git commit logs")]
+    merges = [p for p in prompts if p.startswith("Merge the following summaries")]
+    # 9 commits -> 5 chunk summaries -> 3 merged (3 calls) -> 2 merged (2 calls), then the final call
+    assert (len(chunks), len(merges), len(prompts)) == (5, 5, 11)
+    assert prompts[-1].startswith("Summarize the following git commit history")
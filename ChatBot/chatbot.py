@@ -1,29 +1,158 @@
-from flask import Blueprint, render_template, request, jsonify
-import requests
-from dotenv import load_dotenv
+from flask import Blueprint, request, jsonify
+from Shared.llm_cache import post_messages, cache_bypass
+from Shared.llm_stream import wants_stream, sse_response
+from Shared.response_policy import static_page
+from Shared.tracing import propagate
+from Shared.config import config
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
+import threading
+import time
+import uuid
 
 chatbot_bp = Blueprint('chatbot', __name__, template_folder='templates')
 
-load_dotenv()
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+ANTHROPIC_API_URL = config.ANTHROPIC_API_URL
+MODEL = config.MODEL
+VERSION = config.VERSION
 
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL")
-MODEL = os.getenv("MODEL")
-VERSION = os.getenv("VERSION")
+SYSTEM_PROMPT = "You are Claude, an AI assistant."
+# Context size (input + output tokens of the last turn) that triggers compaction,
+# and how many of the most recent messages are always kept verbatim
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", 8000))
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_KEEP_MESSAGES", 4))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", 2 * 60 * 60))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 1000))
+# Threads that summarize sessions after the turn that went past the budget
+CHAT_COMPACTION_WORKERS = int(os.getenv("CHAT_COMPACTION_WORKERS", 2))
+
+log = logging.getLogger(__name__)
+compaction_executor = ThreadPoolExecutor(max_workers=CHAT_COMPACTION_WORKERS, thread_name_prefix="chat-compaction")
+
+
+class SessionStore:
+    """
+    Server-side conversations keyed by id: the recent messages, a rolling
+    summary of compacted turns, and token counts. Idle sessions expire
+    after ttl seconds and the least recently used go past max_sessions.
+    Each session's "lock" guards its messages and summary.
+    """
+
+    def __init__(self, ttl, max_sessions):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id=None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and time.monotonic() - session["touched"] >= self.ttl:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                session_id = uuid.uuid4().hex
+                session = {"id": session_id, "summary": "", "messages": [],
+                           "context_tokens": 0, "total_tokens": 0, "compactions": 0,
+                           "lock": threading.Lock(), "compacting": False}
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            session["touched"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+
+session_store = SessionStore(CHAT_SESSION_TTL, CHAT_MAX_SESSIONS)
+
+
+def session_system_prompt(session):
+    if not session["summary"]:
+        return SYSTEM_PROMPT
+    return f"{SYSTEM_PROMPT}\n\nSummary of the earlier conversation:\n{session['summary']}"
+
+def compact_session(session, headers):
+    """
+    Fold all but the last CHAT_KEEP_MESSAGES messages into the rolling
+    summary. The session is only locked around reading and writing it, so
+    turns can go on during the LLM call. Raises what post_messages raises.
+    """
+    # Keep an even tail so the retained history still starts with a user turn
+    keep = CHAT_KEEP_MESSAGES - CHAT_KEEP_MESSAGES % 2
+    with session["lock"]:
+        older = session["messages"][:len(session["messages"]) - keep]
+        summary = session["summary"]
+    if not older:
+        return
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in older)
+    prompt = (
+        "Update the running summary of a conversation between a user and an AI assistant "
+        "with the turns below. Keep facts, decisions, code and open questions the assistant "
+        "will need later; drop pleasantries. Reply with the summary only.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    resp_json = post_messages({
+        "model": MODEL,
+        "max_tokens": 1024,
+        "system": "You compress conversation history into concise summaries.",
+        "messages": [{"role": "user", "content": prompt}]
+    }, url=ANTHROPIC_API_URL, headers=headers, module="chatbot")
+    with session["lock"]:
+        # Turns added meanwhile stay; only what was summarized is dropped
+        if session["messages"][:len(older)] == older:
+            session["summary"] = resp_json["content"][0]["text"]
+            session["messages"] = session["messages"][len(older):]
+            session["compactions"] += 1
+
+def compact_later(session, headers):
+    """
+    Compact on the background executor, one compaction per session at a
+    time. A failure is logged and only leaves the history longer; the next
+    turn over the budget tries again.
+    """
+    with session["lock"]:
+        if session["compacting"]:
+            return
+        session["compacting"] = True
+
+    def run():
+        try:
+            compact_session(session, headers)
+        except Exception:
+            log.warning("Compacting chat session %s failed", session["id"], exc_info=True)
+        finally:
+            with session["lock"]:
+                session["compacting"] = False
+
+    compaction_executor.submit(propagate(run))
+
+def record_turn(session, reply, usage, headers):
+    """Store the assistant reply and compact in the background once the context passes the budget"""
+    context_tokens = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+    with session["lock"]:
+        session["messages"].append({"role": "assistant", "content": reply})
+        session["context_tokens"] = context_tokens
+        session["total_tokens"] += context_tokens
+    if context_tokens > CHAT_TOKEN_BUDGET:
+        compact_later(session, headers)
+    with session["lock"]:
+        return {"session_id": session["id"], "context_tokens": session["context_tokens"],
+                "total_tokens": session["total_tokens"], "compactions": session["compactions"]}
 
 @chatbot_bp.route('/')
 def index():
-    return render_template('coderpage.html')
+    return static_page('coderpage.html')
 
 @chatbot_bp.route('/chatbot')
 def chatbot():
-    return render_template('chatbot.html')
+    return static_page('chatbot.html')
 
 @chatbot_bp.route('/chat', methods=['POST'])
 def chat():
     data = request.get_json()
-    messages = data.get("messages", [])
 
     headers = {
         "Content-Type": "application/json",
@@ -31,23 +160,42 @@ def chat():
         "anthropic-version": VERSION
     }
 
+    # Session mode: the client sends only the new message; history lives here
+    session = None
+    if data.get("message"):
+        session = session_store.get_or_create(data.get("session_id"))
+        with session["lock"]:
+            if session["messages"] and session["messages"][-1]["role"] == "user":
+                # The previous turn failed before a reply; replace its message
+                session["messages"].pop()
+            session["messages"].append({"role": "user", "content": data["message"]})
+            system = session_system_prompt(session)
+            messages = list(session["messages"])
+    else:
+        system = SYSTEM_PROMPT
+        messages = data.get("messages", [])
+
     payload = {
         "model": MODEL,
         "max_tokens": 1024,
-        "system": "You are Claude, an AI assistant.",
+        "system": system,
         "messages": messages
     }
 
+    if wants_stream(data):
+        on_complete = None
+        if session is not None:
+            on_complete = lambda reply, usage: record_turn(session, reply, usage, headers)
+        return sse_response(payload, on_complete=on_complete, url=ANTHROPIC_API_URL, headers=headers,
+                            bypass=cache_bypass(data), module="chatbot")
+
     try:
-        response = requests.post(ANTHROPIC_API_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        resp_json = response.json()
-        content = response.json()["content"][0]["text"]
+        resp_json = post_messages(payload, url=ANTHROPIC_API_URL, headers=headers, bypass=cache_bypass(data),
+                                  module="chatbot")
+        content = resp_json["content"][0]["text"]
         usage = resp_json.get("usage", {})
-        input_tokens = usage.get("input_tokens")
-        output_tokens = usage.get("output_tokens")
-        total_tokens = (input_tokens or 0) + (output_tokens or 0)
-        print(f"Input tokens: {input_tokens}, Output tokens: {output_tokens}, Total: {total_tokens}")
+        if session is not None:
+            return jsonify({"reply": content, **record_turn(session, content, usage, headers)})
         return jsonify({"reply": content})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -0,0 +1,143 @@
+import pytest
+from flask import Flask
+
+from ChatBot import chatbot
+from ChatBot.chatbot import SessionStore
+
+
+class InlineExecutor:
+    """Runs background compactions before the turn returns, so tests see their outcome"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def claude(monkeypatch):
+    """Records every Messages API payload; replies with a fixed usage per call"""
+    payloads = []
+    usage = {"input_tokens": 100, "output_tokens": 20}
+
+    def post_messages(payload, **kwargs):
+        payloads.append(payload)
+        if payload["system"].startswith("You compress"):
+            return {"content": [{"type": "text", "text": f"summary {len(payloads)}"}]}
+        return {"content": [{"type": "text", "text": f"reply {len(payloads)}"}], "usage": dict(usage)}
+
+    monkeypatch.setattr(chatbot, "post_messages", post_messages)
+    monkeypatch.setattr(chatbot, "session_store", SessionStore(ttl=60, max_sessions=10))
+    monkeypatch.setattr(chatbot, "compaction_executor", InlineExecutor())
+    return payloads, usage
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(chatbot.chatbot_bp, url_prefix="/chatbot")
+    return app.test_client()
+
+
+def say(client, message, session_id=None):
+    return client.post("/chatbot/chat", json={"message": message, "session_id": session_id}).get_json()
+
+
+def test_session_keeps_history_server_side(client, claude):
+    payloads, _ = claude
+    first = say(client, "hello")
+    second = say(client, "again", first["session_id"])
+
+    assert second["session_id"] == first["session_id"]
+    assert [m["content"] for m in payloads[1]["messages"]] == ["hello", "reply 1", "again"]
+    assert second["total_tokens"] == 240
+
+
+def test_past_the_budget_older_turns_fold_into_the_summary(client, claude, monkeypatch):
+    payloads, usage = claude
+    monkeypatch.setattr(chatbot, "CHAT_TOKEN_BUDGET", 500)
+    monkeypatch.setattr(chatbot, "CHAT_KEEP_MESSAGES", 2)
+    session_id = say(client, "one")["session_id"]
+    say(client, "two", session_id)
+    usage["input_tokens"] = 600
+    turn = say(client, "three", session_id)
+
+    assert turn["compactions"] == 1
+    compaction = payloads[3]["messages"][0]["content"]
+    assert "USER: one" in compaction and "USER: two" in compaction and "three" not in compaction
+    say(client, "four", session_id)
+    assert [m["content"] for m in payloads[4]["messages"]] == ["three", "reply 3", "four"]
+    assert payloads[4]["system"].endswith("Summary of the earlier conversation:\nsummary 4")
+
+
+def test_an_odd_keep_count_still_starts_the_history_with_a_user_turn(client, claude, monkeypatch):
+    payloads, usage = claude
+    monkeypatch.setattr(chatbot, "CHAT_TOKEN_BUDGET", 0)
+    monkeypatch.setattr(chatbot, "CHAT_KEEP_MESSAGES", 3)
+    session_id = say(client, "one")["session_id"]
+    say(client, "two", session_id)
+
+    assert payloads[-2]["messages"][0]["role"] == "user"
+
+
+def test_a_failed_turn_is_replaced_by_the_retry(client, claude):
+    payloads, _ = claude
+    session = chatbot.session_store.get_or_create()
+    session["messages"].append({"role": "user", "content": "lost"})
+
+    say(client, "retry", session["id"])
+
+    assert [m["content"] for m in payloads[0]["messages"]] == ["retry"]
+
+
+def test_sessions_expire_and_are_bounded(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(chatbot.time, "monotonic", lambda: clock[0])
+    store = SessionStore(ttl=10, max_sessions=2)
+    first = store.get_or_create()["id"]
+
+    clock[0] = 11
+    assert store.get_or_create(first)["id"] != first
+
+    ids = [store.get_or_create()["id"] for _ in range(3)]
+    assert store.get_or_create(ids[0])["id"] != ids[0]
+    assert store.get_or_create(ids[2])["id"] == ids[2]
+
+
+def test_a_failed_compaction_keeps_the_turn_and_the_history(client, claude, monkeypatch):
+    payloads, usage = claude
+    monkeypatch.setattr(chatbot, "CHAT_TOKEN_BUDGET", 500)
+    monkeypatch.setattr(chatbot, "CHAT_KEEP_MESSAGES", 2)
+    answer = chatbot.post_messages
+
+    def post_messages(payload, **kwargs):
+        if payload["system"].startswith("You compress"):
+            raise RuntimeError("overloaded")
+        return answer(payload, **kwargs)
+
+    monkeypatch.setattr(chatbot, "post_messages", post_messages)
+    session_id = say(client, "one")["session_id"]
+    usage["input_tokens"] = 600
+    response = client.post("/chatbot/chat", json={"message": "two", "session_id": session_id})
+
+    assert response.status_code == 200
+    assert response.get_json()["reply"] == "reply 2"
+    assert response.get_json()["compactions"] == 0
+    say(client, "three", session_id)
+    assert [m["content"] for m in payloads[-1]["messages"]] == ["one", "reply 1", "two", "reply 2", "three"]
+
+
+def test_turns_added_during_a_compaction_are_kept(claude, monkeypatch):
+    monkeypatch.setattr(chatbot, "CHAT_KEEP_MESSAGES", 2)
+    session = chatbot.session_store.get_or_create()
+    session["messages"] = [{"role": "user", "content": "one"}, {"role": "assistant", "content": "a"},
+                           {"role": "user", "content": "two"}, {"role": "assistant", "content": "b"}]
+
+    def post_messages(payload, **kwargs):
+        # Another request finishes a turn while the summary is being written
+        session["messages"] += [{"role": "user", "content": "three"}, {"role": "assistant", "content": "c"}]
+        return {"content": [{"type": "text", "text": "summary"}]}
+
+    monkeypatch.setattr(chatbot, "post_messages", post_messages)
+    chatbot.compact_session(session, {})
+
+    assert session["summary"] == "summary"
+    assert [m["content"] for m in session["messages"]] == ["two", "b", "three", "c"]
@@ -0,0 +1,169 @@
+"""
+Token-budgeted context packing for README generation.
+
+Instead of cutting every module to its first 500 characters (mostly imports
+and headers), Python files are reduced to an AST outline: module docstring,
+config constants, classes, function signatures, route decorators and the
+first line of each docstring. Sections are added in priority order until a
+locally estimated token budget is spent.
+"""
+import ast
+import re
+
+from Shared.tracing import span
+
+# Roughly one BPE token per word/punctuation piece, plus one per extra 8 chars of long words
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Tokens kept from a file that cannot be outlined (HTML, requirements, README)
+FILE_PREVIEW_TOKENS = 150
+
+
+def estimate_tokens(text):
+    """Local estimate of the model's token count for text"""
+    return sum(1 + len(piece) // 8 for piece in _PIECE_RE.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest line-aligned prefix of text within max_tokens"""
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            kept.append("...")
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def _first_line(node):
+    doc = ast.get_docstring(node)
+    return doc.strip().splitlines()[0] if doc and doc.strip() else None
+
+
+def _signature(node, indent):
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    lines = [f"{indent}@{ast.unparse(d)}" for d in node.decorator_list]
+    lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}")
+    doc = _first_line(node)
+    if doc:
+        lines.append(f'{indent}    """{doc}"""')
+    return lines
+
+
+def outline_python(source):
+    """
+    Outline of a Python module: docstring, UPPER_CASE constants, classes with
+    their methods, and top-level functions with decorators and docstrings.
+    Raises SyntaxError for code that does not parse.
+    """
+    tree = ast.parse(source)
+    lines = []
+    doc = _first_line(tree)
+    if doc:
+        lines.append(f'"""{doc}"""')
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.extend(_signature(node, ""))
+        elif isinstance(node, ast.ClassDef):
+            lines.extend(f"@{ast.unparse(d)}" for d in node.decorator_list)
+            bases = ", ".join(ast.unparse(b) for b in node.bases)
+            lines.append(f"class {node.name}({bases})" if bases else f"class {node.name}")
+            doc = _first_line(node)
+            if doc:
+                lines.append(f'    """{doc}"""')
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    lines.extend(_signature(item, "    "))
+        elif isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) for t in node.targets):
+            names = [t.id for t in node.targets]
+            value = ast.unparse(node.value)
+            # Blueprints and config constants say a lot about the app's shape
+            if any(name.isupper() for name in names) or "Blueprint(" in value or "Flask(" in value:
+                value = value if len(value) <= 80 else value[:77] + "..."
+                lines.append(f"{' = '.join(names)} = {value}")
+    return "\n".join(lines)
+
+
+def outline_symbols(symbols):
+    """Outline built from symbol index entries, without the source at hand"""
+    lines = []
+    for symbol in symbols:
+        if '<locals>' in symbol['qualname']:
+            continue
+        indent = "    " * symbol['qualname'].count('.')
+        lines.extend(f"{indent}@{d}" for d in symbol['decorators'])
+        lines.append(f"{indent}{symbol['signature']}")
+        if symbol['doc']:
+            lines.append(f'{indent}    """' + symbol['doc'] + '"""')
+    return "\n".join(lines)
+
+
+def outline_file(path, content):
+    """Outline for .py files, a token-capped preview for anything else"""
+    if path.endswith('.py'):
+        try:
+            with span('ast', path=path):
+                return outline_python(content)
+        except SyntaxError:
+            pass
+    return truncate_to_tokens(content, FILE_PREVIEW_TOKENS)
+
+
+def _module_name(path):
+    return path.split('/')[0] if '/' in path else 'root'
+
+
+def order_by_module(paths):
+    """
+    Round-robin paths across modules: the first file of every module, then
+    the second of every module, and so on, so a cap keeps every module.
+    """
+    by_module = {}
+    for path in paths:
+        by_module.setdefault(_module_name(path), []).append(path)
+    ordered = []
+    for rank in range(max((len(group) for group in by_module.values()), default=0)):
+        ordered.extend(group[rank] for group in by_module.values() if rank < len(group))
+    return ordered
+
+
+def pack_context(main_files, other_outlines, budget):
+    """
+    Fill budget tokens with snippets, in priority order:
+    main application files in full (or outlined when too big), then the
+    first file of every module, then the remaining files, all outlined.
+    main_files lists (path, content) and other_outlines (path, outline), in priority order.
+    Returns: (snippets, estimated tokens used)
+    """
+    snippets = []
+    used = 0
+
+    def add(snippet):
+        nonlocal used
+        cost = estimate_tokens(snippet)
+        if used + cost > budget:
+            return False
+        snippets.append(snippet)
+        used += cost
+        return True
+
+    for path, content in main_files:
+        if not add(f"=== MAIN APPLICATION FILE: {path} ===\n{content}\n\n"):
+            add(f"=== MAIN APPLICATION FILE (outline): {path} ===\n{outline_file(path, content)}\n\n")
+
+    seen_modules = set()
+    leads, rest = [], []
+    for path, outline in other_outlines:
+        module = _module_name(path)
+        (rest if module in seen_modules else leads).append((module, path, outline))
+        seen_modules.add(module)
+
+    for module, path, outline in leads + rest:
+        if outline:
+            # Keep going when one section does not fit; a smaller one may
+            add(f"=== MODULE: {module} ({path}) ===\n{outline}\n\n")
+    return snippets, used
@@ -1,26 +1,34 @@
-from flask import Blueprint, render_template, request, jsonify
-import requests
-from dotenv import load_dotenv
+from flask import Blueprint, request, jsonify
+from Shared.github_tree import list_files, get_tree, is_doc_file, is_readme_source, GitHubError
+from Shared.blob_cache import read_file, prefetch_files
+from Shared.github_cache import list_repo_names, list_branch_names
+from Shared.llm_stream import wants_stream, sse_response
+from Shared.llm_cache import post_messages, cache_bypass
+from Shared.jobs import job_queue, wants_async, submit_job_response, JobError
+from Shared.symbol_index import symbol_index
+from Shared.git_commit import commit_files
+from Shared.response_policy import static_page
+from Docuwriter.context_packer import pack_context, outline_file, outline_symbols, order_by_module
+from Docuwriter.repo_docs import apply_docstrings, document_repo
+from Shared.config import config
 import os
-import re
-import ast
-import json
-import base64
-
-load_dotenv()
 
 docuwriter_bp = Blueprint('docuwriter', __name__, template_folder='templates')
 
-GITHUB_API = "https://api.github.com"
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL")
-MODEL = os.getenv("MODEL")
-VERSION = os.getenv("VERSION")
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Optional: for private repos or higher rate limits
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+ANTHROPIC_API_URL = config.ANTHROPIC_API_URL
+MODEL = config.MODEL
+VERSION = config.VERSION
+GITHUB_TOKEN = config.GITHUB_TOKEN  # Optional: for private repos or higher rate limits
+# Concurrent file fetches while gathering context for generate_readme
+README_FETCH_CONCURRENCY = int(os.getenv("README_FETCH_CONCURRENCY", 8))
+# Estimated prompt tokens spent on repository context, and files considered for it
+README_CONTEXT_TOKENS = int(os.getenv("README_CONTEXT_TOKENS", 3000))
+README_MAX_FILES = int(os.getenv("README_MAX_FILES", 60))
 
 @docuwriter_bp.route('/')
 def index():
-    return render_template('writerpage.html')
+    return static_page('writerpage.html')
 
 @docuwriter_bp.route('/repos')
 def list_repos():
@@ -32,10 +40,10 @@ def list_repos():
     if GITHUB_TOKEN:
         headers['Authorization'] = f"token {GITHUB_TOKEN}"
     
-    r = requests.get(f"{GITHUB_API}/users/{username}/repos", headers=headers)
-    if r.status_code != 200:
-        return jsonify({'error': 'GitHub error', 'status_code': r.status_code, 'response': r.text}), 500
-    repos = [repo['name'] for repo in r.json()]
+    try:
+        repos = list_repo_names(username, headers, prefix=request.args.get('prefix'))
+    except GitHubError as e:
+        return jsonify({'error': 'GitHub error', 'status_code': e.status_code, 'response': e.message}), 500
     return jsonify({'repos': repos})
 
 @docuwriter_bp.route('/branches')
@@ -49,10 +57,10 @@ def list_branches():
     if GITHUB_TOKEN:
         headers['Authorization'] = f"token {GITHUB_TOKEN}"
     
-    r = requests.get(f"{GITHUB_API}/repos/{username}/{repo}/branches", headers=headers)
-    if r.status_code != 200:
+    try:
+        branches = list_branch_names(username, repo, headers, prefix=request.args.get('prefix'))
+    except GitHubError:
         return jsonify({'error': 'GitHub error'}), 500
-    branches = [b['name'] for b in r.json()]
     return jsonify({'branches': branches})
 
 @docuwriter_bp.route('/filetree')
@@ -67,25 +75,10 @@ def filetree():
     if GITHUB_TOKEN:
         headers['Authorization'] = f"token {GITHUB_TOKEN}"
     
-    def get_repo_files(path=""):
-        url = f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}"
-        params = {'ref': branch}
-        r = requests.get(url, headers=headers, params=params)
-        if r.status_code != 200:
-            return []
-        
-        files = []
-        for item in r.json():
-            if item['type'] == 'file':
-                if (item['name'].endswith('.py') or 
-                    item['name'].endswith('.html') or 
-                    item['name'] == "README.md"):
-                    files.append(item['path'])
-            elif item['type'] == 'dir' and item['name'] not in {'venv', '.venv', '__pycache__', 'tests', 'migrations'}:
-                files.extend(get_repo_files(item['path']))
-        return files
-    
-    tree = get_repo_files()
+    try:
+        _, tree = list_files(username, repo, branch, is_doc_file, headers)
+    except GitHubError as e:
+        return jsonify({'error': e.message}), 500
     return jsonify(tree)
 
 @docuwriter_bp.route('/filecontent')
@@ -102,14 +95,33 @@ def filecontent():
     if GITHUB_TOKEN:
         headers['Authorization'] = f"token {GITHUB_TOKEN}"
     
-    r = requests.get(f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}", 
-                    headers=headers, params={'ref': branch})
-    if r.status_code != 200:
+    try:
+        content = read_file(username, repo, branch, path, headers)
+    except GitHubError:
         return jsonify({'error': 'GitHub error'}), 500
-    
-    content = base64.b64decode(r.json()['content']).decode('utf-8')
     return jsonify({'content': content})
 
+@docuwriter_bp.route('/symbols')
+def symbols():
+    # Classes/functions/methods of the repo at branch from the persistent
+    # symbol index; missing_docstring=1 lists only undocumented ones
+    username = request.args.get('username')
+    repo = request.args.get('repo')
+    branch = request.args.get('branch', 'main')
+    if not username or not repo:
+        return jsonify({'error': 'Missing params'}), 400
+    
+    headers = {}
+    if GITHUB_TOKEN:
+        headers['Authorization'] = f"token {GITHUB_TOKEN}"
+    
+    try:
+        commit_sha, found = symbol_index.query(username, repo, branch, headers, path=request.args.get('path'),
+                                               missing_docstring=request.args.get('missing_docstring') == '1')
+    except GitHubError as e:
+        return jsonify({'error': e.message}), 500
+    return jsonify({'commit_sha': commit_sha, 'symbols': found})
+
 @docuwriter_bp.route('/suggest_doc', methods=['POST'])
 def suggest_doc():
     data = request.get_json()
@@ -142,16 +154,14 @@ def suggest_doc():
         ]
     }
 
+    if wants_stream(data):
+        return sse_response(payload, url=ANTHROPIC_API_URL, headers=headers, bypass=cache_bypass(data),
+                            module="docuwriter")
+
     try:
-        response = requests.post(ANTHROPIC_API_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        resp_json = response.json()
+        resp_json = post_messages(payload, url=ANTHROPIC_API_URL, headers=headers, bypass=cache_bypass(data),
+                                  module="docuwriter")
         suggestion = resp_json["content"][0]["text"]
-        usage = resp_json.get("usage", {})
-        input_tokens = usage.get("input_tokens")
-        output_tokens = usage.get("output_tokens")
-        total_tokens = (input_tokens or 0) + (output_tokens or 0)
-        print(f"Input tokens: {input_tokens}, Output tokens: {output_tokens}, Total tokens: {total_tokens}")
         return jsonify({"suggestion": suggestion})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -159,6 +169,103 @@ def suggest_doc():
 @docuwriter_bp.route('/generate_readme', methods=['POST'])
 def generate_readme():
     data = request.get_json()
+    if not data.get('username') or not data.get('repo'):
+        return jsonify({'error': 'Missing username or repo'}), 400
+    if wants_async(data):
+        return submit_job_response('generate_readme', data)
+    if wants_stream(data) and not (data.get('write_to_repo') and data.get('readme_content')):
+        return stream_readme(data)
+    body, status = run_generate_readme(data)
+    return jsonify(body), status
+
+def readme_job(params, progress):
+    body, status = run_generate_readme(params)
+    if status != 200:
+        raise JobError(body.get('error', 'README generation failed'))
+    return body
+
+job_queue.register('generate_readme', readme_job, concurrency=int(os.getenv("JOBS_README_CONCURRENCY", 2)))
+
+def commit_files_from_body(files):
+    """
+    files as sent to /commit: a list of {path, content} or a {path: content} map,
+    content being text or null to delete. Returns: ({path: content}, error)
+    """
+    if isinstance(files, dict):
+        files = [{'path': path, 'content': content} for path, content in files.items()]
+    if not isinstance(files, list) or not files:
+        return None, 'files must be a non-empty list of {path, content}'
+    result = {}
+    for entry in files:
+        if not isinstance(entry, dict) or 'content' not in entry:
+            return None, 'each file must be an object with path and content'
+        path, content = entry.get('path'), entry['content']
+        if not isinstance(path, str) or not path:
+            return None, 'each file needs a non-empty string path'
+        if content is not None and not isinstance(content, str):
+            return None, f'content of {path} must be a string, or null to delete it'
+        if path in result:
+            return None, f'{path} is listed more than once'
+        result[path] = content
+    return result, None
+
+@docuwriter_bp.route('/commit', methods=['POST'])
+def commit_artifacts():
+    # Any number of generated files (README, docstring patches, tests) as one commit
+    data = request.get_json()
+    if not data or not data.get('username') or not data.get('repo'):
+        return jsonify({'error': 'Missing username or repo'}), 400
+    if not GITHUB_TOKEN:
+        return jsonify({'error': 'GitHub token required to write to repository'}), 400
+    files, error = commit_files_from_body(data.get('files'))
+    if error:
+        return jsonify({'error': error}), 400
+    if data.get('message') is not None and not isinstance(data['message'], str):
+        return jsonify({'error': 'message must be a string'}), 400
+    message = data.get('message') or f"Add {len(files)} generated file(s) using MetricPage"
+    try:
+        result = commit_files(data['username'], data['repo'], data.get('branch', 'main'), files, message,
+                              github_write_headers())
+    except GitHubError as e:
+        return jsonify({'error': e.message}), e.status_code if e.status_code in (404, 409, 422) else 500
+    return jsonify({'success': True, **result})
+
+@docuwriter_bp.route('/document_repo', methods=['POST'])
+def document_repo_route():
+    # Docstrings for every undocumented symbol, returned as a reviewable patch set
+    data = request.get_json()
+    if not data or not data.get('username') or not data.get('repo'):
+        return jsonify({'error': 'Missing username or repo'}), 400
+    if wants_async(data):
+        return submit_job_response('document_repo', data)
+    try:
+        return jsonify(run_document_repo(data))
+    except GitHubError as e:
+        return jsonify({'error': e.message}), 500
+
+def run_document_repo(data, progress=None):
+    return document_repo(data['username'], data['repo'], data.get('branch', 'main'), github_write_headers(),
+                         path_prefix=data.get('path'), bypass_cache=cache_bypass(data), progress=progress)
+
+def document_repo_job(params, progress):
+    try:
+        return run_document_repo(params, progress)
+    except GitHubError as e:
+        raise JobError(e.message)
+
+job_queue.register('document_repo', document_repo_job, concurrency=int(os.getenv("JOBS_DOCS_CONCURRENCY", 1)))
+
+def github_write_headers():
+    headers = {}
+    if GITHUB_TOKEN:
+        headers['Authorization'] = f"token {GITHUB_TOKEN}"
+    return headers
+
+def run_generate_readme(data):
+    """
+    Generate (and optionally write back) a README outside of any request.
+    Returns: (body, status) where body is the JSON response for the route.
+    """
     username = data.get('username')
     repo = data.get('repo')
     branch = data.get('branch', 'main')
@@ -166,16 +273,14 @@ def generate_readme():
     readme_content = data.get('readme_content')  # Pre-generated content for write-only operations
     
     if not username or not repo:
-        return jsonify({'error': 'Missing username or repo'}), 400
+        return {'error': 'Missing username or repo'}, 400
 
-    headers = {}
-    if GITHUB_TOKEN:
-        headers['Authorization'] = f"token {GITHUB_TOKEN}"
+    headers = github_write_headers()
 
     # If we're writing to repo and have pre-generated content, skip generation
     if write_to_repo and readme_content:
         if not GITHUB_TOKEN:
-            return jsonify({"error": "GitHub token required to write to repository"}), 400
+            return {"error": "GitHub token required to write to repository"}, 400
         
         write_result = write_readme_to_repo(username, repo, branch, readme_content, headers)
         
@@ -183,45 +288,100 @@ def generate_readme():
         local_save_result = save_local_readme(username, repo, readme_content)
         
         if write_result.get('success'):
-            return jsonify({
+            return {
                 "success": True, 
                 "readme": readme_content,
                 "written_to_repo": True,
                 "commit_sha": write_result.get('commit_sha'),
                 "local_saved": local_save_result.get('success', False),
                 "local_path": local_save_result.get('path')
-            })
+            }, 200
         else:
-            return jsonify({
+            return {
                 "success": True, 
                 "readme": readme_content,
                 "written_to_repo": False,
                 "write_error": write_result.get('error'),
                 "local_saved": local_save_result.get('success', False),
                 "local_path": local_save_result.get('path')
-            })
-
-    # Generate README content
-    def get_repo_files(path=""):
-        url = f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}"
-        params = {'ref': branch}
-        r = requests.get(url, headers=headers, params=params)
-        if r.status_code != 200:
-            return []
+            }, 200
+
+    try:
+        resp_json = post_messages(build_readme_payload(username, repo, branch, headers), url=ANTHROPIC_API_URL,
+                                  headers=readme_api_headers(), bypass=cache_bypass(data), module="docuwriter")
+        generated_readme = resp_json["content"][0]["text"]
         
-        files = []
-        for item in r.json():
-            if item['type'] == 'file':
-                # Prioritize main application files for better project understanding
-                if (item['name'] in ['app.py', 'main.py', 'requirements.txt', 'requirement.txt', 'README.md'] or
-                    item['name'].endswith('.py') or 
-                    item['name'].endswith('.html')):
-                    files.append(item['path'])
-            elif item['type'] == 'dir' and item['name'] not in {'venv', '.venv', '__pycache__', 'tests', 'migrations', '.git', 'node_modules'}:
-                files.extend(get_repo_files(item['path']))
-        return files
-
-    file_paths = get_repo_files()
+        # If write_to_repo is True, write the README to the repository
+        if write_to_repo:
+            if not GITHUB_TOKEN:
+                return {"error": "GitHub token required to write to repository"}, 400
+            
+            write_result = write_readme_to_repo(username, repo, branch, generated_readme, headers)
+            
+            # Also save a local copy in the workspace for VS Code visibility
+            local_save_result = save_local_readme(username, repo, generated_readme)
+            
+            if write_result.get('success'):
+                return {
+                    "success": True, 
+                    "readme": generated_readme,
+                    "written_to_repo": True,
+                    "commit_sha": write_result.get('commit_sha'),
+                    "local_saved": local_save_result.get('success', False),
+                    "local_path": local_save_result.get('path')
+                }, 200
+            else:
+                return {
+                    "success": True, 
+                    "readme": generated_readme,
+                    "written_to_repo": False,
+                    "write_error": write_result.get('error'),
+                    "local_saved": local_save_result.get('success', False),
+                    "local_path": local_save_result.get('path')
+                }, 200
+        
+        return {"success": True, "readme": generated_readme, "written_to_repo": False}, 200
+    except Exception as e:
+        return {"error": str(e)}, 400
+
+def readme_api_headers():
+    return {
+        "Content-Type": "application/json",
+        "x-api-key": ANTHROPIC_API_KEY,
+        "anthropic-version": VERSION
+    }
+
+def fetch_contents(username, repo, commit_sha, paths, headers):
+    """
+    Text of every path at commit_sha, fetched concurrently through the pooled
+    client; unreadable files map to None. Wall time is about the slowest fetch.
+    """
+    # Imported here: asyncio is a sizeable share of startup and only README generation needs it
+    import asyncio
+
+    async def fetch_all():
+        semaphore = asyncio.Semaphore(README_FETCH_CONCURRENCY)
+
+        async def fetch(path):
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(read_file, username, repo, commit_sha, path, headers)
+                except (GitHubError, UnicodeDecodeError):
+                    return None
+
+        return dict(zip(paths, await asyncio.gather(*(fetch(path) for path in paths))))
+
+    # With the git mirror every file comes from one batch read and the fetches below hit the cache
+    prefetch_files(username, repo, commit_sha, paths, headers)
+    return asyncio.run(fetch_all())
+
+def build_readme_payload(username, repo, branch, headers):
+    """Messages API request body for a project-level README of repo at branch"""
+    # Generate README content from the cached recursive tree
+    try:
+        commit_sha, file_paths = list_files(username, repo, branch, is_readme_source, headers)
+    except GitHubError:
+        commit_sha, file_paths = branch, []
     
     # Prioritize files for better project understanding
     priority_files = []
@@ -235,59 +395,39 @@ def generate_readme():
         else:
             secondary_files.append(path)
     
-    # Read contents of files (prioritize main application files)
-    code_snippets = []
-    total_chars = 0
-    max_chars = 12000  # Increased limit for better analysis
-    
-    # First, analyze priority files (main app structure)
-    for path in priority_files[:3]:  # Limit to first 3 priority files
-        if total_chars > max_chars:
-            break
-            
-        file_url = f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}"
-        params = {'ref': branch}
-        r = requests.get(file_url, headers=headers, params=params)
-        
-        if r.status_code == 200:
-            try:
-                content = base64.b64decode(r.json()['content']).decode('utf-8')
-                snippet = f"=== MAIN APPLICATION FILE: {path} ===\n{content}\n\n"
-                if total_chars + len(snippet) > max_chars:
-                    break
-                code_snippets.append(snippet)
-                total_chars += len(snippet)
-            except Exception:
-                continue
-    
-    # Then analyze module structure (brief overview of each module)
-    modules_analyzed = set()
+    # Up to 3 main application files, then module files; the packer decides
+    # how much of each fits. Python modules are outlined from the symbol index,
+    # so only main files and non-Python files are fetched (concurrently).
+    priority_files = priority_files[:3]
+    # Cap after spreading over modules, or the first modules by path take every slot
+    secondary_files = order_by_module(secondary_files)[:README_MAX_FILES]
+    # Only the selected modules are looked up; indexing the whole commit would
+    # fetch every Python file and undo README_MAX_FILES
+    try:
+        blob_shas = {entry['path']: entry['sha'] for entry in get_tree(username, repo, commit_sha, headers)
+                     if entry['type'] == 'blob'}
+    except GitHubError:
+        blob_shas = {}
+    indexed = symbol_index.symbols_for_blobs(
+        username, repo, commit_sha,
+        {path: blob_shas[path] for path in secondary_files if path.endswith('.py') and path in blob_shas}, headers)
+    contents = fetch_contents(username, repo, commit_sha,
+                              priority_files + [path for path in secondary_files if path not in indexed], headers)
+
+    outlines = []
     for path in secondary_files:
-        if total_chars > max_chars:
-            break
-        
-        # Extract module name
-        module_name = path.split('/')[0] if '/' in path else 'root'
-        if module_name in modules_analyzed:
-            continue
-        modules_analyzed.add(module_name)
-        
-        file_url = f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}"
-        params = {'ref': branch}
-        r = requests.get(file_url, headers=headers, params=params)
-        
-        if r.status_code == 200:
-            try:
-                content = base64.b64decode(r.json()['content']).decode('utf-8')
-                # Take only first 500 characters of module files for overview
-                content_preview = content[:500] + "..." if len(content) > 500 else content
-                snippet = f"=== MODULE: {module_name} ({path}) ===\n{content_preview}\n\n"
-                if total_chars + len(snippet) > max_chars:
-                    break
-                code_snippets.append(snippet)
-                total_chars += len(snippet)
-            except Exception:
-                continue
+        if path in indexed:
+            outlines.append((path, outline_symbols(indexed[path])))
+        elif contents.get(path) is not None:
+            outlines.append((path, outline_file(path, contents[path])))
+
+    # Main files go in full when they fit, everything else as outlines,
+    # until the token budget is spent
+    code_snippets, _ = pack_context(
+        [(path, contents[path]) for path in priority_files if contents.get(path) is not None],
+        outlines,
+        README_CONTEXT_TOKENS,
+    )
 
     # Enhanced prompt for better project-level README generation
     prompt = (
@@ -314,13 +454,7 @@ def generate_readme():
         + "\n".join(code_snippets)
     )
 
-    headers_api = {
-        "Content-Type": "application/json",
-        "x-api-key": ANTHROPIC_API_KEY,
-        "anthropic-version": VERSION
-    }
-
-    payload = {
+    return {
         "model": MODEL,
         "max_tokens": 1024,
         "system": prompt,
@@ -329,82 +463,44 @@ def generate_readme():
         ]
     }
 
-    try:
-        response = requests.post(ANTHROPIC_API_URL, json=payload, headers=headers_api)
-        response.raise_for_status()
-        resp_json = response.json()
-        generated_readme = resp_json["content"][0]["text"]
-        
-        # If write_to_repo is True, write the README to the repository
-        if write_to_repo:
-            if not GITHUB_TOKEN:
-                return jsonify({"error": "GitHub token required to write to repository"}), 400
-            
-            write_result = write_readme_to_repo(username, repo, branch, generated_readme, headers)
-            
-            # Also save a local copy in the workspace for VS Code visibility
-            local_save_result = save_local_readme(username, repo, generated_readme)
-            
-            if write_result.get('success'):
-                return jsonify({
-                    "success": True, 
-                    "readme": generated_readme,
-                    "written_to_repo": True,
-                    "commit_sha": write_result.get('commit_sha'),
-                    "local_saved": local_save_result.get('success', False),
-                    "local_path": local_save_result.get('path')
-                })
-            else:
-                return jsonify({
-                    "success": True, 
-                    "readme": generated_readme,
-                    "written_to_repo": False,
-                    "write_error": write_result.get('error'),
-                    "local_saved": local_save_result.get('success', False),
-                    "local_path": local_save_result.get('path')
-                })
-        
-        return jsonify({"success": True, "readme": generated_readme, "written_to_repo": False})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
+def stream_readme(data):
+    username = data.get('username')
+    repo = data.get('repo')
+    branch = data.get('branch', 'main')
+    write_to_repo = data.get('write_to_repo', False)
+    headers = github_write_headers()
+
+    def finish(generated_readme, usage):
+        # Writing back needs the complete text, so it runs after the last delta
+        if not write_to_repo:
+            return {"success": True, "written_to_repo": False}
+        if not GITHUB_TOKEN:
+            return {"written_to_repo": False, "write_error": "GitHub token required to write to repository"}
+        write_result = write_readme_to_repo(username, repo, branch, generated_readme, headers)
+        local_save_result = save_local_readme(username, repo, generated_readme)
+        return {
+            "success": True,
+            "written_to_repo": bool(write_result.get('success')),
+            "commit_sha": write_result.get('commit_sha'),
+            "write_error": write_result.get('error'),
+            "local_saved": local_save_result.get('success', False),
+            "local_path": local_save_result.get('path')
+        }
+    return sse_response(build_readme_payload(username, repo, branch, headers), on_complete=finish,
+                        url=ANTHROPIC_API_URL, headers=readme_api_headers(), bypass=cache_bypass(data),
+                        module="docuwriter")
 
 # Helper functions for documentation processing
 def write_readme_to_repo(username, repo, branch, readme_content, headers):
     """
     Write README content to a GitHub repository
     """
-    # First, check if README.md already exists
-    readme_url = f"{GITHUB_API}/repos/{username}/{repo}/contents/README.md"
-    params = {'ref': branch}
-    
-    existing_readme = requests.get(readme_url, headers=headers, params=params)
-    
-    # Prepare the content for GitHub API (must be base64 encoded)
-    encoded_content = base64.b64encode(readme_content.encode('utf-8')).decode('utf-8')
-    
-    # Prepare the commit data
-    commit_data = {
-        "message": "Auto-generated README.md using Docuwriter",
-        "content": encoded_content,
-        "branch": branch
-    }
-    
-    # If README already exists, we need to include the SHA for updating
-    if existing_readme.status_code == 200:
-        commit_data["sha"] = existing_readme.json()["sha"]
-        commit_message = "Updated README.md using Docuwriter"
-    else:
-        commit_message = "Created README.md using Docuwriter"
-    
-    commit_data["message"] = commit_message
-    
-    # Make the API call to create/update the file
     try:
-        response = requests.put(readme_url, json=commit_data, headers=headers)
-        if response.status_code in [200, 201]:
-            return {"success": True, "commit_sha": response.json().get("commit", {}).get("sha")}
-        else:
-            return {"success": False, "error": f"GitHub API error: {response.status_code} - {response.text}"}
+        result = commit_files(username, repo, branch, {"README.md": readme_content},
+                              "Updated README.md using Docuwriter", headers)
+        return {"success": True, "commit_sha": result["commit_sha"]}
+    except GitHubError as e:
+        return {"success": False, "error": f"GitHub API error: {e.message}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -432,26 +528,18 @@ def save_local_readme(username, repo, readme_content):
 def insert_docstrings(original_code, suggestions):
     """
     original_code: str, the code of the file
-    suggestions: dict, mapping function/class names to docstring/comment
+    suggestions: dict, mapping function/class names (or qualified names) to docstring/comment
     Returns: str, code with inserted docstrings/comments
     """
     try:
-        tree = ast.parse(original_code)
+        symbols = symbol_index.symbols_for_source(original_code)
     except SyntaxError:
         return original_code
     
-    lines = original_code.split('\n')
-    offset = 0  # Track line insertions
-
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
-            name = node.name
-            if name in suggestions:
-                insert_line = node.lineno - 1 + offset  # Zero-indexed
-                if insert_line < len(lines):
-                    # Insert docstring after function/class definition line
-                    docstring = f'    """{suggestions[name]}"""'
-                    lines.insert(insert_line + 1, docstring)
-                    offset += 1
-
-    return '\n'.join(lines)
\ No newline at end of file
+    edits = []
+    for symbol in symbols:
+        suggestion = suggestions.get(symbol['qualname'], suggestions.get(symbol['name']))
+        if suggestion is not None:
+            edits.append((symbol, suggestion))
+    new_code, _, _ = apply_docstrings(original_code, edits)
+    return new_code
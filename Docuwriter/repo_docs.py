@@ -0,0 +1,227 @@
+"""
+Whole-repository documentation for /writer/document_repo.
+
+Undocumented symbols come from the shared symbol index, one docstring per
+symbol is generated on a bounded executor (so the total stays within the
+Anthropic rate limit), and the docstrings are applied per file in a single
+pass. The result is a patch set: one unified diff per changed file plus the
+combined patch, for review before anything is written.
+"""
+import difflib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from Shared.config import config
+from Shared.blob_cache import read_file, prefetch_files
+from Shared.github_tree import EXCLUDED_DIRS, GitHubError
+from Shared.llm_cache import post_messages
+from Shared.symbol_index import symbol_index, is_test_file
+from Shared.tracing import propagate
+
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+ANTHROPIC_API_URL = config.ANTHROPIC_API_URL
+MODEL = config.MODEL
+VERSION = config.VERSION
+
+# Docstring calls in flight at once, shared by every request
+DOCGEN_MAX_IN_FLIGHT = int(os.getenv("DOCGEN_MAX_IN_FLIGHT", 4))
+# Upper bound on symbols documented per request
+DOCGEN_MAX_SYMBOLS = int(os.getenv("DOCGEN_MAX_SYMBOLS", 200))
+doc_executor = ThreadPoolExecutor(max_workers=DOCGEN_MAX_IN_FLIGHT, thread_name_prefix="docgen")
+
+DOCSTRING_SYSTEM = (
+    "You are an expert code documentation assistant. Write the docstring for the Python "
+    "function, method or class you are given. Describe what it does, its parameters and its "
+    "return value in the style of a concise PEP 257 docstring. Reply with the docstring text "
+    "only: no quotes, no code fences, no code."
+)
+
+
+def _indent_of(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def format_docstring(text, indent):
+    """Docstring lines for text at indent; one line when it fits on one"""
+    text = text.strip()
+    body = text.rstrip('"')
+    # Quotes right before the closing quotes would end the string early, so they are escaped too
+    text = body.replace('\\', '\\\\').replace('"""', '\\"\\"\\"') + '\\"' * (len(text) - len(body))
+    lines = text.splitlines()
+    if len(lines) == 1:
+        return [f'{indent}"""{lines[0]}"""']
+    return [f'{indent}"""{lines[0]}'] + [f'{indent}{line}'.rstrip() for line in lines[1:]] + [f'{indent}"""']
+
+
+def apply_docstrings(source, edits):
+    """
+    Insert docstrings in one pass over source.
+    edits: list of (symbol, text) with symbols from the symbol index
+    Returns: (new_source, applied, skipped) where skipped lists (qualname, reason).
+    When the patched source does not compile, source comes back unchanged.
+    Each docstring goes above the symbol's first body line, indented like
+    that line, so nested classes and methods land at the right depth.
+    """
+    lines = source.split('\n')
+    inserts = {}
+    applied, skipped = [], []
+    for symbol, text in edits:
+        body_index = symbol['body_lineno'] - 1
+        if symbol['has_docstring']:
+            skipped.append((symbol['qualname'], 'already documented'))
+            continue
+        if not text or not text.strip():
+            skipped.append((symbol['qualname'], 'empty docstring'))
+            continue
+        if body_index >= len(lines):
+            skipped.append((symbol['qualname'], 'body out of range'))
+            continue
+        indent = _indent_of(lines[body_index])
+        if len(indent) <= symbol['col_offset']:
+            # "def f(): return x" keeps its body on the header line
+            skipped.append((symbol['qualname'], 'body on the header line'))
+            continue
+        if body_index in inserts:
+            skipped.append((symbol['qualname'], 'duplicate edit'))
+            continue
+        inserts[body_index] = format_docstring(text, indent)
+        applied.append(symbol['qualname'])
+
+    out = []
+    for index, line in enumerate(lines):
+        if index in inserts:
+            out.extend(inserts[index])
+        out.append(line)
+    new_source = '\n'.join(out)
+    try:
+        compile(new_source, '<patched>', 'exec', dont_inherit=True)
+    except (SyntaxError, ValueError) as e:
+        # Never hand back a file the edits broke; report every edit instead
+        reason = f'patched file does not compile: {e}'
+        return source, [], skipped + [(qualname, reason) for qualname in applied]
+    return new_source, applied, skipped
+
+
+def clean_docstring(text):
+    """Strip code fences and quotes the model may wrap around the docstring"""
+    text = re.sub(r"^```\w*|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    for quote in ('"""', "'''"):
+        if text.startswith(quote) and text.endswith(quote) and len(text) >= 6:
+            text = text[3:-3].strip()
+    return text
+
+
+def generate_docstring(symbol, code, bypass_cache=False):
+    """Docstring text for one symbol; returns (text, error)"""
+    lines = code.split('\n')
+    symbol_code = '\n'.join(lines[symbol['lineno'] - 1:symbol['end_lineno']])
+    payload = {
+        "model": MODEL,
+        "max_tokens": 400,
+        "system": DOCSTRING_SYSTEM,
+        "messages": [{"role": "user", "content": f"{symbol['kind']} {symbol['qualname']}:\n\n{symbol_code}"}],
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "x-api-key": ANTHROPIC_API_KEY,
+        "anthropic-version": VERSION,
+    }
+    try:
+        body = post_messages(payload, url=ANTHROPIC_API_URL, headers=headers, bypass=bypass_cache,
+                             key_material=[symbol['kind'], symbol['qualname'], symbol['body_hash']],
+                             module="docuwriter", timeout=30)
+        return clean_docstring(body["content"][0]["text"]), None
+    except requests.exceptions.HTTPError as e:
+        return None, f"Claude API error: {e.response.status_code}"
+    except (requests.exceptions.RequestException, KeyError, IndexError) as e:
+        return None, f"Claude API error: {e}"
+
+
+def documentable(path):
+    """False for test files: the index keeps them for test coverage, but they get no docstrings"""
+    return not is_test_file(path) and not EXCLUDED_DIRS.intersection(path.split('/')[:-1])
+
+
+def unified_diff(path, before, after):
+    return ''.join(difflib.unified_diff(before.splitlines(keepends=True), after.splitlines(keepends=True),
+                                        fromfile=f"a/{path}", tofile=f"b/{path}"))
+
+
+def document_repo(username, repo, branch, headers, path_prefix=None, bypass_cache=False, progress=None):
+    """
+    Generate docstrings for every undocumented symbol (up to DOCGEN_MAX_SYMBOLS)
+    and return them as a patch set:
+    {'commit_sha', 'files': [{'path', 'documented', 'skipped', 'diff', 'content'}], 'patch', 'errors', 'summary'}
+    Raises GitHubError when the repository cannot be read.
+    """
+    commit_sha, found = symbol_index.query(username, repo, branch, headers, path=path_prefix,
+                                           missing_docstring=True)
+    found = [symbol for symbol in found if '<locals>' not in symbol['qualname'] and documentable(symbol['path'])]
+    truncated = len(found) > DOCGEN_MAX_SYMBOLS
+    found = found[:DOCGEN_MAX_SYMBOLS]
+
+    by_path = {}
+    for symbol in found:
+        by_path.setdefault(symbol['path'], []).append(symbol)
+    sources = {}
+    prefetch_files(username, repo, commit_sha, list(by_path), headers)
+    for path in by_path:
+        try:
+            sources[path] = read_file(username, repo, commit_sha, path, headers)
+        except (GitHubError, UnicodeDecodeError):
+            continue
+
+    total = sum(len(by_path[path]) for path in sources)
+    done = 0
+    if progress:
+        progress({'done': 0, 'total': total})
+    texts = {}
+    errors = []
+    futures = {doc_executor.submit(propagate(generate_docstring), symbol, sources[path], bypass_cache): (path, symbol)
+               for path in sources for symbol in by_path[path]}
+    try:
+        for future in as_completed(futures):
+            path, symbol = futures[future]
+            text, error = future.result()
+            if error:
+                errors.append({'path': path, 'symbol': symbol['qualname'], 'error': error})
+            else:
+                texts[(path, symbol['qualname'])] = text
+            done += 1
+            if progress:
+                progress({'done': done, 'total': total, 'last_symbol': f"{path}:{symbol['qualname']}"})
+    finally:
+        for future in futures:
+            future.cancel()
+
+    files = []
+    for path, source in sources.items():
+        edits = [(symbol, texts[(path, symbol['qualname'])]) for symbol in by_path[path]
+                 if (path, symbol['qualname']) in texts]
+        new_source, applied, skipped = apply_docstrings(source, edits)
+        if not applied:
+            continue
+        files.append({
+            'path': path,
+            'documented': applied,
+            'skipped': [{'symbol': name, 'reason': reason} for name, reason in skipped],
+            'diff': unified_diff(path, source, new_source),
+            # Full new text, ready for /writer/commit
+            'content': new_source,
+        })
+
+    return {
+        'commit_sha': commit_sha,
+        'files': files,
+        'patch': ''.join(f['diff'] for f in files),
+        'errors': errors,
+        'summary': {
+            'symbols_found': len(found),
+            'symbols_documented': sum(len(f['documented']) for f in files),
+            'files_changed': len(files),
+            'truncated': truncated,
+        },
+    }
@@ -0,0 +1,62 @@
+import pytest
+from flask import Flask
+
+from Docuwriter import docuwriter
+
+
+@pytest.fixture
+def client(monkeypatch):
+    committed = []
+
+    def commit_files(username, repo, branch, files, message, headers):
+        committed.append((files, message))
+        return {"commit_sha": "abc", "changed": list(files), "unchanged": [], "attempts": 1}
+
+    monkeypatch.setattr(docuwriter, "commit_files", commit_files)
+    monkeypatch.setattr(docuwriter, "GITHUB_TOKEN", "test-token")
+    app = Flask(__name__)
+    app.register_blueprint(docuwriter.docuwriter_bp, url_prefix="/writer")
+    return app.test_client(), committed
+
+
+def post(client, files, **body):
+    return client.post("/writer/commit", json={"username": "o", "repo": "r", "files": files, **body})
+
+
+def test_a_list_of_files_is_committed(client):
+    test_client, committed = client
+
+    response = post(test_client, [{"path": "README.md", "content": "hi"}, {"path": "old.py", "content": None}])
+
+    assert response.status_code == 200
+    assert committed == [({"README.md": "hi", "old.py": None}, "Add 2 generated file(s) using MetricPage")]
+
+
+def test_a_path_map_is_accepted_too(client):
+    test_client, committed = client
+
+    assert post(test_client, {"README.md": "hi"}, message="Docs").status_code == 200
+    assert committed == [({"README.md": "hi"}, "Docs")]
+
+
+@pytest.mark.parametrize("files, message", [
+    (None, None),
+    ([], None),
+    ("README.md", None),
+    (["README.md"], None),
+    ([{"path": "README.md"}], None),
+    ([{"path": "", "content": "x"}], None),
+    ([{"path": 3, "content": "x"}], None),
+    ([{"path": "a.md", "content": {"text": "x"}}], None),
+    ({"a.md": 5}, None),
+    ([{"path": "a.md", "content": "x"}, {"path": "a.md", "content": "y"}], None),
+    ([{"path": "a.md", "content": "x"}], ["not", "text"]),
+])
+def test_malformed_files_are_rejected(client, files, message):
+    test_client, committed = client
+
+    response = post(test_client, files, message=message)
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert committed == []
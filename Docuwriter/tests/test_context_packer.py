@@ -0,0 +1,141 @@
+import pytest
+
+from Docuwriter import docuwriter
+from Docuwriter.context_packer import (estimate_tokens, order_by_module, outline_file, outline_python,
+                                       outline_symbols, pack_context, truncate_to_tokens)
+
+SOURCE = '''"""Routes for the demo app.
+
+More detail that the outline drops.
+"""
+import os
+
+MAX_ITEMS = 10
+bp = Blueprint("demo", __name__)
+helper = make()
+
+
+@bp.route("/items")
+def items(limit: int = MAX_ITEMS) -> list:
+    """List items.
+
+    Long description.
+    """
+    return []
+
+
+class Store(Base):
+    """Keeps items"""
+
+    async def load(self, key):
+        return key
+'''
+
+
+def test_outline_keeps_the_api_and_drops_bodies():
+    assert outline_python(SOURCE).splitlines() == [
+        '"""Routes for the demo app."""',
+        "MAX_ITEMS = 10",
+        "bp = Blueprint('demo', __name__)",
+        "@bp.route('/items')",
+        "def items(limit: int=MAX_ITEMS) -> list",
+        '    """List items."""',
+        "class Store(Base)",
+        '    """Keeps items"""',
+        "    async def load(self, key)",
+    ]
+
+
+def test_outline_file_previews_what_it_cannot_parse():
+    assert outline_file("broken.py", "def f(:\n") == "def f(:"
+    preview = outline_file("README.md", "word " * 1000)
+    assert preview.endswith("...") or estimate_tokens(preview) <= 150
+
+
+def test_truncate_keeps_whole_lines_within_the_budget():
+    assert truncate_to_tokens("a b\nc d\ne f", 7) == "a b\nc d\n..."
+
+
+def test_outline_symbols_skips_locals_and_indents_methods():
+    symbols = [{"qualname": "Store", "decorators": [], "signature": "class Store(Base)", "doc": "Keeps items"},
+               {"qualname": "Store.load", "decorators": ["cached"], "signature": "def load(self, key)", "doc": None},
+               {"qualname": "f.<locals>.g", "decorators": [], "signature": "def g()", "doc": None}]
+
+    assert outline_symbols(symbols).splitlines() == [
+        "class Store(Base)", '    """Keeps items"""', "    @cached", "    def load(self, key)"]
+
+
+def test_order_by_module_round_robins_so_a_cap_keeps_every_module():
+    paths = [f"alpha/{n}.py" for n in range(3)] + ["beta/0.py", "README.md", "gamma/0.py", "gamma/1.py"]
+
+    assert order_by_module(paths) == ["alpha/0.py", "beta/0.py", "README.md", "gamma/0.py",
+                                      "alpha/1.py", "gamma/1.py", "alpha/2.py"]
+    assert order_by_module([]) == []
+
+
+def test_pack_context_puts_main_files_first_then_module_leads():
+    snippets, used = pack_context([("app.py", "print(1)")],
+                                  [("a/x.py", "def x()"), ("a/y.py", "def y()"), ("b/z.py", "def z()")], 1000)
+
+    assert [s.split("\n")[0] for s in snippets] == [
+        "=== MAIN APPLICATION FILE: app.py ===", "=== MODULE: a (a/x.py) ===",
+        "=== MODULE: b (b/z.py) ===", "=== MODULE: a (a/y.py) ==="]
+    assert used == sum(estimate_tokens(s) for s in snippets)
+
+
+def test_pack_context_outlines_main_files_that_do_not_fit_and_skips_the_rest():
+    big = SOURCE + "value = 1\n" * 500
+    snippets, used = pack_context([("app.py", big)], [("a/x.py", "word " * 500), ("b/y.py", "def y()")], 150)
+
+    assert snippets[0].startswith("=== MAIN APPLICATION FILE (outline): app.py ===")
+    assert snippets[-1].startswith("=== MODULE: b (b/y.py) ===")
+    assert used <= 150
+
+
+class FakeIndex:
+    """Symbol index that records the files it is asked about"""
+
+    def __init__(self):
+        self.requested = []
+
+    def symbols_for_blobs(self, username, repo, commit_sha, blob_shas, headers=None):
+        self.requested.extend(blob_shas)
+        return {path: [{"qualname": "f", "decorators": [], "signature": "def f()", "doc": None}]
+                for path in blob_shas}
+
+
+@pytest.fixture
+def readme_sources(monkeypatch):
+    index = FakeIndex()
+    monkeypatch.setattr(docuwriter, "symbol_index", index)
+
+    def install(paths):
+        monkeypatch.setattr(docuwriter, "get_tree", lambda *args: [
+            {"path": path, "type": "blob", "sha": f"sha-{path}"} for path in paths])
+        monkeypatch.setattr(docuwriter, "list_files", lambda *args: ("sha", paths))
+        monkeypatch.setattr(docuwriter, "fetch_contents",
+                            lambda username, repo, sha, wanted, headers: {path: f"# {path}" for path in wanted})
+        return index
+    return install
+
+
+def test_readme_candidates_cover_modules_past_the_file_cap(readme_sources, monkeypatch):
+    monkeypatch.setattr(docuwriter, "README_MAX_FILES", 4)
+    monkeypatch.setattr(docuwriter, "README_CONTEXT_TOKENS", 10000)
+    readme_sources(["app.py"] + [f"alpha/m{n}.txt" for n in range(10)] + ["zeta/m0.txt"])
+
+    prompt = docuwriter.build_readme_payload("o", "r", "main", {})["system"]
+
+    assert "=== MAIN APPLICATION FILE: app.py ===" in prompt
+    assert "=== MODULE: zeta (zeta/m0.txt) ===" in prompt
+    assert prompt.count("=== MODULE: alpha") == 3
+
+
+def test_readme_looks_up_symbols_for_the_selected_modules_only(readme_sources, monkeypatch):
+    monkeypatch.setattr(docuwriter, "README_MAX_FILES", 2)
+    index = readme_sources(["app.py", "alpha/a.py", "alpha/b.py", "beta/c.py", "beta/notes.txt"])
+
+    prompt = docuwriter.build_readme_payload("o", "r", "main", {})["system"]
+
+    assert index.requested == ["alpha/a.py", "beta/c.py"]
+    assert "=== MODULE: alpha (alpha/a.py) ===\ndef f()" in prompt
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from Docuwriter import docuwriter
+from Docuwriter.docuwriter import fetch_contents
+from Shared.github_tree import GitHubError
+
+
+@pytest.fixture
+def files(monkeypatch):
+    """Fake read_file over a dict of path -> text, each read taking 0.2s"""
+    contents = {}
+    active = [0, 0]  # in flight, most in flight at once
+    lock = threading.Lock()
+
+    def read_file(username, repo, commit_sha, path, headers):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        if path not in contents:
+            raise GitHubError(404, "Not Found")
+        if contents[path] is None:
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+        return contents[path]
+
+    monkeypatch.setattr(docuwriter, "read_file", read_file)
+    monkeypatch.setattr(docuwriter, "prefetch_files", lambda *args: None)
+    return contents, active
+
+
+def test_fetches_run_concurrently_up_to_the_limit(files, monkeypatch):
+    contents, active = files
+    monkeypatch.setattr(docuwriter, "README_FETCH_CONCURRENCY", 4)
+    paths = [f"pkg/m{n}.py" for n in range(8)]
+    contents.update({path: path for path in paths})
+
+    started = time.monotonic()
+    fetched = fetch_contents("o", "r", "sha", paths, {})
+
+    assert fetched == {path: path for path in paths}
+    assert active[1] == 4
+    # Two rounds of four, not eight reads in a row
+    assert time.monotonic() - started < 1.0
+
+
+def test_unreadable_files_map_to_none_in_input_order(files):
+    contents, _ = files
+    contents.update({"a.py": "a", "binary.dat": None})
+
+    fetched = fetch_contents("o", "r", "sha", ["missing.py", "a.py", "binary.dat"], {})
+
+    assert list(fetched.items()) == [("missing.py", None), ("a.py", "a"), ("binary.dat", None)]
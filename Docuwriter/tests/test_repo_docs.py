@@ -0,0 +1,128 @@
+import ast
+
+import pytest
+
+from Docuwriter import repo_docs
+from Docuwriter.repo_docs import apply_docstrings, clean_docstring, document_repo, format_docstring
+from Shared import symbol_index as symbol_index_module
+from Shared.symbol_index import SymbolIndex, extract_symbols
+
+
+def document(source, docs):
+    """Apply docs (qualname -> text) to source; returns the result and the docstrings it ends up with"""
+    edits = [(symbol, docs[symbol['qualname']]) for symbol in extract_symbols(source) if symbol['qualname'] in docs]
+    new_source, applied, skipped = apply_docstrings(source, edits)
+    found = {symbol['qualname']: symbol for symbol in extract_symbols(new_source)}
+    tree = {node.name: node for node in ast.walk(ast.parse(new_source)) if hasattr(node, 'name')}
+    strings = {qualname: ast.get_docstring(tree[symbol['name']], clean=False)
+               for qualname, symbol in found.items()}
+    return new_source, applied, skipped, strings
+
+
+@pytest.mark.parametrize("text", [
+    'Return "x"',
+    'Return ""',
+    '"Quoted" at both ends"',
+    'Contains """ triple quotes',
+    'Ends in triple quotes"""',
+    'Path C:\\temp\\ and \\n stay literal',
+    'Ends with a backslash\\',
+    'Quote after backslash \\"',
+])
+def test_awkward_text_round_trips(text):
+    _, applied, _, strings = document("def f():\n    return 1\n", {"f": text})
+
+    assert applied == ["f"]
+    assert strings["f"] == text
+
+
+def test_multi_line_docstrings_are_indented_like_the_body():
+    assert format_docstring("Summary.\n\nArgs:\n    x: a value\n", "    ") == [
+        '    """Summary.', '', '    Args:', '        x: a value', '    """']
+
+
+def test_nested_classes_and_methods_get_their_own_depth():
+    source = "class Outer:\n    class Inner:\n        def method(self):\n            pass\n"
+
+    new_source, applied, _, strings = document(source, {"Outer": "O", "Outer.Inner": "I", "Outer.Inner.method": "M"})
+
+    assert applied == ["Outer", "Outer.Inner", "Outer.Inner.method"]
+    assert strings == {"Outer": "O", "Outer.Inner": "I", "Outer.Inner.method": "M"}
+    assert '            """M"""' in new_source.splitlines()
+
+
+def test_decorated_symbols_and_decorated_first_statements():
+    source = ("@app.route('/x')\n@login_required\ndef view():\n"
+              "    @cache\n    def helper():\n        pass\n    return helper\n")
+
+    new_source, applied, _, strings = document(source, {"view": "Serve x"})
+
+    assert strings["view"] == "Serve x"
+    assert new_source.splitlines()[3] == '    """Serve x"""'
+
+
+def test_multi_line_signatures():
+    source = "def f(\n    a,\n    b=(1,\n       2),\n) -> int:\n    return a\n"
+
+    new_source, _, _, strings = document(source, {"f": "Add"})
+
+    assert strings["f"] == "Add"
+    assert new_source.splitlines()[5] == '    """Add"""'
+
+
+def test_one_line_bodies_are_skipped():
+    source = "def f(): return 1\nclass C: pass\n"
+
+    new_source, applied, skipped, _ = document(source, {"f": "F", "C": "C"})
+
+    assert new_source == source
+    assert applied == []
+    assert [reason for _, reason in skipped] == ["body on the header line"] * 2
+
+
+def test_documented_and_empty_edits_are_skipped():
+    source = 'def f():\n    """Already"""\n\ndef g():\n    pass\n'
+
+    _, applied, skipped, _ = document(source, {"f": "New", "g": "  "})
+
+    assert applied == []
+    assert skipped == [("f", "already documented"), ("g", "empty docstring")]
+
+
+def test_a_patch_that_does_not_compile_leaves_the_source_alone(monkeypatch):
+    from Docuwriter import repo_docs
+    monkeypatch.setattr(repo_docs, "format_docstring", lambda text, indent: [f'{indent}"""{text}'])
+    source = "def f():\n    return 1\n"
+
+    new_source, applied, skipped = apply_docstrings(source, [(extract_symbols(source)[0], "broken")])
+
+    assert new_source == source
+    assert applied == []
+    assert skipped[0][1].startswith("patched file does not compile")
+
+
+def test_clean_docstring_strips_fences_and_quotes():
+    assert clean_docstring('```python\n"""Do the thing."""\n```') == "Do the thing."
+    assert clean_docstring("'''Short'''") == "Short"
+
+
+def test_test_files_in_the_indexed_tree_get_no_docstrings(tmp_path, monkeypatch):
+    files = {"pkg/a.py": "def top(a):\n    return a\n",
+             "tests/test_x.py": "from pkg.a import top\n\n\ndef test_top():\n    assert top(1) == 1\n",
+             "tests/helpers.py": "def make():\n    return 1\n",
+             "pkg/conftest.py": "def fixture():\n    return 1\n"}
+    monkeypatch.setattr(symbol_index_module, "resolve_commit_sha", lambda *args: "c" * 40)
+    monkeypatch.setattr(symbol_index_module, "get_tree",
+                        lambda *args: [{"path": path, "type": "blob", "sha": path} for path in files])
+    monkeypatch.setattr(symbol_index_module, "get_blob", lambda username, repo, sha, headers=None: files[sha].encode())
+    monkeypatch.setattr(symbol_index_module, "prefetch_blobs", lambda *args: None)
+    monkeypatch.setattr(repo_docs, "symbol_index", SymbolIndex(str(tmp_path / "symbols.sqlite3")))
+    monkeypatch.setattr(repo_docs, "prefetch_files", lambda *args: None)
+    monkeypatch.setattr(repo_docs, "read_file", lambda username, repo, sha, path, headers=None: files[path])
+    monkeypatch.setattr(repo_docs, "post_messages",
+                        lambda payload, **kwargs: {"content": [{"type": "text", "text": "Documented."}]})
+
+    result = document_repo("o", "r", "main", {})
+
+    assert [f["path"] for f in result["files"]] == ["pkg/a.py"]
+    assert result["summary"]["symbols_found"] == 1
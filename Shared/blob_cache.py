@@ -0,0 +1,213 @@
+"""
+Content-addressed cache for file contents.
+
+Git blob SHAs never change meaning, so file bytes are cached by blob SHA in
+a size-bounded in-memory LRU tier. Entries evicted from memory spill to a
+size-bounded on-disk tier and are promoted back on their next hit.
+With GIT_MIRROR on, misses are read from the local mirror instead of the
+REST API, and prefetch_blobs() loads many of them in one batch.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from Shared.config import config
+from Shared.http_client import github_client, github_headers, GITHUB_API
+from Shared.github_tree import resolve_commit_sha, get_tree, find_entry, raise_for_github, GitHubError
+from Shared.tracing import span
+
+BLOB_CACHE_MEMORY_BYTES = int(os.getenv("BLOB_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+BLOB_CACHE_DISK_BYTES = int(os.getenv("BLOB_CACHE_DISK_BYTES", 256 * 1024 * 1024))
+BLOB_CACHE_DIR = os.getenv(
+    "BLOB_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "blobs"),
+)
+
+
+class BlobCache:
+    """
+    Two-tier LRU keyed by blob SHA.
+
+    memory_bytes: int, cap on bytes held in memory
+    disk_bytes: int, cap on bytes spilled to disk (0 disables the disk tier)
+    directory: str, where spilled blobs are stored
+    """
+
+    def __init__(self, memory_bytes, disk_bytes, directory):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                          "memory_evictions": 0, "disk_evictions": 0}
+        if self.disk_bytes:
+            self._load_disk_index()
+
+    def _path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha[2:])
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU order from file mtimes left by a previous run"""
+        found = []
+        if os.path.isdir(self.directory):
+            for fan in os.scandir(self.directory):
+                if not fan.is_dir():
+                    continue
+                for blob in os.scandir(fan.path):
+                    st = blob.stat()
+                    found.append((st.st_mtime, fan.name + blob.name, st.st_size))
+        for _, sha, size in sorted(found):
+            self._disk[sha] = size
+            self._disk_used += size
+        self._trim_disk()
+
+    def _trim_disk(self):
+        while self._disk_used > self.disk_bytes and self._disk:
+            sha, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self._counters["disk_evictions"] += 1
+            try:
+                os.remove(self._path(sha))
+            except OSError:
+                pass
+
+    def _spill(self, sha, data):
+        if not self.disk_bytes or len(data) > self.disk_bytes or sha in self._disk:
+            return
+        path = self._path(sha)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self._disk[sha] = len(data)
+        self._disk_used += len(data)
+        self._trim_disk()
+
+    def _put_memory(self, sha, data):
+        if sha in self._memory:
+            self._memory.move_to_end(sha)
+            return
+        if len(data) > self.memory_bytes:
+            self._spill(sha, data)
+            return
+        self._memory[sha] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            old_sha, old_data = self._memory.popitem(last=False)
+            self._memory_used -= len(old_data)
+            self._counters["memory_evictions"] += 1
+            self._spill(old_sha, old_data)
+
+    def get(self, sha):
+        with self._lock:
+            if sha in self._memory:
+                self._memory.move_to_end(sha)
+                self._counters["memory_hits"] += 1
+                return self._memory[sha]
+            if sha in self._disk:
+                try:
+                    with open(self._path(sha), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    self._disk_used -= self._disk.pop(sha)
+                else:
+                    self._counters["disk_hits"] += 1
+                    self._disk.move_to_end(sha)
+                    os.utime(self._path(sha))
+                    self._put_memory(sha, data)
+                    return data
+            self._counters["misses"] += 1
+            return None
+
+    def contains(self, sha):
+        """Whether a tier holds sha, without counting a hit or miss"""
+        with self._lock:
+            return sha in self._memory or sha in self._disk
+
+    def put(self, sha, data):
+        with self._lock:
+            self._put_memory(sha, data)
+
+    def stats(self):
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_capacity": self.memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_used,
+                "disk_capacity": self.disk_bytes,
+            }
+
+
+blob_cache = BlobCache(BLOB_CACHE_MEMORY_BYTES, BLOB_CACHE_DISK_BYTES, BLOB_CACHE_DIR)
+
+
+def get_blob(username, repo, blob_sha, headers=None):
+    """Raw bytes of a blob, downloaded only when no cache tier holds it"""
+    data = blob_cache.get(blob_sha)
+    if data is not None:
+        return data
+    if config.GIT_MIRROR:
+        from Shared.git_mirror import mirror
+        data = mirror.read_blobs(username, repo, [blob_sha], headers=headers).get(blob_sha)
+        if data is None:
+            raise GitHubError(404, f'Could not read blob {blob_sha[:7]} of {username}/{repo}')
+    else:
+        h = dict(headers or github_headers())
+        h['Accept'] = 'application/vnd.github.raw'
+        r = github_client.get(f"{GITHUB_API}/repos/{username}/{repo}/git/blobs/{blob_sha}", headers=h)
+        raise_for_github(r, f'Could not read blob {blob_sha[:7]} of {username}/{repo}')
+        data = r.content
+    blob_cache.put(blob_sha, data)
+    return data
+
+
+def prefetch_blobs(username, repo, commit_sha, blob_shas, headers=None):
+    """
+    Load the uncached blob_shas of commit_sha into the cache in one mirror
+    batch before they are read one by one. Does nothing without GIT_MIRROR;
+    the REST backend fetches blobs as they are read.
+    """
+    if not config.GIT_MIRROR:
+        return
+    from Shared.git_mirror import mirror
+    wanted = [sha for sha in blob_shas if not blob_cache.contains(sha)]
+    if wanted:
+        for sha, data in mirror.read_blobs(username, repo, wanted, commit_sha, headers).items():
+            blob_cache.put(sha, data)
+
+
+def prefetch_files(username, repo, ref, paths, headers=None):
+    """prefetch_blobs for file paths at ref"""
+    if not config.GIT_MIRROR or not paths:
+        return
+    headers = headers or github_headers()
+    sha = resolve_commit_sha(username, repo, ref, headers)
+    entries = {entry['path']: entry['sha'] for entry in get_tree(username, repo, sha, headers)
+               if entry['type'] == 'blob'}
+    prefetch_blobs(username, repo, sha, [entries[path] for path in paths if path in entries], headers)
+
+
+def read_file(username, repo, ref, path, headers=None):
+    """Text of path at ref, looked up through the cached tree and blob cache"""
+    headers = headers or github_headers()
+    sha = resolve_commit_sha(username, repo, ref, headers)
+    entry = find_entry(get_tree(username, repo, sha, headers), path)
+    if entry is None or entry['type'] != 'blob':
+        raise GitHubError(404, f'File "{path}" not found in {username}/{repo} at {ref}')
+    data = get_blob(username, repo, entry['sha'], headers)
+    with span('decode', path=path, bytes=len(data)):
+        return data.decode('utf-8')
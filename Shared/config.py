@@ -0,0 +1,42 @@
+"""
+Settings shared by every module, read once per process.
+
+.env is loaded here and nowhere else. Modules that still read their own
+tunables with os.getenv import this first (directly or through
+Shared.http_client), so those see .env values too. create_app() copies the
+settings into app.config.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Blueprints a deployment serves, by name (see app.MODULES)
+ALL_MODULES = ("chatbot", "logger", "writer", "tester")
+
+
+def _env_list(name, default):
+    value = os.getenv(name)
+    if not value:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Config:
+    ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+    ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL") or "https://api.anthropic.com/v1/messages"
+    MODEL = os.getenv("MODEL")
+    VERSION = os.getenv("VERSION") or "2023-06-01"
+    GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+    GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+    # Comma-separated subset of ALL_MODULES, e.g. METRICPAGE_MODULES=chatbot,writer
+    MODULES = _env_list("METRICPAGE_MODULES", ALL_MODULES)
+    # Serve trees, file contents and commit logs from local partial clones (Shared.git_mirror)
+    GIT_MIRROR = os.getenv("GIT_MIRROR", "").lower() in ("1", "true", "yes")
+    # Where the mirrors are kept, and the git remote they are cloned from
+    REPO_BASE = os.getenv("REPO_BASE", "cloned_repos")
+    GIT_MIRROR_REMOTE = os.getenv("GIT_MIRROR_REMOTE", "https://github.com").rstrip("/")
+
+
+config = Config()
@@ -0,0 +1,115 @@
+"""
+Atomic multi-file commits through the Git Data API.
+
+Instead of one contents-API PUT (and one commit) per file, every changed
+file becomes a blob, all of them go into one tree on top of the branch head,
+and a single commit is fast-forwarded onto the branch. When the branch moves
+in between, the commit is rebuilt on the new head (blobs are reused) unless
+the newer commits touched one of the same files.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from Shared.http_client import github_client, github_headers, GITHUB_API
+from Shared.github_tree import get_tree, raise_for_github, remember_ref, GitHubError
+from Shared.symbol_index import git_blob_sha
+from Shared.tracing import propagate
+
+# Attempts at fast-forwarding the branch before giving up on a busy branch
+GIT_COMMIT_ATTEMPTS = int(os.getenv("GIT_COMMIT_ATTEMPTS", 4))
+# Concurrent blob uploads per commit
+GIT_BLOB_CONCURRENCY = int(os.getenv("GIT_BLOB_CONCURRENCY", 8))
+
+
+def _head_sha(username, repo, branch, headers):
+    r = github_client.get(f"{GITHUB_API}/repos/{username}/{repo}/git/ref/heads/{branch}", headers=headers)
+    raise_for_github(r, f'Could not read branch "{branch}" of {username}/{repo}')
+    return r.json()['object']['sha']
+
+
+def _create_blob(username, repo, content, headers):
+    r = github_client.post(f"{GITHUB_API}/repos/{username}/{repo}/git/blobs",
+                           json={'content': content, 'encoding': 'utf-8'}, headers=headers)
+    if r.status_code != 201:
+        raise_for_github(r, f'Could not create a blob in {username}/{repo}')
+    return r.json()['sha']
+
+
+def _entries_by_path(username, repo, commit_sha, headers):
+    return {entry['path']: entry for entry in get_tree(username, repo, commit_sha, headers)
+            if entry['type'] == 'blob'}
+
+
+def commit_files(username, repo, branch, files, message, headers=None):
+    """
+    Commit files ({path: text, or None to delete}) to branch as one commit.
+    Returns: {'commit_sha', 'changed': [paths], 'unchanged': [paths], 'attempts'};
+    commit_sha is None when no file differs from the branch head.
+    Raises GitHubError; 409 when the branch moved and touched the same files.
+    """
+    headers = headers or github_headers()
+    base_sha = _head_sha(username, repo, branch, headers)
+    base_entries = _entries_by_path(username, repo, base_sha, headers)
+
+    # Files already identical to the branch need neither a blob nor a tree entry
+    changed = {}
+    unchanged = []
+    for path, content in files.items():
+        existing = base_entries.get(path)
+        if content is None:
+            if existing is None:
+                unchanged.append(path)
+            else:
+                changed[path] = None
+        elif existing is not None and existing['sha'] == git_blob_sha(content.encode('utf-8')):
+            unchanged.append(path)
+        else:
+            changed[path] = content
+    if not changed:
+        return {'commit_sha': None, 'changed': [], 'unchanged': unchanged, 'attempts': 0}
+
+    uploads = [path for path, content in changed.items() if content is not None]
+    with ThreadPoolExecutor(max_workers=max(1, min(GIT_BLOB_CONCURRENCY, len(uploads)))) as executor:
+        blob_shas = dict(zip(uploads, executor.map(
+            propagate(lambda path: _create_blob(username, repo, changed[path], headers)), uploads)))
+
+    head_sha = base_sha
+    head_entries = base_entries
+    for attempt in range(1, GIT_COMMIT_ATTEMPTS + 1):
+        tree = []
+        for path in changed:
+            existing = head_entries.get(path)
+            mode = existing['mode'] if existing and existing.get('mode') else '100644'
+            tree.append({'path': path, 'mode': mode, 'type': 'blob', 'sha': blob_shas.get(path)})
+        head_commit = github_client.get(f"{GITHUB_API}/repos/{username}/{repo}/git/commits/{head_sha}",
+                                        headers=headers)
+        raise_for_github(head_commit, f'Could not read commit {head_sha[:7]} of {username}/{repo}')
+        r = github_client.post(f"{GITHUB_API}/repos/{username}/{repo}/git/trees",
+                               json={'base_tree': head_commit.json()['tree']['sha'], 'tree': tree}, headers=headers)
+        if r.status_code != 201:
+            raise_for_github(r, f'Could not create a tree in {username}/{repo}')
+        r = github_client.post(f"{GITHUB_API}/repos/{username}/{repo}/git/commits",
+                               json={'message': message, 'tree': r.json()['sha'], 'parents': [head_sha]},
+                               headers=headers)
+        if r.status_code != 201:
+            raise_for_github(r, f'Could not create a commit in {username}/{repo}')
+        commit_sha = r.json()['sha']
+
+        r = github_client.patch(f"{GITHUB_API}/repos/{username}/{repo}/git/refs/heads/{branch}",
+                                json={'sha': commit_sha, 'force': False}, headers=headers)
+        if r.status_code == 200:
+            remember_ref(username, repo, branch, commit_sha)
+            return {'commit_sha': commit_sha, 'changed': list(changed), 'unchanged': unchanged,
+                    'attempts': attempt}
+        if r.status_code != 422:
+            raise_for_github(r, f'Could not update branch "{branch}" of {username}/{repo}')
+
+        # Not a fast-forward: someone pushed meanwhile. Rebuild on the new head
+        # unless their commits changed a file we are about to overwrite.
+        head_sha = _head_sha(username, repo, branch, headers)
+        head_entries = _entries_by_path(username, repo, head_sha, headers)
+        conflicts = [path for path in changed
+                     if (head_entries.get(path) or {}).get('sha') != (base_entries.get(path) or {}).get('sha')]
+        if conflicts:
+            raise GitHubError(409, f'Branch "{branch}" changed {", ".join(conflicts)} since the commit was prepared')
+    raise GitHubError(409, f'Branch "{branch}" kept moving; gave up after {GIT_COMMIT_ATTEMPTS} attempts')
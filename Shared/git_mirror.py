@@ -0,0 +1,297 @@
+"""
+Local partial-clone mirrors as the read backend for trees, files and logs.
+
+With GIT_MIRROR on, every repository read is served from a blobless bare
+clone (--filter=blob:none) under REPO_BASE/<owner>/<repo>.git instead of the
+REST API. A mirror is refreshed with an incremental `git fetch` at most every
+GIT_MIRROR_FETCH_TTL seconds, or straight away when asked for a ref or
+commit it does not have yet. Commits and trees are local after each fetch;
+blobs cross the network only the first time they are read, many at a time
+in one fetch, and are read back with a single `git cat-file --batch`.
+Commit logs are one `git log`.
+
+GIT_MIRROR_REMOTE is where clones come from (default https://github.com,
+authenticated with the request's GitHub token). A file:// URL of a
+directory holding <owner>/<repo>.git bare repositories works the same way
+without any network.
+"""
+import base64
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from Shared.config import config
+from Shared.http_client import github_headers
+from Shared.github_tree import GitHubError
+from Shared.tracing import span
+
+# Seconds a mirror is trusted before the next read fetches from the remote
+GIT_MIRROR_FETCH_TTL = float(os.getenv("GIT_MIRROR_FETCH_TTL", 30))
+# Seconds one git command may run; first clones of large repos take the longest
+GIT_MIRROR_TIMEOUT = float(os.getenv("GIT_MIRROR_TIMEOUT", 300))
+
+_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+# git log fields split by the ASCII unit separator, commits by the record separator
+_LOG_FORMAT = "%x1f".join(["%H", "%an", "%ae", "%aI", "%cn", "%ce", "%cI", "%B"]) + "%x1e"
+
+
+def raise_for_git(result, what):
+    if result.returncode == 0:
+        return
+    lines = result.stderr.decode("utf-8", "replace").strip().splitlines()
+    # The first fatal/error line names the problem; what follows is generic advice
+    errors = [line for line in lines if line.startswith(("fatal:", "error:", "remote:"))]
+    detail = (errors or lines or [f"git exited with {result.returncode}"])[0]
+    lowered = detail.lower()
+    not_found = ("not found" in lowered or "does not exist" in lowered
+                 or "not appear to be a git repository" in lowered)
+    raise GitHubError(404 if not_found else 502, f"{what}: {detail}")
+
+
+class GitMirror:
+    """
+    base_dir: str, where the bare clones are kept
+    remote: str, clones come from <remote>/<owner>/<repo>.git
+    fetch_ttl: float, seconds between fetches of one mirror
+    timeout: float, seconds one git command may take
+    """
+
+    def __init__(self, base_dir, remote, fetch_ttl, timeout):
+        self.base_dir = os.path.abspath(base_dir)
+        self.remote = remote.rstrip("/")
+        self.fetch_ttl = fetch_ttl
+        self.timeout = timeout
+        self._fetched_at = {}
+        self._repo_locks = {}
+        self._lock = threading.Lock()
+        self._counters = {"clones": 0, "fetches": 0, "blob_fetches": 0, "blobs_fetched": 0,
+                          "blob_batches": 0, "blobs_read": 0, "trees": 0, "logs": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def path(self, owner, repo):
+        for name in (owner, repo):
+            if not _NAME_RE.match(name or '') or name in ('.', '..'):
+                raise GitHubError(404, f'Repository "{owner}/{repo}" not found')
+        return os.path.join(self.base_dir, owner.lower(), f"{repo.lower()}.git")
+
+    def _auth_env(self, headers):
+        """http.extraHeader for the git transport, from the API's Authorization header"""
+        if not self.remote.startswith("https://"):
+            return {}
+        scheme, _, token = (headers or github_headers()).get("Authorization", "").partition(" ")
+        if not token or token == "None":
+            return {}
+        basic = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        # Passed through the environment so the token never shows up in the process list
+        return {"GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "http.extraHeader",
+                "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic}"}
+
+    def _git(self, args, what, headers=None, input=None, lazy_fetch=False, check=True):
+        """
+        Run git and return its CompletedProcess. Objects missing from the
+        partial clone are only fetched on demand when lazy_fetch is set.
+        Raises GitHubError when check is set and git fails.
+        """
+        env = dict(os.environ, GIT_TERMINAL_PROMPT="0", **self._auth_env(headers))
+        if not lazy_fetch:
+            env["GIT_NO_LAZY_FETCH"] = "1"
+        try:
+            result = subprocess.run(["git", *args], input=input, capture_output=True, env=env,
+                                    timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise GitHubError(504, f"{what}: git timed out after {self.timeout:g}s")
+        if check:
+            raise_for_git(result, what)
+        return result
+
+    def _repo_lock(self, git_dir):
+        with self._lock:
+            return self._repo_locks.setdefault(git_dir, threading.Lock())
+
+    def _refresh(self, owner, repo, headers, newer_than=None):
+        """
+        Clone the mirror on first use and fetch when it is older than
+        fetch_ttl, or when no fetch has finished since newer_than. Returns
+        its git dir.
+        """
+        git_dir = self.path(owner, repo)
+        with self._repo_lock(git_dir):
+            fetched_at = self._fetched_at.get(git_dir)
+            if fetched_at is not None:
+                if newer_than is None and time.monotonic() - fetched_at < self.fetch_ttl:
+                    return git_dir
+                if newer_than is not None and fetched_at > newer_than:
+                    return git_dir
+            if os.path.isdir(git_dir):
+                with span('git.fetch', repo=f"{owner}/{repo}"):
+                    self._git(["-C", git_dir, "fetch", "--prune", "--no-write-fetch-head", "origin"],
+                              f"Could not fetch {owner}/{repo}", headers)
+                self._count("fetches")
+            else:
+                with span('git.clone', repo=f"{owner}/{repo}"):
+                    self._clone(owner, repo, git_dir, headers)
+                self._count("clones")
+            self._fetched_at[git_dir] = time.monotonic()
+        return git_dir
+
+    def _clone(self, owner, repo, git_dir, headers):
+        # Cloned next to its final place and renamed, so a failed clone never looks like a mirror
+        os.makedirs(os.path.dirname(git_dir), exist_ok=True)
+        tmp = f"{git_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            self._git(["clone", "--bare", "--filter=blob:none", "--quiet", f"{self.remote}/{owner}/{repo}.git",
+                       tmp], f'Could not clone {owner}/{repo}', headers)
+            # A bare clone keeps no fetch refspec; track every branch and tag of the remote
+            self._git(["-C", tmp, "config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"],
+                      "Could not configure mirror")
+            self._git(["-C", tmp, "config", "--add", "remote.origin.fetch", "+refs/tags/*:refs/tags/*"],
+                      "Could not configure mirror")
+            os.replace(tmp, git_dir)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _rev_parse(self, git_dir, ref):
+        result = self._git(["-C", git_dir, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"],
+                           "Could not resolve ref", check=False)
+        sha = result.stdout.decode("ascii", "replace").strip()
+        return sha if result.returncode == 0 and _SHA_RE.match(sha) else None
+
+    def _locate(self, owner, repo, ref, headers):
+        """(git dir, commit SHA of ref), fetching once more when the mirror does not know ref yet"""
+        if not ref or ref.startswith("-"):
+            raise GitHubError(404, f'Could not resolve "{ref}" in {owner}/{repo}')
+        started = time.monotonic()
+        git_dir = self.path(owner, repo)
+        # A commit the mirror already has never changes, so it needs no fetch
+        if _SHA_RE.match(ref) and os.path.isdir(git_dir):
+            sha = self._rev_parse(git_dir, ref)
+            if sha:
+                return git_dir, sha
+        git_dir = self._refresh(owner, repo, headers)
+        sha = self._rev_parse(git_dir, ref)
+        if sha is None:
+            git_dir = self._refresh(owner, repo, headers, newer_than=started)
+            sha = self._rev_parse(git_dir, ref)
+        if sha is None:
+            raise GitHubError(404, f'Could not resolve "{ref}" in {owner}/{repo}')
+        return git_dir, sha
+
+    def resolve(self, owner, repo, ref, headers=None):
+        """Commit SHA of a branch, tag or SHA. Raises GitHubError."""
+        return self._locate(owner, repo, ref, headers)[1]
+
+    def tree(self, owner, repo, commit_sha, headers=None):
+        """
+        Every entry of the tree at commit_sha, shaped like get_tree's: dicts
+        with 'path', 'type', 'sha', 'mode' and 'size' (None; blob sizes
+        are not known before the blob is fetched). Raises GitHubError.
+        """
+        git_dir, sha = self._locate(owner, repo, commit_sha, headers)
+        with span('git.ls_tree', repo=f"{owner}/{repo}"):
+            out = self._git(["-C", git_dir, "ls-tree", "-r", "-t", "-z", sha],
+                            f"Could not read tree {sha[:7]} of {owner}/{repo}").stdout
+        entries = []
+        for record in out.split(b"\0"):
+            if not record:
+                continue
+            meta, _, path = record.partition(b"\t")
+            mode, kind, object_sha = meta.decode("ascii").split(" ")
+            entries.append({'path': path.decode("utf-8", "surrogateescape"), 'type': kind, 'sha': object_sha,
+                            'mode': mode, 'size': None})
+        self._count("trees")
+        return entries
+
+    def _missing_blobs(self, git_dir, commit_sha):
+        """Blobs of the tree at commit_sha that the partial clone has not fetched yet"""
+        out = self._git(["-C", git_dir, "rev-list", "--objects", "--no-walk", "--missing=print", commit_sha],
+                        "Could not list missing objects").stdout
+        return {line[1:].decode("ascii") for line in out.splitlines() if line.startswith(b"?")}
+
+    def read_blobs(self, owner, repo, blob_shas, commit_sha=None, headers=None):
+        """
+        {sha: bytes} for blob_shas, leaving out any the remote does not
+        have. With commit_sha (the commit the blobs belong to), the ones not
+        yet local are fetched together first; otherwise git fetches each
+        missing blob on its own. Raises GitHubError.
+        """
+        blob_shas = [sha for sha in dict.fromkeys(blob_shas) if _SHA_RE.match(sha)]
+        if not blob_shas:
+            return {}
+        git_dir = self.path(owner, repo)
+        if not os.path.isdir(git_dir):
+            self._refresh(owner, repo, headers)
+        if commit_sha:
+            missing = self._missing_blobs(git_dir, commit_sha) & set(blob_shas)
+            if missing:
+                with span('git.fetch_blobs', repo=f"{owner}/{repo}", blobs=len(missing)):
+                    self._git(["-C", git_dir, "-c", "fetch.negotiationAlgorithm=noop", "fetch", "origin",
+                               "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+                               "--filter=blob:none", "--stdin"],
+                              f"Could not fetch files of {owner}/{repo}", headers,
+                              input="\n".join(sorted(missing)).encode("ascii"))
+                self._count("blob_fetches")
+                self._count("blobs_fetched", len(missing))
+
+        with span('git.cat_file', repo=f"{owner}/{repo}", blobs=len(blob_shas)):
+            out = self._git(["-C", git_dir, "cat-file", "--batch"], f"Could not read files of {owner}/{repo}",
+                            headers, input="\n".join(blob_shas).encode("ascii") + b"\n", lazy_fetch=True).stdout
+        blobs = {}
+        pos = 0
+        while pos < len(out):
+            end = out.index(b"\n", pos)
+            header = out[pos:end].decode("ascii").split(" ")
+            pos = end + 1
+            if len(header) != 3:
+                continue  # "<sha> missing"
+            size = int(header[2])
+            if header[1] == "blob":
+                blobs[header[0]] = out[pos:pos + size]
+            pos += size + 1
+        self._count("blob_batches")
+        self._count("blobs_read", len(blobs))
+        return blobs
+
+    def log(self, owner, repo, since_sha=None, limit=50, headers=None):
+        """
+        Same contract as github_cache.list_commits_since, from the default
+        branch of the mirror: (commits newest first, found). Commits are
+        shaped like the REST API's ({'sha', 'commit': {'author',
+        'committer', 'message'}}). Raises GitHubError.
+        """
+        git_dir = self._refresh(owner, repo, headers)
+        with span('git.log', repo=f"{owner}/{repo}"):
+            result = self._git(["-C", git_dir, "log", f"--max-count={int(limit)}", f"--format={_LOG_FORMAT}",
+                                "HEAD"], f"Could not read commits of {owner}/{repo}", check=False)
+        self._count("logs")
+        if b"does not have any commits" in result.stderr:
+            return [], False
+        raise_for_git(result, f"Could not read commits of {owner}/{repo}")
+        commits = []
+        for record in result.stdout.decode("utf-8", "replace").split("\x1e"):
+            fields = record.lstrip("\n").split("\x1f")
+            if len(fields) != 8:
+                continue
+            sha, author, author_email, author_date, committer, committer_email, committer_date, message = fields
+            if sha == since_sha:
+                return commits, True
+            commits.append({'sha': sha, 'commit': {
+                'author': {'name': author, 'email': author_email, 'date': author_date},
+                'committer': {'name': committer, 'email': committer_email, 'date': committer_date},
+                'message': message.rstrip("\n"),
+            }})
+        return commits, False
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "mirrors": len(self._fetched_at), "fetch_ttl": self.fetch_ttl,
+                    "remote": self.remote}
+
+
+mirror = GitMirror(config.REPO_BASE, config.GIT_MIRROR_REMOTE, GIT_MIRROR_FETCH_TTL, GIT_MIRROR_TIMEOUT)
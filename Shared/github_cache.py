@@ -0,0 +1,273 @@
+"""
+Conditional-request cache for GitHub metadata endpoints.
+
+Repo, branch and commit lists are stored with their ETag/Last-Modified.
+Within GITHUB_METADATA_TTL seconds they are served straight from memory;
+after that they are revalidated with If-None-Match/If-Modified-Since, and a
+304 answer (which GitHub does not count against the rate limit) refreshes
+the stored copy without re-downloading it.
+
+Repo and branch lists are read in full: page 1 (100 items) gives the last
+page number in its Link header and the remaining pages are fetched
+concurrently. The assembled list is kept per user and credential for
+GITHUB_LISTING_TTL seconds, so prefix searches while typing cost nothing
+upstream.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from Shared.config import config
+from Shared.http_client import github_client, github_headers, GITHUB_API
+from Shared.github_tree import raise_for_github
+from Shared.rate_limits import credential_id
+from Shared.tracing import propagate
+
+GITHUB_METADATA_TTL = float(os.getenv("GITHUB_METADATA_TTL", 60))
+GITHUB_METADATA_ENTRIES = int(os.getenv("GITHUB_METADATA_ENTRIES", 1024))
+# GitHub's largest page size for list endpoints
+GITHUB_PER_PAGE = 100
+# Pages fetched at once after page 1, and the most pages read for one list
+GITHUB_PAGE_CONCURRENCY = int(os.getenv("GITHUB_PAGE_CONCURRENCY", 4))
+GITHUB_LIST_MAX_PAGES = int(os.getenv("GITHUB_LIST_MAX_PAGES", 50))
+# Seconds an assembled repo/branch list is reused before it is checked again
+GITHUB_LISTING_TTL = float(os.getenv("GITHUB_LISTING_TTL", 30))
+
+
+class MetadataCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"fresh_hits": 0, "not_modified": 0, "full_responses": 0, "errors": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def get_json(self, url, params=None, headers=None, ttl=None):
+        """
+        Parsed JSON body of a GitHub GET, served from cache when fresh or
+        when GitHub confirms it unchanged. Raises GitHubError on failure.
+        """
+        return self.get_page(url, params, headers, ttl)[0]
+
+    def get_page(self, url, params=None, headers=None, ttl=None):
+        """Like get_json, but returns (body, next_url) from the Link header"""
+        body, links = self.get_page_links(url, params, headers, ttl)
+        return body, links.get('next')
+
+    def get_page_links(self, url, params=None, headers=None, ttl=None):
+        """Like get_json, but returns (body, {rel: url}) from the Link header"""
+        headers = dict(headers or github_headers())
+        ttl = self.ttl if ttl is None else ttl
+        key = (url, tuple(sorted((params or {}).items())), headers.get('Authorization'))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and time.monotonic() - entry['stored_at'] < ttl:
+            self._count("fresh_hits")
+            return entry['body'], entry['links']
+
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        r = github_client.get(url, headers=headers, params=params)
+        if r.status_code == 304 and entry is not None:
+            self._count("not_modified")
+            entry['stored_at'] = time.monotonic()
+            return entry['body'], entry['links']
+        try:
+            raise_for_github(r, 'GitHub API error')
+        except Exception:
+            self._count("errors")
+            raise
+
+        self._count("full_responses")
+        body = r.json()
+        links = {rel: link['url'] for rel, link in r.links.items() if link.get('url')}
+        with self._lock:
+            self._entries[key] = {
+                'body': body,
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+                'links': links,
+                'stored_at': time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, links
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        upstream = counters["not_modified"] + counters["full_responses"]
+        lookups = upstream + counters["fresh_hits"]
+        return {
+            **counters,
+            "entries": entries,
+            "ttl": self.ttl,
+            "not_modified_ratio": round(counters["not_modified"] / upstream, 4) if upstream else 0.0,
+            "served_without_download_ratio": round(
+                (counters["fresh_hits"] + counters["not_modified"]) / lookups, 4) if lookups else 0.0,
+        }
+
+
+metadata_cache = MetadataCache(GITHUB_METADATA_TTL, GITHUB_METADATA_ENTRIES)
+
+
+def _page_number(url):
+    if not url:
+        return None
+    pages = parse_qs(urlsplit(url).query).get('page')
+    return int(pages[0]) if pages and pages[0].isdigit() else None
+
+
+def fetch_all_pages(url, headers=None):
+    """
+    Every item of a paginated GitHub list, up to GITHUB_LIST_MAX_PAGES pages.
+    Pages after the first are fetched concurrently when the Link header
+    names the last one, and followed one by one otherwise.
+    Raises GitHubError.
+    """
+    params = {'per_page': GITHUB_PER_PAGE}
+    first, links = metadata_cache.get_page_links(url, params=params, headers=headers)
+    items = list(first)
+    last = _page_number(links.get('last'))
+    if last:
+        pages = list(range(2, min(last, GITHUB_LIST_MAX_PAGES) + 1))
+        if pages:
+            fetch = propagate(lambda page: metadata_cache.get_json(url, params={**params, 'page': page},
+                                                                   headers=headers))
+            with ThreadPoolExecutor(max_workers=min(GITHUB_PAGE_CONCURRENCY, len(pages))) as executor:
+                for page in executor.map(fetch, pages):
+                    items.extend(page)
+        return items
+
+    next_url, fetched = links.get('next'), 1
+    while next_url and fetched < GITHUB_LIST_MAX_PAGES:
+        page, links = metadata_cache.get_page_links(next_url, headers=headers)
+        items.extend(page)
+        next_url = links.get('next')
+        fetched += 1
+    return items
+
+
+class ListingCache:
+    """
+    Full name lists keyed by (url, credential) for ttl seconds. Concurrent
+    misses for the same key wait for the one fetch already in flight.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "shared_fetches": 0}
+
+    def get(self, url, headers, load):
+        key = (url, credential_id(headers or github_headers()))
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry[0]
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    self._counters["misses"] += 1
+                    break
+                self._counters["shared_fetches"] += 1
+            pending.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+            # The fetch we waited on failed; try on our own
+
+        try:
+            names = load()
+            with self._lock:
+                self._entries[key] = (names, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return names
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "ttl": self.ttl}
+
+
+listing_cache = ListingCache(GITHUB_LISTING_TTL, GITHUB_METADATA_ENTRIES)
+
+
+def filter_names(names, prefix=None):
+    """Names starting with prefix, ignoring case; all of them without one"""
+    if not prefix:
+        return list(names)
+    prefix = prefix.lower()
+    return [name for name in names if name.lower().startswith(prefix)]
+
+
+def list_repo_names(username, headers=None, prefix=None):
+    """Names of every repository of username (a user or an organization), optionally filtered by prefix"""
+    url = f"{GITHUB_API}/users/{username}/repos"
+    names = listing_cache.get(url, headers, lambda: [repo['name'] for repo in fetch_all_pages(url, headers)])
+    return filter_names(names, prefix)
+
+
+def list_branch_names(username, repo, headers=None, prefix=None):
+    """Names of every branch of username/repo, optionally filtered by prefix"""
+    url = f"{GITHUB_API}/repos/{username}/{repo}/branches"
+    names = listing_cache.get(url, headers, lambda: [b['name'] for b in fetch_all_pages(url, headers)])
+    return filter_names(names, prefix)
+
+
+def list_commits(username, repo, per_page=50, headers=None):
+    return metadata_cache.get_json(f"{GITHUB_API}/repos/{username}/{repo}/commits",
+                                   params={'per_page': per_page}, headers=headers)
+
+
+def list_commits_since(username, repo, since_sha=None, limit=50, headers=None):
+    """
+    Commits newer than since_sha, newest first, following Link headers past
+    the first page. Returns (commits, found) where found is False when
+    since_sha was not reached within limit commits (or since_sha is None).
+    With GIT_MIRROR on, read from the local mirror's default branch instead.
+    """
+    if config.GIT_MIRROR:
+        from Shared.git_mirror import mirror
+        return mirror.log(username, repo, since_sha, limit, headers)
+    url = f"{GITHUB_API}/repos/{username}/{repo}/commits"
+    params = {'per_page': min(limit, 100)}
+    commits = []
+    while url and len(commits) < limit:
+        page, url = metadata_cache.get_page(url, params=params, headers=headers)
+        params = None  # the next link already carries the query string
+        for commit in page:
+            if commit['sha'] == since_sha:
+                return commits, True
+            commits.append(commit)
+            if len(commits) >= limit:
+                break
+    return commits, False
@@ -0,0 +1,171 @@
+"""
+Repository file trees via the Git Trees API.
+
+A branch is resolved to its commit SHA and the whole tree is fetched with a
+single ``git/trees/{sha}?recursive=1`` call. Trees are immutable per SHA, so
+they are cached by (owner, repo, sha) and filtered in memory by each caller.
+With GIT_MIRROR on, refs and trees come from the local mirror instead.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from Shared.config import config
+from Shared.http_client import github_client, github_headers, GITHUB_API
+
+# Directories never shown in any file listing
+EXCLUDED_DIRS = {'venv', '.venv', '__pycache__', 'tests', 'migrations', '.git', 'node_modules'}
+
+TREE_CACHE_SIZE = int(os.getenv("TREE_CACHE_SIZE", 128))
+# How long a resolved branch -> SHA mapping is trusted before asking GitHub again
+REF_CACHE_TTL = float(os.getenv("REF_CACHE_TTL", 30))
+
+_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+_tree_cache = OrderedDict()
+_tree_lock = threading.Lock()
+_ref_cache = {}
+
+
+class GitHubError(Exception):
+    """A non-success answer from the GitHub API"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def raise_for_github(r, what):
+    if r.status_code == 200:
+        return
+    try:
+        detail = r.json().get('message', 'Unknown error')
+    except Exception:
+        detail = r.text
+    raise GitHubError(r.status_code, f"{what}: {r.status_code} - {detail}")
+
+
+def resolve_commit_sha(username, repo, ref, headers=None):
+    """Resolve a branch, tag or SHA to the full commit SHA"""
+    if _SHA_RE.match(ref or ''):
+        return ref
+    key = (username.lower(), repo.lower(), ref)
+    cached = _ref_cache.get(key)
+    if cached and time.monotonic() - cached[1] < REF_CACHE_TTL:
+        return cached[0]
+
+    if config.GIT_MIRROR:
+        # Imported on first use: Shared.git_mirror itself imports this module
+        from Shared.git_mirror import mirror
+        sha = mirror.resolve(username, repo, ref, headers)
+    else:
+        h = dict(headers or github_headers())
+        h['Accept'] = 'application/vnd.github.sha'
+        r = github_client.get(f"{GITHUB_API}/repos/{username}/{repo}/commits/{ref}", headers=h)
+        raise_for_github(r, f'Could not resolve "{ref}" in {username}/{repo}')
+        sha = r.text.strip()
+    _ref_cache[key] = (sha, time.monotonic())
+    return sha
+
+
+def remember_ref(username, repo, ref, sha):
+    """Record a ref we just moved so reads see the new commit without waiting out REF_CACHE_TTL"""
+    _ref_cache[(username.lower(), repo.lower(), ref)] = (sha, time.monotonic())
+
+
+def _fetch_tree(username, repo, tree_sha, headers, recursive):
+    params = {'recursive': 1} if recursive else None
+    r = github_client.get(f"{GITHUB_API}/repos/{username}/{repo}/git/trees/{tree_sha}",
+                          headers=headers, params=params)
+    raise_for_github(r, f'Could not read tree {tree_sha[:7]} of {username}/{repo}')
+    return r.json()
+
+
+def _walk_truncated(username, repo, root_sha, headers):
+    """Fallback for trees too large for one recursive call: walk subtree by subtree"""
+    entries = []
+    pending = [("", root_sha)]
+    while pending:
+        prefix, tree_sha = pending.pop()
+        for item in _fetch_tree(username, repo, tree_sha, headers, recursive=False)['tree']:
+            path = f"{prefix}{item['path']}"
+            entries.append({'path': path, 'type': item['type'], 'sha': item['sha'],
+                            'mode': item.get('mode'), 'size': item.get('size')})
+            if item['type'] == 'tree' and item['path'] not in EXCLUDED_DIRS:
+                pending.append((f"{path}/", item['sha']))
+    entries.sort(key=lambda e: e['path'])
+    return entries
+
+
+def get_tree(username, repo, commit_sha, headers=None):
+    """
+    Return every entry of the tree at commit_sha as a tuple of dicts with
+    'path', 'type' ('blob' or 'tree'), 'sha', 'mode' and 'size'.
+    """
+    key = (username.lower(), repo.lower(), commit_sha)
+    with _tree_lock:
+        if key in _tree_cache:
+            _tree_cache.move_to_end(key)
+            return _tree_cache[key]
+
+    headers = headers or github_headers()
+    if config.GIT_MIRROR:
+        from Shared.git_mirror import mirror
+        entries = mirror.tree(username, repo, commit_sha, headers)
+    else:
+        data = _fetch_tree(username, repo, commit_sha, headers, recursive=True)
+        if data.get('truncated'):
+            entries = _walk_truncated(username, repo, data['sha'], headers)
+        else:
+            entries = [{'path': item['path'], 'type': item['type'], 'sha': item['sha'],
+                        'mode': item.get('mode'), 'size': item.get('size')} for item in data['tree']]
+    entries = tuple(entries)
+
+    with _tree_lock:
+        _tree_cache[key] = entries
+        while len(_tree_cache) > TREE_CACHE_SIZE:
+            _tree_cache.popitem(last=False)
+    return entries
+
+
+def find_entry(entries, path):
+    for entry in entries:
+        if entry['path'] == path:
+            return entry
+    return None
+
+
+def is_doc_file(name):
+    return name.endswith('.py') or name.endswith('.html') or name == "README.md"
+
+
+def is_readme_source(name):
+    return (name in ['app.py', 'main.py', 'requirements.txt', 'requirement.txt', 'README.md'] or
+            name.endswith('.py') or name.endswith('.html'))
+
+
+def is_python_file(name):
+    return name.endswith('.py')
+
+
+def filter_files(entries, include, excluded_dirs=EXCLUDED_DIRS):
+    """Blob paths whose file name passes include and that sit under no excluded dir"""
+    files = []
+    for entry in entries:
+        if entry['type'] != 'blob':
+            continue
+        parts = entry['path'].split('/')
+        if any(part in excluded_dirs for part in parts[:-1]):
+            continue
+        if include(parts[-1]):
+            files.append(entry['path'])
+    return files
+
+
+def list_files(username, repo, ref, include, headers=None):
+    """Resolve ref and return (commit_sha, filtered file paths)"""
+    headers = headers or github_headers()
+    sha = resolve_commit_sha(username, repo, ref, headers)
+    return sha, filter_files(get_tree(username, repo, sha, headers), include)
@@ -0,0 +1,249 @@
+"""
+Shared pooled HTTP client for the GitHub and Anthropic upstreams.
+
+Every blueprint goes through the clients defined here instead of calling
+bare ``requests.get``/``requests.post``, so TCP+TLS connections are kept
+alive and reused across requests.
+"""
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# First, so the modules below read their tunables after .env is loaded
+from Shared.config import config
+from Shared.rate_limits import governor, credential_id, UpstreamRateLimited
+from Shared.metrics import observe_upstream, upstream_requests
+from Shared.tracing import span
+
+GITHUB_API = config.GITHUB_API_URL
+GITHUB_TOKEN = config.GITHUB_TOKEN
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+ANTHROPIC_API_URL = config.ANTHROPIC_API_URL
+VERSION = config.VERSION
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class UpstreamClient:
+    """
+    A keep-alive session for one upstream host with retry and jittered backoff.
+
+    name: str, label used in pool stats (e.g. "github")
+    pool_size: int, max connections kept open to the upstream host
+    timeout: (connect, read) tuple applied when a call does not pass its own
+    max_retries: int, retries on connection errors and RETRY_STATUSES
+    backoff: float, base delay in seconds for exponential backoff
+
+    Every attempt is admitted by the shared rate-limit governor first, and
+    every response's rate-limit headers are fed back into it. Messages API
+    calls are charged their max_tokens up front and settle the difference
+    once the response reports its usage (streams through settle_usage).
+    """
+
+    def __init__(self, name, pool_size=10, timeout=(5, 30), max_retries=3,
+                 backoff=0.5, backoff_cap=8.0):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                                   pool_block=False, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "errors": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _sleep_for(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring Retry-After when present"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.backoff_cap))
+        time.sleep(delay)
+
+    def estimate_cost(self, kwargs):
+        """Governor cost of one call: a request, plus estimated tokens for Messages API bodies"""
+        cost = {"requests": 1}
+        payload = kwargs.get("json")
+        if isinstance(payload, dict) and "messages" in payload:
+            # ~4 characters per token is close enough for admission control
+            cost["input_tokens"] = len(json.dumps(payload.get("messages"))) // 4 + \
+                len(json.dumps(payload.get("system") or "")) // 4
+            cost["output_tokens"] = payload.get("max_tokens") or 0
+        return cost
+
+    def settle_usage(self, response, usage):
+        """
+        Give the governor back the tokens the call behind response was
+        charged but did not use. usage is the Messages API usage it
+        reported; only the counts present in it are settled, once.
+        """
+        charge = getattr(response, "governor_charge", None)
+        if not charge or not usage:
+            return
+        response.governor_charge = None
+        credential, cost = charge
+        used = {}
+        if usage.get("input_tokens") is not None:
+            used["input_tokens"] = usage["input_tokens"] + (usage.get("cache_creation_input_tokens") or 0)
+        if usage.get("output_tokens") is not None:
+            used["output_tokens"] = usage["output_tokens"]
+        governor.refund(self.name, credential, cost, used)
+
+    def _settle(self, credential, cost, response, stream):
+        if "output_tokens" not in cost:
+            return
+        response.governor_charge = (credential, cost)
+        if response.status_code >= 400:
+            # A rejected call generates nothing
+            self.settle_usage(response, {"input_tokens": 0, "output_tokens": 0})
+        elif not stream:
+            try:
+                body = response.json()
+            except ValueError:
+                return
+            if isinstance(body, dict):
+                self.settle_usage(response, body.get("usage"))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        credential = credential_id(kwargs.get("headers") or self.session.headers)
+        cost = self.estimate_cost(kwargs)
+        resource = "search" if "/search/" in url else "core"
+        phase = "llm" if self.name == "anthropic" else self.name
+        path = urlsplit(url).path
+        attempt = 0
+        while True:
+            try:
+                governor.admit(self.name, credential, cost, resource)
+            except UpstreamRateLimited:
+                upstream_requests.inc(upstream=self.name, status="shed")
+                raise
+            self._count("requests")
+            started = time.perf_counter()
+            try:
+                with span(phase, method=method, path=path, attempt=attempt):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                observe_upstream(self.name, "error", time.perf_counter() - started)
+                if attempt >= self.max_retries:
+                    self._count("errors")
+                    raise
+                self._count("retries")
+                self._sleep_for(attempt)
+                attempt += 1
+                continue
+
+            # Streamed bodies: this is the time to the response headers
+            observe_upstream(self.name, response.status_code, time.perf_counter() - started)
+            governor.observe(self.name, credential, response)
+            self._settle(credential, cost, response, kwargs.get("stream"))
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._count("retries")
+                self._sleep_for(attempt, response)
+                response.close()
+                attempt += 1
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def stats(self):
+        """Per-host connection counts read from the underlying urllib3 pools"""
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened = getattr(pool, "num_connections", 0)
+            served = getattr(pool, "num_requests", 0)
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": opened,
+                "requests_sent": served,
+                "connections_reused": max(served - opened, 0),
+                "idle_connections": pool.pool.qsize() if pool.pool is not None else 0,
+            }
+        with self._lock:
+            counters = dict(self._counters)
+        return {"pool_size": self.pool_size, "timeout": self.timeout,
+                "max_retries": self.max_retries, **counters, "hosts": hosts}
+
+
+github_client = UpstreamClient(
+    "github",
+    pool_size=_env_int("GITHUB_POOL_SIZE", 20),
+    timeout=(_env_float("GITHUB_CONNECT_TIMEOUT", 5), _env_float("GITHUB_READ_TIMEOUT", 30)),
+    max_retries=_env_int("GITHUB_MAX_RETRIES", 3),
+)
+
+anthropic_client = UpstreamClient(
+    "anthropic",
+    pool_size=_env_int("ANTHROPIC_POOL_SIZE", 10),
+    timeout=(_env_float("ANTHROPIC_CONNECT_TIMEOUT", 5), _env_float("ANTHROPIC_READ_TIMEOUT", 120)),
+    max_retries=_env_int("ANTHROPIC_MAX_RETRIES", 2),
+    backoff=1.0,
+)
+
+
+def github_headers(token=None):
+    """Headers for GitHub API requests, authenticated when a token is available"""
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    token = token or GITHUB_TOKEN
+    if token:
+        headers["Authorization"] = f"token {token}"
+    return headers
+
+
+def anthropic_headers():
+    """Headers for the Anthropic Messages API"""
+    return {
+        "Content-Type": "application/json",
+        "x-api-key": ANTHROPIC_API_KEY,
+        "anthropic-version": VERSION,
+    }
+
+
+def pool_stats():
+    return {client.name: client.stats() for client in (github_client, anthropic_client)}
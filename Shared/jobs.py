@@ -0,0 +1,321 @@
+"""
+Background job queue for long-running generation tasks.
+
+Routes submit work and return a job id at once; each job type runs on its
+own bounded thread pool, so slow README/test/summary generation cannot
+exhaust the Flask request threads. Job state lives in a local SQLite file
+shared by every process of the app: queued jobs are picked up again after a
+restart, and running jobs whose owning process has died are marked failed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, jsonify, url_for
+
+from Shared.llm_stream import format_sse
+from Shared.rate_limits import UpstreamRateLimited, background_calls
+from Shared.tracing import start_trace
+
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "jobs.sqlite3"),
+)
+# Finished jobs older than this many seconds are purged on startup
+JOBS_RETENTION = float(os.getenv("JOBS_RETENTION", 24 * 60 * 60))
+
+FINISHED = ("succeeded", "failed")
+
+
+class JobError(Exception):
+    """Raised by a task to fail its job with a user-facing message"""
+
+
+def wants_async(data):
+    """True when the JSON body asks for the work to run as a background job"""
+    return bool(data and data.get('async'))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _process_start(pid):
+    """Start time of pid in clock ticks since boot (Linux), or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name in parentheses may hold spaces; starttime is the 20th field after it
+    fields = stat.rpartition(")")[2].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+_owner_tokens = {}
+
+
+def owner_token():
+    """
+    "<pid>:<start>" naming this process in the jobs it runs. PIDs are reused
+    (a restarted container often gets its old one back), so the start time,
+    or a random id where it cannot be read, tells an old process apart.
+    Computed per PID so forked workers get their own.
+    """
+    pid = os.getpid()
+    if pid not in _owner_tokens:
+        _owner_tokens[pid] = f"{pid}:{_process_start(pid) or uuid.uuid4().hex}"
+    return _owner_tokens[pid]
+
+
+def _owner_alive(token):
+    """True when the process token names is still running"""
+    if token == owner_token():
+        return True
+    pid, _, started = (token or "").partition(":")
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    if not _process_alive(int(pid)):
+        return False
+    current = _process_start(int(pid))
+    return current is None or current == started
+
+
+class JobQueue:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._version = 0
+        self._types = {}
+        self._app = None
+        self._metrics_lock = threading.Lock()
+        self._waits = {}
+        self._runtimes = {}
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT
+                )""")
+            # Databases created before jobs recorded their owner
+            if "owner" not in {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_type_status ON jobs (type, status)")
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, args=()):
+        with self._db_lock:
+            db = self._connect()
+            rows = db.execute(sql, args).fetchall()
+            db.commit()
+            return rows
+
+    def _claim(self, job_id, started):
+        """Move a queued job to running under this process; False if another process got it first"""
+        with self._db_lock:
+            db = self._connect()
+            claimed = db.execute("UPDATE jobs SET status = 'running', owner = ?, started_at = ?, updated_at = ? "
+                                 "WHERE id = ? AND status = 'queued'",
+                                 (owner_token(), started, started, job_id)).rowcount
+            db.commit()
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+        return claimed == 1
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def register(self, job_type, func, concurrency):
+        """
+        func(params, progress) runs one job: params is the submitted JSON,
+        progress(dict) publishes intermediate state, and the return value
+        (JSON-serializable) becomes the job result.
+        """
+        self._types[job_type] = {
+            "func": func,
+            "concurrency": concurrency,
+            "executor": ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"job-{job_type}"),
+        }
+        with self._metrics_lock:
+            self._waits[job_type] = deque(maxlen=500)
+            self._runtimes[job_type] = deque(maxlen=500)
+
+    def init_app(self, app):
+        """Bind the app the jobs run under and resume work left by a previous process"""
+        self._app = app
+        now = time.time()
+        self._execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                      (*FINISHED, now - JOBS_RETENTION))
+        # Other workers of the app share the database; only reap jobs whose process is gone
+        for row in self._execute("SELECT id, owner FROM jobs WHERE status = 'running'"):
+            if not _owner_alive(row["owner"]):
+                self._execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? "
+                              "WHERE id = ? AND status = 'running'",
+                              ("Interrupted by a server restart", now, now, row["id"]))
+        for row in self._execute("SELECT id, type FROM jobs WHERE status = 'queued' ORDER BY created_at"):
+            if row["type"] in self._types:
+                self._types[row["type"]]["executor"].submit(self._run, row["id"])
+
+    def submit(self, job_type, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute("INSERT INTO jobs (id, type, status, params, created_at, updated_at) "
+                      "VALUES (?, ?, 'queued', ?, ?, ?)", (job_id, job_type, json.dumps(params), now, now))
+        self._types[job_type]["executor"].submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows or rows[0]["status"] != "queued":
+            return
+        row = rows[0]
+        job_type = row["type"]
+        started = time.time()
+        if not self._claim(job_id, started):
+            return
+        with self._metrics_lock:
+            self._waits[job_type].append(started - row["created_at"])
+
+        def progress(state):
+            self._update(job_id, progress=json.dumps(state))
+
+        try:
+            with self._app.app_context(), start_trace(f"job:{job_type}", "JOB"), background_calls():
+                result = self._types[job_type]["func"](json.loads(row["params"]), progress)
+            self._update(job_id, status="succeeded", result=json.dumps(result), finished_at=time.time())
+        except Exception as e:
+            message = str(e) if isinstance(e, (JobError, UpstreamRateLimited)) else f"Server error: {e}"
+            self._update(job_id, status="failed", error=message, finished_at=time.time())
+        finally:
+            with self._metrics_lock:
+                self._runtimes[job_type].append(time.time() - started)
+
+    def get(self, job_id):
+        """Job state as a JSON-ready dict, or None for an unknown id"""
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "id": row["id"],
+            "type": row["type"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    @property
+    def version(self):
+        """Counter bumped on every job update"""
+        return self._version
+
+    def wait_for_change(self, version, timeout):
+        """Block until some job is updated after version was read, or timeout passes"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+
+    def stats(self):
+        counts = {}
+        for row in self._execute("SELECT type, status, COUNT(*) AS n FROM jobs GROUP BY type, status"):
+            counts.setdefault(row["type"], {})[row["status"]] = row["n"]
+        oldest = {row["type"]: row["created_at"] for row in self._execute(
+            "SELECT type, MIN(created_at) AS created_at FROM jobs WHERE status = 'queued' GROUP BY type")}
+
+        def summary(samples):
+            if not samples:
+                return {"avg_ms": None, "p95_ms": None}
+            ordered = sorted(samples)
+            return {"avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 1)}
+
+        result = {}
+        now = time.time()
+        with self._metrics_lock:
+            for job_type, spec in self._types.items():
+                by_status = counts.get(job_type, {})
+                result[job_type] = {
+                    "concurrency": spec["concurrency"],
+                    "queue_depth": by_status.get("queued", 0),
+                    "running": by_status.get("running", 0),
+                    "succeeded": by_status.get("succeeded", 0),
+                    "failed": by_status.get("failed", 0),
+                    "oldest_queued_ms": round((now - oldest[job_type]) * 1000, 1) if job_type in oldest else None,
+                    "wait": summary(self._waits[job_type]),
+                    "runtime": summary(self._runtimes[job_type]),
+                }
+        return result
+
+
+job_queue = JobQueue(JOBS_DB_PATH)
+
+
+def submit_job_response(job_type, params):
+    """202 response for a route that was asked to run as a background job"""
+    job_id = job_queue.submit(job_type, params)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for('job_status', job_id=job_id),
+        "events_url": url_for('job_events', job_id=job_id),
+    }), 202
+
+
+def job_event_stream(job_id):
+    """SSE stream of 'job' events, one per state change, ending when the job finishes"""
+    def generate():
+        last_update = None
+        while True:
+            version = job_queue.version
+            job = job_queue.get(job_id)
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield format_sse('job', job)
+            else:
+                yield ": keepalive\n\n"
+            if job["status"] in FINISHED:
+                return
+            job_queue.wait_for_change(version, 15)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,150 @@
+"""
+Response cache for Claude Messages API calls.
+
+A completion is keyed on a hash of everything that determines it: model,
+system prompt, normalized messages and sampling parameters. Callers with a
+better notion of identity (TestBot keys on a function's qualname and AST
+dump) pass their own key material instead of the messages. Entries expire
+after LLM_CACHE_TTL seconds and the least recently used are evicted past
+LLM_CACHE_ENTRIES.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, has_request_context
+
+from Shared.http_client import anthropic_client, anthropic_headers, ANTHROPIC_API_URL
+from Shared.metrics import record_completion
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 24 * 60 * 60))
+LLM_CACHE_ENTRIES = int(os.getenv("LLM_CACHE_ENTRIES", 2048))
+
+# Request fields besides the prompt that change what the model returns
+SAMPLING_PARAMS = ("max_tokens", "temperature", "top_p", "top_k", "stop_sequences")
+
+
+def _normalize_text(text):
+    """Line endings and trailing whitespace do not change the answer"""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def _normalize_content(content):
+    if isinstance(content, str):
+        return _normalize_text(content)
+    if isinstance(content, list):
+        return [_normalize_content(block) for block in content]
+    if isinstance(content, dict):
+        return {k: _normalize_content(v) for k, v in content.items()}
+    return content
+
+
+def cache_key(payload, key_material=None):
+    """
+    sha256 over model + system + messages + sampling params. key_material,
+    when given, stands in for the messages.
+    """
+    parts = {
+        "model": payload.get("model"),
+        "system": _normalize_content(payload.get("system")),
+        "messages": key_material if key_material is not None
+                    else _normalize_content(payload.get("messages", [])),
+    }
+    for name in SAMPLING_PARAMS:
+        if name in payload:
+            parts[name] = payload[name]
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def cache_bypass(data=None):
+    """True when the JSON body sets no_cache or the request sends Cache-Control: no-cache"""
+    if data and data.get("no_cache"):
+        return True
+    if has_request_context():
+        return "no-cache" in request.headers.get("Cache-Control", "")
+    return False
+
+
+class LLMCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "expired": 0, "evictions": 0,
+                          "input_tokens_saved": 0, "output_tokens_saved": 0}
+
+    def get(self, key):
+        """Stored response body for key, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry["stored_at"] >= self.ttl:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            usage = entry["body"].get("usage", {})
+            self._counters["hits"] += 1
+            self._counters["input_tokens_saved"] += usage.get("input_tokens") or 0
+            self._counters["output_tokens_saved"] += usage.get("output_tokens") or 0
+            return entry["body"]
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = {"body": body, "stored_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def count_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+llm_cache = LLMCache(LLM_CACHE_TTL, LLM_CACHE_ENTRIES)
+
+
+def post_messages(payload, url=None, headers=None, bypass=False, key_material=None, module="unknown", **kwargs):
+    """
+    Parsed body of a Messages API call, served from llm_cache when an
+    identical request was answered before. Hits carry "cached": True.
+    module labels the call in the token metrics.
+    Raises requests.HTTPError when the upstream rejects the request.
+    """
+    key = cache_key(payload, key_material)
+    if bypass:
+        llm_cache.count_bypass()
+    else:
+        body = llm_cache.get(key)
+        if body is not None:
+            record_completion(module, payload.get("model"), body.get("usage"), cached=True)
+            return {**body, "cached": True}
+
+    response = anthropic_client.post(url or ANTHROPIC_API_URL, json=payload,
+                                     headers=headers or anthropic_headers(), **kwargs)
+    response.raise_for_status()
+    body = response.json()
+    record_completion(module, payload.get("model"), body.get("usage"))
+    if body.get("content"):
+        llm_cache.put(key, body)
+    return body
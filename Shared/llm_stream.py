@@ -0,0 +1,127 @@
+"""
+Server-Sent-Events relay for streaming Messages API completions.
+
+The upstream request is sent with ``"stream": true`` and every text delta
+is forwarded to the browser as soon as it arrives, so time-to-first-byte is
+the first-token latency instead of the full completion time.
+"""
+import json
+
+from flask import Response, request, stream_with_context
+
+from Shared.http_client import anthropic_client, anthropic_headers, ANTHROPIC_API_URL
+from Shared.llm_cache import llm_cache, cache_key
+from Shared.metrics import record_completion
+from Shared.tracing import span
+
+
+def wants_stream(data):
+    """True when the JSON body or the Accept header asks for SSE"""
+    if data and data.get('stream'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def iter_message_events(payload, url=None, headers=None):
+    """
+    Yield (event, data) pairs from a streaming Messages API call.
+    Raises requests.HTTPError when the upstream rejects the request.
+    """
+    body = dict(payload, stream=True)
+    response = anthropic_client.post(url or ANTHROPIC_API_URL, json=body,
+                                     headers=headers or anthropic_headers(), stream=True)
+    # Settled with the rate governor when the stream ends; output counts only once message_delta reports them
+    usage = {}
+    try:
+        response.raise_for_status()
+        event = None
+        for raw in response.iter_lines(decode_unicode=True):
+            if not raw:
+                event = None
+                continue
+            if raw.startswith('event:'):
+                event = raw[len('event:'):].strip()
+            elif raw.startswith('data:'):
+                data = json.loads(raw[len('data:'):].strip())
+                if data.get('type') == 'message_start':
+                    usage.update({k: v for k, v in data.get('message', {}).get('usage', {}).items()
+                                  if k != 'output_tokens'})
+                elif data.get('type') == 'message_delta':
+                    usage.update(data.get('usage', {}))
+                yield event or data.get('type'), data
+    finally:
+        response.close()
+        anthropic_client.settle_usage(response, usage)
+
+
+def stream_text(payload, usage, url=None, headers=None):
+    """
+    Yield text deltas of a streaming completion. Token counts are written
+    into the usage dict as 'input_tokens'/'output_tokens' while streaming.
+    """
+    for event, data in iter_message_events(payload, url, headers):
+        if event == 'message_start':
+            usage.update(data.get('message', {}).get('usage', {}))
+        elif event == 'content_block_delta':
+            delta = data.get('delta', {})
+            if delta.get('type') == 'text_delta':
+                yield delta.get('text', '')
+        elif event == 'message_delta':
+            usage.update(data.get('usage', {}))
+        elif event == 'error':
+            raise RuntimeError(data.get('error', {}).get('message', 'Upstream stream error'))
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(payload, on_complete=None, url=None, headers=None, bypass=False, module="unknown"):
+    """
+    Relay a completion to the browser as SSE: 'delta' events carry text,
+    a final 'done' event carries usage (plus anything on_complete(text, usage)
+    returns), and an 'error' event replaces it if the call fails.
+    A cached completion is replayed as a single delta. module labels the
+    call in the token metrics.
+    """
+    key = cache_key(payload)
+
+    def generate():
+        usage = {}
+        parts = []
+        cached = None
+        try:
+            if bypass:
+                llm_cache.count_bypass()
+            else:
+                cached = llm_cache.get(key)
+            if cached is not None:
+                usage.update(cached.get("usage", {}))
+                parts.append(cached["content"][0]["text"])
+                yield format_sse('delta', {'text': parts[0]})
+            else:
+                # Time from the response headers to the last delta
+                with span('llm_stream'):
+                    for text in stream_text(payload, usage, url, headers):
+                        parts.append(text)
+                        yield format_sse('delta', {'text': text})
+            full_text = ''.join(parts)
+            input_tokens = usage.get('input_tokens')
+            output_tokens = usage.get('output_tokens')
+            total_tokens = (input_tokens or 0) + (output_tokens or 0)
+            record_completion(module, payload.get('model'), usage, cached=cached is not None)
+            if cached is None:
+                if full_text:
+                    llm_cache.put(key, {'content': [{'type': 'text', 'text': full_text}],
+                                        'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens}})
+            done = {'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                              'total_tokens': total_tokens},
+                    'cached': cached is not None}
+            if on_complete:
+                done.update(on_complete(full_text, done['usage']) or {})
+            yield format_sse('done', done)
+        except Exception as e:
+            yield format_sse('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,169 @@
+"""
+In-process metrics in the Prometheus text exposition format, served at /metrics.
+
+Counters and histograms are plain dicts keyed by label values behind one
+lock each, so recording costs a dict lookup and a few additions. Cache hit
+ratios and similar point-in-time values are read from the existing stats()
+methods by collectors at scrape time rather than tracked twice.
+"""
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+# Seconds; covers fast cache hits up to long LLM calls and pytest runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {round(total, 6)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name, help_text, labelnames, collect):
+        """
+        Gauge computed at scrape time: collect() returns [(label values tuple, value), ...].
+        Registering a name again replaces the earlier collector (one per app created).
+        """
+        self._collectors = [c for c in self._collectors if c[0] != name]
+        self._collectors.append((name, help_text, tuple(labelnames), collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, labelnames, collect in self._collectors:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge"])
+            try:
+                samples = collect()
+            except Exception:
+                continue
+            for values, value in samples:
+                lines.append(f"{name}{_labels(labelnames, values)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "metricpage_http_request_duration_seconds",
+    "Time to produce a response per route (streamed bodies: time to the first byte)",
+    ("route", "method", "status"))
+upstream_request_duration = registry.histogram(
+    "metricpage_upstream_request_duration_seconds",
+    "Latency of calls to GitHub, Anthropic and the pytest sandbox", ("upstream",))
+upstream_requests = registry.counter(
+    "metricpage_upstream_requests_total",
+    "Calls to GitHub, Anthropic and the pytest sandbox by outcome", ("upstream", "status"))
+llm_tokens = registry.counter(
+    "metricpage_llm_tokens_total",
+    "Anthropic tokens billed, by module, model and direction", ("module", "model", "direction"))
+llm_requests = registry.counter(
+    "metricpage_llm_requests_total",
+    "Messages API completions by module and model, cached ones included", ("module", "model", "cached"))
+
+
+def observe_upstream(upstream, status, seconds):
+    upstream_request_duration.observe(seconds, upstream=upstream)
+    upstream_requests.inc(upstream=upstream, status=status)
+
+
+def record_completion(module, model, usage, cached=False):
+    """Count one completion; tokens only when it was billed (not served from cache)"""
+    llm_requests.inc(module=module, model=model or "unknown", cached=str(bool(cached)).lower())
+    if cached or not usage:
+        return
+    for direction in ("input", "output"):
+        tokens = usage.get(f"{direction}_tokens")
+        if tokens:
+            llm_tokens.inc(tokens, module=module, model=model or "unknown", direction=direction)
+
+
+def init_app(app):
+    """Time every request by its route rule"""
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, route=route,
+                                          method=request.method, status=response.status_code)
+        return response
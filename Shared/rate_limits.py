@@ -0,0 +1,285 @@
+"""
+Rate-limit governor shared by every upstream call.
+
+Each (upstream, credential) pair gets a budget: token buckets for requests
+and for estimated input/output tokens, plus the remaining/reset values the
+upstream last reported in its rate-limit headers. Calls are admitted when
+the budget covers them, queued (slept) when it will within
+RATE_LIMIT_MAX_WAIT, and shed with UpstreamRateLimited otherwise, so users
+get a "retry in N seconds" answer instead of a raw 403/429. Token costs are
+estimates (an LLM call is charged its max_tokens); the part a call did not
+use is refunded once its response reports the real usage. Bulk work
+(background jobs, whole-commit indexing) runs inside background_calls(): it
+queues for up to RATE_LIMIT_BACKGROUND_MAX_WAIT instead and stops short of
+the last GITHUB_RATE_RESERVE GitHub calls, which are left to interactive
+requests.
+"""
+import contextvars
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Longest a call may be queued before it is shed
+RATE_LIMIT_MAX_WAIT = _env_float("RATE_LIMIT_MAX_WAIT", 10)
+# Longest a background call may be queued; long enough for GitHub's hourly quota to reset
+RATE_LIMIT_BACKGROUND_MAX_WAIT = _env_float("RATE_LIMIT_BACKGROUND_MAX_WAIT", 3600)
+# GitHub calls per credential that background work leaves to interactive requests
+GITHUB_RATE_RESERVE = _env_float("GITHUB_RATE_RESERVE", 20)
+# Per-minute bucket rates; 0 disables a bucket. Limits reported by the
+# upstream replace these after the first response.
+BUCKET_RATES = {
+    "github": {"requests": _env_float("GITHUB_RPM", 0)},
+    "anthropic": {
+        "requests": _env_float("ANTHROPIC_RPM", 50),
+        "input_tokens": _env_float("ANTHROPIC_INPUT_TPM", 40000),
+        "output_tokens": _env_float("ANTHROPIC_OUTPUT_TPM", 8000),
+    },
+}
+
+# anthropic-ratelimit-<name>-{limit,remaining,reset} -> bucket
+ANTHROPIC_HEADER_BUCKETS = {"requests": "requests", "input-tokens": "input_tokens",
+                            "output-tokens": "output_tokens"}
+
+
+_background = contextvars.ContextVar("rate_limit_background", default=False)
+
+
+@contextmanager
+def background_calls():
+    """Mark the upstream calls made inside (and in threads started with tracing.propagate) as bulk work"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class UpstreamRateLimited(Exception):
+    """A call was shed because the upstream budget will not cover it soon enough"""
+
+    def __init__(self, upstream, retry_after, reason):
+        self.upstream = upstream
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.reason = reason
+        label = {"github": "GitHub", "anthropic": "Anthropic"}.get(upstream, upstream)
+        super().__init__(f"{label} rate limit reached ({reason}); retry in {self.retry_after}s")
+
+
+def credential_id(headers):
+    """Short stable id for the credential in headers; the secret itself is never kept"""
+    headers = headers or {}
+    secret = headers.get("Authorization") or headers.get("x-api-key")
+    if not secret:
+        return "anonymous"
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:12]
+
+
+class TokenBucket:
+    """
+    per_minute: float, refill rate
+    capacity: float, burst size (defaults to one minute of refill)
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.per_minute = per_minute
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount (capped at capacity) is available"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / self.per_minute) if missing > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount, now):
+        """Return amount to the bucket (a negative amount takes more)"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, remaining, limit=None):
+        """Adopt what the upstream reports: its limit as the rate, its remaining as a ceiling"""
+        if limit:
+            self.per_minute = self.capacity = limit
+        self.level = min(self.level, remaining)
+
+    def snapshot(self):
+        self._refill(time.monotonic())
+        return {"per_minute": self.per_minute, "capacity": self.capacity, "available": round(self.level, 1)}
+
+
+class UpstreamBudget:
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.buckets = {name: TokenBucket(rate) for name, rate in BUCKET_RATES.get(upstream, {}).items() if rate}
+        # GitHub: resource -> {'limit', 'remaining', 'reset_at'} (reset_at is wall-clock epoch)
+        self.resources = {}
+        self.blocked_until = 0.0
+        self.counters = {"admitted": 0, "queued": 0, "shed": 0, "limited_responses": 0, "waited_seconds": 0.0,
+                         "refunded_tokens": 0}
+        self.waiting = 0
+
+    def wait_time(self, cost, resource, now, reserve=0):
+        """(seconds until cost fits, reason) or (0, None); reserve is the quota kept back from this call"""
+        waits = [(self.blocked_until - now, "retry-after")]
+        for name, bucket in self.buckets.items():
+            if cost.get(name):
+                waits.append((bucket.wait_time(cost[name], now), name.replace("_", " ")))
+        state = self.resources.get(resource)
+        if state and state["remaining"] <= reserve:
+            waits.append((state["reset_at"] - time.time(), f"{resource} quota"))
+        wait, reason = max(waits, key=lambda w: w[0])
+        return (wait, reason) if wait > 0 else (0.0, None)
+
+
+class RateGovernor:
+    """
+    max_wait: float, longest an interactive call is queued before it is shed
+    background_max_wait: float, the same inside background_calls() (defaults to max_wait)
+    """
+
+    def __init__(self, max_wait, background_max_wait=None):
+        self.max_wait = max_wait
+        self.background_max_wait = max_wait if background_max_wait is None else background_max_wait
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, upstream, credential):
+        key = (upstream, credential)
+        if key not in self._budgets:
+            self._budgets[key] = UpstreamBudget(upstream)
+        return self._budgets[key]
+
+    def admit(self, upstream, credential, cost=None, resource="core"):
+        """
+        Block until cost ({'requests': 1, 'input_tokens': n, ...}) fits the
+        budget, then take it. Inside background_calls() the quota reserve is
+        off limits too and the call may wait up to background_max_wait.
+        Raises UpstreamRateLimited when that would take longer than
+        max_wait.
+        """
+        cost = cost or {"requests": 1}
+        background = _background.get()
+        reserve = GITHUB_RATE_RESERVE if background else 0
+        deadline = time.monotonic() + (self.background_max_wait if background else self.max_wait)
+        queued = False
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                budget = self._budget(upstream, credential)
+                now = time.monotonic()
+                wait, reason = budget.wait_time(cost, resource, now, reserve)
+                if wait == 0:
+                    for name, bucket in budget.buckets.items():
+                        bucket.take(cost.get(name, 0))
+                    if resource in budget.resources:
+                        # Count the call now; the response headers correct it
+                        budget.resources[resource]["remaining"] -= 1
+                    budget.counters["admitted"] += 1
+                    if queued:
+                        budget.waiting -= 1
+                        budget.counters["waited_seconds"] += now - started
+                    return
+                if now + wait > deadline:
+                    if queued:
+                        budget.waiting -= 1
+                    budget.counters["shed"] += 1
+                    raise UpstreamRateLimited(upstream, wait, reason)
+                if not queued:
+                    queued = True
+                    budget.waiting += 1
+                    budget.counters["queued"] += 1
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, upstream, credential, charged, used):
+        """
+        Settle the estimated cost admit() charged a call against what it
+        used ({'input_tokens': n, 'output_tokens': n}, from the response):
+        unused tokens go back to their bucket, an underestimate is taken.
+        """
+        with self._lock:
+            budget = self._budget(upstream, credential)
+            now = time.monotonic()
+            for name, amount in used.items():
+                bucket = budget.buckets.get(name)
+                if bucket is None or name not in charged:
+                    continue
+                difference = min(charged[name], bucket.capacity) - amount
+                bucket.give(difference, now)
+                budget.counters["refunded_tokens"] += int(max(0, difference))
+
+    def observe(self, upstream, credential, response):
+        """Fold the rate-limit headers of a response into the budget"""
+        headers = response.headers
+        with self._lock:
+            budget = self._budget(upstream, credential)
+            if response.status_code == 429 or (response.status_code == 403 and
+                                               headers.get("X-RateLimit-Remaining") == "0"):
+                budget.counters["limited_responses"] += 1
+                retry_after = headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    budget.blocked_until = max(budget.blocked_until, time.monotonic() + float(retry_after))
+
+            if upstream == "github" and headers.get("X-RateLimit-Remaining") is not None:
+                try:
+                    budget.resources[headers.get("X-RateLimit-Resource", "core")] = {
+                        "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                        "remaining": int(headers["X-RateLimit-Remaining"]),
+                        "reset_at": float(headers.get("X-RateLimit-Reset", 0)),
+                    }
+                except ValueError:
+                    pass
+
+            if upstream == "anthropic":
+                for prefix, name in ANTHROPIC_HEADER_BUCKETS.items():
+                    remaining = headers.get(f"anthropic-ratelimit-{prefix}-remaining")
+                    if remaining is None:
+                        continue
+                    limit = headers.get(f"anthropic-ratelimit-{prefix}-limit")
+                    try:
+                        remaining, limit = float(remaining), float(limit) if limit else None
+                    except ValueError:
+                        continue
+                    bucket = budget.buckets.get(name)
+                    if bucket is None:
+                        bucket = budget.buckets[name] = TokenBucket(limit or remaining)
+                    bucket.sync(remaining, limit)
+
+    def stats(self):
+        """Current headroom per upstream and credential, for dashboards"""
+        result = {}
+        now = time.time()
+        with self._lock:
+            for (upstream, credential), budget in self._budgets.items():
+                result.setdefault(upstream, {})[credential] = {
+                    **budget.counters,
+                    "waited_seconds": round(budget.counters["waited_seconds"], 2),
+                    "waiting": budget.waiting,
+                    "blocked_for": round(max(0.0, budget.blocked_until - time.monotonic()), 1),
+                    "buckets": {name: bucket.snapshot() for name, bucket in budget.buckets.items()},
+                    "quotas": {resource: {"limit": state["limit"], "remaining": state["remaining"],
+                                          "resets_in": round(max(0.0, state["reset_at"] - now), 1)}
+                               for resource, state in budget.resources.items()},
+                }
+        return {"max_wait": self.max_wait, "background_max_wait": self.background_max_wait,
+                "github_reserve": GITHUB_RATE_RESERVE, "upstreams": result}
+
+
+governor = RateGovernor(RATE_LIMIT_MAX_WAIT, RATE_LIMIT_BACKGROUND_MAX_WAIT)
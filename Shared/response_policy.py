@@ -0,0 +1,158 @@
+"""
+Cache and compression policy for every response.
+
+Routes fall into three classes instead of one blanket no-store rule:
+- immutable: fingerprinted static files (url_for adds ?v=<content hash>)
+- revalidate: pages and GET JSON; a strong ETag lets the browser reuse its
+  copy after a 304 instead of downloading it again
+- no-store: LLM output, job progress and anything that is not a GET
+
+A view can pick its class with @cache_policy(NO_STORE). Static pages are
+rendered once per process by static_page(), with their ETag and gzip body
+kept alongside. Buffered JSON, HTML and text bodies past GZIP_MIN_BYTES are
+gzipped for clients that accept it; streamed bodies (SSE, NDJSON) never are.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import current_app, request, render_template, Response
+
+# Bodies smaller than this go out uncompressed; gzip's overhead is not worth it
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+NO_STORE = "no-store"
+
+COMPRESSIBLE = ("application/json", "text/html", "text/plain", "text/css", "application/javascript",
+                "image/svg+xml")
+
+
+def cache_policy(value):
+    """Decorator: send value as the view's Cache-Control instead of the default for its class"""
+    def decorate(view):
+        view.cache_policy = value
+        return view
+    return decorate
+
+
+def strong_etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _wants_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+
+class PageCache:
+    """Rendered static templates per app: (body, gzipped body, etag)"""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_name):
+        key = (id(current_app._get_current_object()), template_name)
+        with self._lock:
+            page = self._pages.get(key)
+        if page is None:
+            body = render_template(template_name).encode("utf-8")
+            page = (body, gzip.compress(body, GZIP_LEVEL), strong_etag(body))
+            # Debug mode re-renders every time so template edits show up
+            if not current_app.debug:
+                with self._lock:
+                    self._pages[key] = page
+        return page
+
+
+page_cache = PageCache()
+
+
+def static_page(template_name):
+    """Response for a template that takes no request data, rendered once and served with an ETag"""
+    body, compressed, etag = page_cache.get(template_name)
+    if _wants_gzip():
+        response = Response(compressed, mimetype="text/html")
+        response.headers["Content-Encoding"] = "gzip"
+        etag += "-gzip"
+    else:
+        response = Response(body, mimetype="text/html")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(etag)
+    response.cache_control_policy = REVALIDATE
+    return response.make_conditional(request)
+
+
+_static_versions = {}
+
+
+def static_version(app, filename):
+    """Short content hash of a static file, or None when it does not exist"""
+    path = os.path.join(app.static_folder or "", filename)
+    if path not in _static_versions:
+        try:
+            with open(path, "rb") as f:
+                _static_versions[path] = strong_etag(f.read())[:12]
+        except OSError:
+            return None
+    return _static_versions[path]
+
+
+def _policy_for(response):
+    # Static files are sent as file-wrapper (streamed) responses too
+    if request.endpoint == "static":
+        return IMMUTABLE if request.args.get("v") else REVALIDATE
+    if response.is_streamed:
+        return NO_STORE
+    explicit = getattr(response, "cache_control_policy", None)
+    if explicit:
+        return explicit
+    view = current_app.view_functions.get(request.endpoint)
+    if view is not None and getattr(view, "cache_policy", None):
+        return view.cache_policy
+    if request.method not in ("GET", "HEAD"):
+        return NO_STORE
+    return REVALIDATE
+
+
+def finish_response(response):
+    """Set Cache-Control, then ETag/304 and gzip for buffered GET bodies"""
+    policy = _policy_for(response)
+    response.headers["Cache-Control"] = policy
+    if policy == NO_STORE:
+        response.headers.pop("ETag", None)
+        response.headers["Pragma"] = "no-cache"
+
+    if (response.is_streamed or response.direct_passthrough or response.status_code != 200
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE):
+        return response
+    body = response.get_data()
+    compress = len(body) >= GZIP_MIN_BYTES and _wants_gzip()
+    if len(body) >= GZIP_MIN_BYTES:
+        response.headers["Vary"] = "Accept-Encoding"
+
+    if policy != NO_STORE and request.method in ("GET", "HEAD"):
+        etag = strong_etag(body) + ("-gzip" if compress else "")
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            return response.make_conditional(request)
+
+    if compress:
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_app(app):
+    """Apply the policy to every response and fingerprint static URLs"""
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            version = static_version(app, values["filename"])
+            if version:
+                values["v"] = version
+
+    app.after_request(finish_response)
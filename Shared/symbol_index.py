@@ -0,0 +1,395 @@
+"""
+Persistent index of the Python symbols in a repository commit.
+
+Every function, async function, class and method is recorded with its
+qualified name, signature, line span, docstring presence and a hash of its
+AST, so "which symbols lack docstrings / tests" is a query instead of a
+re-fetch and re-parse. Symbols are stored per blob SHA in a local SQLite
+file: a new commit only parses the files it changed, and pasted code that
+matches a repository file (same git blob hash) reuses the same entries.
+Other pasted code is parsed in memory and kept in a small LRU, never on disk.
+"""
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from Shared.github_tree import resolve_commit_sha, get_tree, filter_files, EXCLUDED_DIRS, GitHubError
+from Shared.blob_cache import get_blob, prefetch_blobs
+from Shared.rate_limits import background_calls
+from Shared.tracing import span, propagate
+
+SYMBOL_INDEX_DB_PATH = os.getenv(
+    "SYMBOL_INDEX_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "symbols.sqlite3"),
+)
+# Concurrent blob fetches while indexing a commit
+SYMBOL_INDEX_FETCH_CONCURRENCY = int(os.getenv("SYMBOL_INDEX_FETCH_CONCURRENCY", 8))
+# Parsed pasted sources kept in memory
+SYMBOL_SOURCE_CACHE_ENTRIES = int(os.getenv("SYMBOL_SOURCE_CACHE_ENTRIES", 256))
+
+# Test files are indexed too; their references answer "which symbols lack tests"
+INDEX_EXCLUDED_DIRS = EXCLUDED_DIRS - {'tests'}
+
+FUNCTION_KINDS = ('function', 'async_function', 'method', 'async_method')
+
+# Some CPython 3.11 releases keep the AST conversion depth in interpreter-wide
+# state, so two index threads parsing at once can fail with a SystemError
+_parse_lock = threading.Lock()
+
+
+def git_blob_sha(data):
+    """The SHA git (and GitHub) gives a blob with these bytes"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def is_test_file(path):
+    name = path.rsplit('/', 1)[-1]
+    return name.startswith('test_') or name.endswith('_test.py') or name == 'conftest.py'
+
+
+def _parse(source):
+    with _parse_lock:
+        return ast.parse(source)
+
+
+def _signature(node):
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def extract_symbols(source):
+    """
+    Symbols of one Python source, in source order. Each is a dict with
+    qualname, name, kind, signature, decorators, lineno, end_lineno,
+    col_offset, body_lineno, has_docstring, doc (first docstring line) and
+    body_hash (sha256 of the AST dump, so formatting-only edits keep it).
+    Raises SyntaxError for code that does not parse.
+    """
+    symbols = []
+
+    def visit(body, prefix, in_class):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                is_async = isinstance(node, ast.AsyncFunctionDef)
+                kind = ('async_method' if is_async else 'method') if in_class else \
+                       ('async_function' if is_async else 'function')
+                signature = _signature(node)
+            elif isinstance(node, ast.ClassDef):
+                kind = 'class'
+                bases = ", ".join(ast.unparse(b) for b in node.bases)
+                signature = f"class {node.name}({bases})" if bases else f"class {node.name}"
+            else:
+                continue
+            qualname = f"{prefix}{node.name}"
+            doc = ast.get_docstring(node)
+            symbols.append({
+                'qualname': qualname,
+                'name': node.name,
+                'kind': kind,
+                'signature': signature,
+                'decorators': [ast.unparse(d) for d in node.decorator_list],
+                # The span starts at the first decorator
+                'lineno': node.decorator_list[0].lineno if node.decorator_list else node.lineno,
+                'end_lineno': node.end_lineno,
+                'col_offset': node.col_offset,
+                # Where a docstring would go: above any decorator of the first statement
+                'body_lineno': min([node.body[0].lineno] + [d.lineno for d in getattr(node.body[0], 'decorator_list', [])]),
+                'has_docstring': doc is not None,
+                'doc': doc.strip().splitlines()[0] if doc and doc.strip() else None,
+                'body_hash': hashlib.sha256(ast.dump(node).encode()).hexdigest(),
+            })
+            if kind == 'class':
+                visit(node.body, f"{qualname}.", True)
+            else:
+                visit(node.body, f"{qualname}.<locals>.", False)
+
+    visit(_parse(source).body, "", False)
+    return symbols
+
+
+def extract_references(source):
+    """Identifiers source uses: names, attributes and imported names"""
+    names = set()
+    for node in ast.walk(_parse(source)):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+        elif isinstance(node, ast.alias):
+            names.add(node.name.rsplit('.', 1)[-1])
+    return names
+
+
+class SymbolIndex:
+    def __init__(self, db_path, source_cache_entries=SYMBOL_SOURCE_CACHE_ENTRIES):
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.source_cache_entries = source_cache_entries
+        self._sources = OrderedDict()
+        # One build per commit at a time; concurrent callers wait for it
+        self._building = {}
+        self._building_lock = threading.Lock()
+        self._counters = {"blobs_parsed": 0, "blob_hits": 0, "commits_indexed": 0, "commit_hits": 0,
+                          "fetch_failures": 0, "sources_parsed": 0, "source_hits": 0}
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    blob_sha TEXT PRIMARY KEY,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS symbols (
+                    blob_sha TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (blob_sha, position)
+                );
+                CREATE TABLE IF NOT EXISTS refs (
+                    blob_sha TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    PRIMARY KEY (blob_sha, name)
+                );
+                CREATE TABLE IF NOT EXISTS commit_files (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    blob_sha TEXT NOT NULL,
+                    PRIMARY KEY (owner, repo, commit_sha, path)
+                );
+                CREATE TABLE IF NOT EXISTS commits (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    PRIMARY KEY (owner, repo, commit_sha)
+                );""")
+            self._db = db
+        return self._db
+
+    def _query(self, sql, args=()):
+        with self._db_lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def _has_blob(self, blob_sha):
+        return bool(self._query("SELECT 1 FROM blobs WHERE blob_sha = ?", (blob_sha,)))
+
+    def _store_blob(self, blob_sha, source):
+        """Parse source and persist its symbols and referenced names; None when it does not parse"""
+        try:
+            with span('ast', blob=blob_sha[:7]):
+                symbols = extract_symbols(source)
+                refs = extract_references(source)
+            error = None
+        except SyntaxError as e:
+            symbols, refs, error = None, set(), f"SyntaxError: {e}"
+        with self._db_lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO blobs (blob_sha, error) VALUES (?, ?)", (blob_sha, error))
+            db.execute("DELETE FROM symbols WHERE blob_sha = ?", (blob_sha,))
+            db.executemany("INSERT INTO symbols (blob_sha, position, data) VALUES (?, ?, ?)",
+                           [(blob_sha, i, json.dumps(s)) for i, s in enumerate(symbols or [])])
+            db.executemany("INSERT OR IGNORE INTO refs (blob_sha, name) VALUES (?, ?)",
+                           [(blob_sha, name) for name in refs])
+            db.commit()
+            self._counters["blobs_parsed"] += 1
+        return symbols
+
+    def _blob_symbols(self, blob_sha):
+        rows = self._query("SELECT data FROM symbols WHERE blob_sha = ? ORDER BY position", (blob_sha,))
+        return [json.loads(row["data"]) for row in rows]
+
+    def symbols_for_source(self, source):
+        """
+        Symbols of source code not tied to a repository (e.g. pasted code).
+        Raises SyntaxError for code that does not parse.
+        """
+        blob_sha = git_blob_sha(source.encode('utf-8'))
+        with self._db_lock:
+            cached = self._sources.get(blob_sha)
+            if cached is not None:
+                self._sources.move_to_end(blob_sha)
+                self._counters["source_hits"] += 1
+        if cached is None:
+            rows = self._query("SELECT error FROM blobs WHERE blob_sha = ?", (blob_sha,))
+            if rows and not rows[0]["error"]:
+                # Same bytes as a repository file that is already indexed
+                with self._db_lock:
+                    self._counters["blob_hits"] += 1
+                return self._blob_symbols(blob_sha)
+            with span('ast', blob=blob_sha[:7]):
+                cached = extract_symbols(source)
+            with self._db_lock:
+                self._counters["sources_parsed"] += 1
+                self._sources[blob_sha] = cached
+                while len(self._sources) > self.source_cache_entries:
+                    self._sources.popitem(last=False)
+        return cached
+
+    def _index_blob(self, username, repo, path, blob_sha, headers):
+        """
+        Fetch and store blob_sha unless it is indexed already.
+        Returns False when the fetch failed and a later call should retry it;
+        files that are not UTF-8 are skipped for good.
+        """
+        if self._has_blob(blob_sha):
+            with self._db_lock:
+                self._counters["blob_hits"] += 1
+            return True
+        try:
+            data = get_blob(username, repo, blob_sha, headers)
+        except GitHubError:
+            with self._db_lock:
+                self._counters["fetch_failures"] += 1
+            return False
+        try:
+            with span('decode', path=path, bytes=len(data)):
+                source = data.decode('utf-8')
+        except UnicodeDecodeError:
+            return True
+        self._store_blob(blob_sha, source)
+        return True
+
+    def _index_blobs(self, username, repo, commit_sha, blob_shas, headers):
+        """Index {path: blob_sha} concurrently; returns the paths whose fetch failed"""
+        # One batch read for the git mirror backend; a no-op for REST
+        prefetch_blobs(username, repo, commit_sha,
+                       [sha for sha in blob_shas.values() if not self._has_blob(sha)], headers)
+
+        def index_file(path):
+            return self._index_blob(username, repo, path, blob_shas[path], headers)
+
+        with ThreadPoolExecutor(max_workers=SYMBOL_INDEX_FETCH_CONCURRENCY) as executor:
+            indexed = list(executor.map(propagate(index_file), blob_shas))
+        return [path for path, ok in zip(blob_shas, indexed) if not ok]
+
+    def symbols_for_blobs(self, username, repo, commit_sha, blob_shas, headers=None):
+        """
+        Symbols of just the given files, without indexing the whole commit.
+        blob_shas maps path -> blob SHA; files that cannot be fetched or
+        parsed are left out of the result.
+        Returns: {path: [symbol, ...]}
+        """
+        self._index_blobs(username, repo, commit_sha, blob_shas, headers)
+        files = {}
+        for path, blob_sha in blob_shas.items():
+            rows = self._query("SELECT error FROM blobs WHERE blob_sha = ?", (blob_sha,))
+            if rows and not rows[0]["error"]:
+                files[path] = self._blob_symbols(blob_sha)
+        return files
+
+    def index_commit(self, username, repo, ref, headers=None):
+        """
+        Make sure the commit ref resolves to is indexed; returns its SHA.
+        Only blobs not seen before are fetched and parsed.
+        """
+        commit_sha = resolve_commit_sha(username, repo, ref, headers)
+        key = (username.lower(), repo.lower(), commit_sha)
+        if self._query("SELECT 1 FROM commits WHERE owner = ? AND repo = ? AND commit_sha = ?", key):
+            with self._db_lock:
+                self._counters["commit_hits"] += 1
+            return commit_sha
+
+        with self._building_lock:
+            event = self._building.get(key)
+            owner = event is None
+            if owner:
+                event = self._building[key] = threading.Event()
+        if not owner:
+            event.wait()
+            return self.index_commit(username, repo, commit_sha, headers)
+
+        try:
+            # Fetching a whole commit is bulk work; it leaves the quota reserve to interactive calls
+            with background_calls():
+                entries = get_tree(username, repo, commit_sha, headers)
+                blob_shas = {entry['path']: entry['sha'] for entry in entries if entry['type'] == 'blob'}
+                paths = filter_files(entries, lambda name: name.endswith('.py'), INDEX_EXCLUDED_DIRS)
+                failed = self._index_blobs(username, repo, commit_sha,
+                                           {path: blob_shas[path] for path in paths}, headers)
+
+            with self._db_lock:
+                db = self._connect()
+                db.executemany("INSERT OR REPLACE INTO commit_files (owner, repo, commit_sha, path, blob_sha) "
+                               "VALUES (?, ?, ?, ?, ?)", [(*key, path, blob_shas[path]) for path in paths])
+                # A commit with files that failed to fetch stays unindexed, so the next call retries them
+                if not failed:
+                    db.execute("INSERT OR REPLACE INTO commits (owner, repo, commit_sha, indexed_at) "
+                               "VALUES (?, ?, ?, ?)", (*key, time.time()))
+                    self._counters["commits_indexed"] += 1
+                db.commit()
+        finally:
+            with self._building_lock:
+                self._building.pop(key, None)
+            event.set()
+        return commit_sha
+
+    def file_symbols(self, username, repo, ref, headers=None):
+        """
+        Map path -> symbols for every indexed Python file at ref (built on first use).
+        Returns: (commit_sha, {path: [symbol, ...]})
+        """
+        commit_sha = self.index_commit(username, repo, ref, headers)
+        rows = self._query(
+            "SELECT f.path, s.data FROM commit_files f JOIN symbols s ON s.blob_sha = f.blob_sha "
+            "WHERE f.owner = ? AND f.repo = ? AND f.commit_sha = ? ORDER BY f.path, s.position",
+            (username.lower(), repo.lower(), commit_sha))
+        files = {}
+        for row in rows:
+            files.setdefault(row["path"], []).append(json.loads(row["data"]))
+        return commit_sha, files
+
+    def query(self, username, repo, ref, headers=None, path=None, kinds=None,
+              missing_docstring=False, untested=False):
+        """
+        Symbols at ref, each with its path, filtered by path prefix, kinds,
+        missing docstrings, and functions/methods no test file references.
+        Returns: (commit_sha, [symbol, ...])
+        """
+        commit_sha, files = self.file_symbols(username, repo, ref, headers)
+        tested = set()
+        if untested:
+            rows = self._query(
+                "SELECT f.path, r.name FROM commit_files f JOIN refs r ON r.blob_sha = f.blob_sha "
+                "WHERE f.owner = ? AND f.repo = ? AND f.commit_sha = ?",
+                (username.lower(), repo.lower(), commit_sha))
+            tested = {row["name"] for row in rows if is_test_file(row["path"])}
+        results = []
+        for file_path, symbols in files.items():
+            if path and not file_path.startswith(path):
+                continue
+            if untested and is_test_file(file_path):
+                continue
+            for symbol in symbols:
+                if kinds and symbol['kind'] not in kinds:
+                    continue
+                if missing_docstring and symbol['has_docstring']:
+                    continue
+                if untested and (symbol['kind'] not in FUNCTION_KINDS or symbol['name'] in tested
+                                 or '<locals>' in symbol['qualname']):
+                    continue
+                results.append({'path': file_path, **symbol})
+        return commit_sha, results
+
+    def stats(self):
+        counts = {table: self._query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+                  for table in ("commits", "blobs", "symbols")}
+        with self._db_lock:
+            return {**self._counters, "commits": counts["commits"], "blobs": counts["blobs"],
+                    "symbols": counts["symbols"], "cached_sources": len(self._sources)}
+
+
+symbol_index = SymbolIndex(SYMBOL_INDEX_DB_PATH)
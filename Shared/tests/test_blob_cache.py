@@ -0,0 +1,89 @@
+import hashlib
+
+import pytest
+
+from Shared import blob_cache as blob_cache_module
+from Shared.blob_cache import BlobCache, get_blob
+
+
+def sha(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def test_memory_evictions_spill_to_disk_and_come_back(tmp_path):
+    cache = BlobCache(memory_bytes=10, disk_bytes=100, directory=str(tmp_path))
+    a, b = b"aaaaaa", b"bbbbbb"
+    cache.put(sha(a), a)
+    cache.put(sha(b), b)  # pushes a out of memory
+
+    assert cache.stats()["memory_entries"] == 1
+    assert (tmp_path / sha(a)[:2] / sha(a)[2:]).read_bytes() == a
+    assert cache.get(sha(a)) == a
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["memory_evictions"]) == (1, 0, 2)
+
+
+def test_least_recently_used_goes_first(tmp_path):
+    cache = BlobCache(memory_bytes=12, disk_bytes=0, directory=str(tmp_path))
+    a, b, c = b"aaaa", b"bbbb", b"cccc"
+    for data in (a, b, c):
+        cache.put(sha(data), data)
+    cache.get(sha(a))
+    cache.put(sha(b"dddd"), b"dddd")
+
+    assert cache.get(sha(b)) is None
+    assert cache.get(sha(a)) == a
+    assert cache.get(sha(c)) == c
+
+
+def test_disk_tier_is_bounded_and_survives_restarts(tmp_path):
+    cache = BlobCache(memory_bytes=1, disk_bytes=8, directory=str(tmp_path))
+    first, second, third = b"1111", b"2222", b"3333"
+    for data in (first, second, third):
+        cache.put(sha(data), data)  # larger than memory: straight to disk
+
+    assert cache.stats()["disk_bytes"] == 8
+    assert cache.get(sha(first)) is None
+
+    reopened = BlobCache(memory_bytes=100, disk_bytes=8, directory=str(tmp_path))
+    assert reopened.get(sha(third)) == third
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_hit_ratio_counts_both_tiers(tmp_path):
+    cache = BlobCache(memory_bytes=100, disk_bytes=0, directory=str(tmp_path))
+    cache.put("x", b"x")
+    cache.get("x")
+    cache.get("y")
+
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch, tmp_path):
+    cache = BlobCache(memory_bytes=1024, disk_bytes=0, directory=str(tmp_path))
+    monkeypatch.setattr(blob_cache_module, "blob_cache", cache)
+    monkeypatch.setattr(blob_cache_module.config, "GIT_MIRROR", False)
+    return cache
+
+
+def test_get_blob_downloads_each_sha_once(fresh_cache, monkeypatch):
+    calls = []
+
+    class FakeGitHub:
+        def get(self, url, headers=None):
+            calls.append((url, headers["Accept"]))
+            return FakeResponse(b"print(1)\n")
+
+    monkeypatch.setattr(blob_cache_module, "github_client", FakeGitHub())
+
+    assert get_blob("o", "r", "abc") == b"print(1)\n"
+    assert get_blob("o", "r", "abc") == b"print(1)\n"
+    assert calls == [("http://127.0.0.1:9/repos/o/r/git/blobs/abc", "application/vnd.github.raw")]
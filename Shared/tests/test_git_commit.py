@@ -0,0 +1,139 @@
+import pytest
+
+from Shared import git_commit
+from Shared.git_commit import commit_files
+from Shared.github_tree import GitHubError
+from Shared.symbol_index import git_blob_sha
+
+REPO = "http://127.0.0.1:9/repos/o/r"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+        self.text = ""
+
+    def json(self):
+        return self._body
+
+
+class FakeRepo:
+    """
+    Just enough of the Git Data API: commits map to {path: blob sha}, and
+    pushes queues commits someone else lands right before our ref update.
+    """
+
+    def __init__(self, files):
+        self.commits = {"base": dict(files)}
+        self.head = "base"
+        self.pushes = []
+        self.calls = []
+        self.pending_trees = {}
+
+    def entries(self, username, repo, commit_sha, headers=None):
+        return [{"path": path, "type": "blob", "sha": sha, "mode": "100755" if path.endswith(".sh") else "100644"}
+                for path, sha in self.commits[commit_sha].items()]
+
+    def get(self, url, headers=None):
+        self.calls.append(("GET", url))
+        if url == f"{REPO}/git/ref/heads/main":
+            return FakeResponse(200, {"object": {"sha": self.head}})
+        if url.startswith(f"{REPO}/git/commits/"):
+            return FakeResponse(200, {"tree": {"sha": "tree:" + url.rsplit("/", 1)[1]}})
+        return FakeResponse(404, {"message": "Not Found"})
+
+    def post(self, url, json=None, headers=None):
+        self.calls.append(("POST", url))
+        if url == f"{REPO}/git/blobs":
+            return FakeResponse(201, {"sha": git_blob_sha(json["content"].encode())})
+        if url == f"{REPO}/git/trees":
+            files = dict(self.commits[json["base_tree"][len("tree:"):]])
+            for entry in json["tree"]:
+                if entry["sha"] is None:
+                    files.pop(entry["path"], None)
+                else:
+                    files[entry["path"]] = entry["sha"]
+            tree_sha = f"tree{len(self.pending_trees)}"
+            self.pending_trees[tree_sha] = (files, json["tree"])
+            return FakeResponse(201, {"sha": tree_sha})
+        if url == f"{REPO}/git/commits":
+            commit_sha = f"commit{len(self.commits)}"
+            self.commits[commit_sha] = self.pending_trees[json["tree"]][0]
+            return FakeResponse(201, {"sha": commit_sha})
+        return FakeResponse(404, {"message": "Not Found"})
+
+    def patch(self, url, json=None, headers=None):
+        self.calls.append(("PATCH", url))
+        if self.pushes:
+            changes = self.pushes.pop(0)
+            pushed = f"pushed{len(self.commits)}"
+            self.commits[pushed] = {**self.commits[self.head], **changes}
+            self.head = pushed
+            return FakeResponse(422, {"message": "Update is not a fast forward"})
+        self.head = json["sha"]
+        return FakeResponse(200, {"object": {"sha": json["sha"]}})
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    fake = FakeRepo({"README.md": git_blob_sha(b"old\n"), "run.sh": git_blob_sha(b"echo\n"),
+                     "other.py": git_blob_sha(b"x = 1\n")})
+    monkeypatch.setattr(git_commit, "github_client", fake)
+    monkeypatch.setattr(git_commit, "get_tree", fake.entries)
+    return fake
+
+
+def test_all_files_land_in_one_commit(repo):
+    result = commit_files("o", "r", "main", {"README.md": "new\n", "docs/a.md": "a\n", "other.py": None}, "Docs")
+
+    assert result["changed"] == ["README.md", "docs/a.md", "other.py"]
+    assert result["attempts"] == 1
+    assert repo.head == result["commit_sha"]
+    assert repo.commits[repo.head] == {"README.md": git_blob_sha(b"new\n"), "run.sh": git_blob_sha(b"echo\n"),
+                                       "docs/a.md": git_blob_sha(b"a\n")}
+    assert sum(1 for method, url in repo.calls if url == f"{REPO}/git/commits" and method == "POST") == 1
+
+
+def test_unchanged_files_need_no_blob_or_commit(repo):
+    result = commit_files("o", "r", "main", {"README.md": "old\n", "missing.md": None}, "Noop")
+
+    assert result == {"commit_sha": None, "changed": [], "unchanged": ["README.md", "missing.md"], "attempts": 0}
+    assert all(method == "GET" for method, _ in repo.calls)
+
+
+def test_existing_file_modes_are_kept(repo):
+    commit_files("o", "r", "main", {"run.sh": "echo hi\n", "new.sh": "echo\n"}, "Scripts")
+
+    trees = [tree for _, tree in repo.pending_trees.values()]
+    assert {entry["path"]: entry["mode"] for entry in trees[0]} == {"run.sh": "100755", "new.sh": "100644"}
+
+
+def test_a_moved_branch_is_rebuilt_on_the_new_head(repo):
+    repo.pushes.append({"other.py": git_blob_sha(b"x = 2\n")})
+
+    result = commit_files("o", "r", "main", {"README.md": "new\n"}, "Docs")
+
+    assert result["attempts"] == 2
+    assert repo.commits[repo.head]["other.py"] == git_blob_sha(b"x = 2\n")
+    assert repo.commits[repo.head]["README.md"] == git_blob_sha(b"new\n")
+    # The blob was uploaded once and reused
+    assert sum(1 for _, url in repo.calls if url == f"{REPO}/git/blobs") == 1
+
+
+def test_a_push_touching_the_same_file_is_a_conflict(repo):
+    repo.pushes.append({"README.md": git_blob_sha(b"theirs\n")})
+
+    with pytest.raises(GitHubError) as raised:
+        commit_files("o", "r", "main", {"README.md": "new\n"}, "Docs")
+    assert raised.value.status_code == 409
+    assert "README.md" in raised.value.message
+
+
+def test_a_busy_branch_gives_up_after_the_attempt_limit(repo, monkeypatch):
+    monkeypatch.setattr(git_commit, "GIT_COMMIT_ATTEMPTS", 2)
+    repo.pushes.extend([{}, {}])
+
+    with pytest.raises(GitHubError) as raised:
+        commit_files("o", "r", "main", {"README.md": "new\n"}, "Docs")
+    assert "gave up after 2 attempts" in raised.value.message
@@ -0,0 +1,131 @@
+import subprocess
+
+import pytest
+
+from Shared.git_mirror import GitMirror
+from Shared.github_tree import GitHubError
+
+
+def git(*args, cwd=None):
+    result = subprocess.run(["git", "-c", "user.name=dev", "-c", "user.email=dev@example.com", *args], cwd=cwd,
+                            capture_output=True, check=True)
+    return result.stdout.decode("utf-8").strip()
+
+
+class Remote:
+    """A bare o/r.git under a file:// remote, with a work tree to push commits from"""
+
+    def __init__(self, root):
+        self.url = f"file://{root / 'remote'}"
+        bare = root / "remote" / "o" / "r.git"
+        git("init", "--bare", "--quiet", "--initial-branch=main", str(bare))
+        # Let clones ask for --filter=blob:none, as GitHub does
+        git("-C", str(bare), "config", "uploadpack.allowFilter", "true")
+        self.work = root / "work"
+        git("clone", "--quiet", str(bare), str(self.work))
+        git("-C", str(self.work), "checkout", "--quiet", "-b", "main")
+
+    def commit(self, files, message):
+        for path, content in files.items():
+            target = self.work / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+        git("-C", str(self.work), "add", "-A")
+        git("-C", str(self.work), "commit", "--quiet", "-m", message)
+        git("-C", str(self.work), "push", "--quiet", "origin", "main")
+        return git("-C", str(self.work), "rev-parse", "HEAD")
+
+    def blob_sha(self, commit_sha, path):
+        return git("-C", str(self.work), "rev-parse", f"{commit_sha}:{path}")
+
+
+@pytest.fixture
+def remote(tmp_path):
+    return Remote(tmp_path)
+
+
+@pytest.fixture
+def mirror(remote, tmp_path):
+    return GitMirror(str(tmp_path / "mirrors"), remote.url, fetch_ttl=60, timeout=30)
+
+
+def test_the_first_read_clones_without_blobs(remote, mirror):
+    sha = remote.commit({"a.py": "print(1)\n", "pkg/b.py": "x = 2\n"}, "first")
+
+    entries = mirror.tree("o", "r", "main")
+
+    assert [(e["path"], e["type"]) for e in entries] == [("a.py", "blob"), ("pkg", "tree"), ("pkg/b.py", "blob")]
+    assert entries[0]["sha"] == remote.blob_sha(sha, "a.py")
+    assert mirror.resolve("o", "r", "main") == sha
+    assert mirror.stats()["clones"] == 1
+    assert mirror._missing_blobs(mirror.path("o", "r"), sha) == {e["sha"] for e in entries if e["type"] == "blob"}
+
+
+def test_missing_blobs_are_fetched_in_one_batch(remote, mirror):
+    sha = remote.commit({"a.py": "print(1)\n", "b.py": "x = 2\n", "c.py": "y = 3\n"}, "first")
+    shas = {path: remote.blob_sha(sha, path) for path in ("a.py", "b.py", "c.py")}
+    mirror.tree("o", "r", sha)
+
+    blobs = mirror.read_blobs("o", "r", [shas["a.py"], shas["b.py"], "f" * 40], commit_sha=sha)
+
+    assert blobs == {shas["a.py"]: b"print(1)\n", shas["b.py"]: b"x = 2\n"}
+    stats = mirror.stats()
+    assert (stats["blob_fetches"], stats["blobs_fetched"]) == (1, 2)
+
+    # Blobs already fetched are read locally; only the new one crosses the network
+    mirror.read_blobs("o", "r", list(shas.values()), commit_sha=sha)
+    stats = mirror.stats()
+    assert (stats["blob_fetches"], stats["blobs_fetched"], stats["blobs_read"]) == (2, 3, 5)
+
+
+def test_log_stops_at_the_known_sha(remote, mirror):
+    shas = [remote.commit({"a.py": f"v = {n}\n"}, f"change {n}") for n in range(4)]
+
+    commits, found = mirror.log("o", "r", since_sha=shas[1])
+
+    assert [c["sha"] for c in commits] == [shas[3], shas[2]]
+    assert found
+    assert commits[0]["commit"]["message"] == "change 3"
+    assert commits[0]["commit"]["author"]["name"] == "dev"
+
+
+def test_log_without_the_known_sha_stops_at_the_limit(remote, mirror):
+    shas = [remote.commit({"a.py": f"v = {n}\n"}, f"change {n}") for n in range(4)]
+
+    commits, found = mirror.log("o", "r", since_sha="0" * 40, limit=2)
+
+    assert [c["sha"] for c in commits] == [shas[3], shas[2]]
+    assert not found
+
+
+def test_a_commit_the_mirror_lacks_triggers_a_fetch(remote, mirror):
+    first = remote.commit({"a.py": "v = 1\n"}, "first")
+    mirror.tree("o", "r", first)
+    second = remote.commit({"a.py": "v = 2\n"}, "second")
+
+    # Within the fetch TTL the branch still points where the mirror last saw it
+    assert mirror.resolve("o", "r", "main") == first
+    assert mirror.stats()["fetches"] == 0
+
+    assert mirror.resolve("o", "r", second) == second
+    assert mirror.stats()["fetches"] == 1
+    assert mirror.resolve("o", "r", "main") == second
+
+
+def test_known_commits_are_read_without_a_fetch(remote, mirror):
+    sha = remote.commit({"a.py": "v = 1\n"}, "first")
+    mirror.tree("o", "r", sha)
+    mirror.fetch_ttl = 0
+
+    mirror.tree("o", "r", sha)
+
+    assert mirror.stats()["fetches"] == 0
+
+
+def test_unknown_refs_and_repositories_are_not_found(remote, mirror):
+    remote.commit({"a.py": "v = 1\n"}, "first")
+
+    for owner, repo, ref in [("o", "r", "nope"), ("o", "missing", "main"), ("o", "..", "main"), ("o", "r", "-x")]:
+        with pytest.raises(GitHubError) as raised:
+            mirror.resolve(owner, repo, ref)
+        assert raised.value.status_code == 404
@@ -0,0 +1,244 @@
+import threading
+import time
+
+import pytest
+
+from Shared import github_cache
+from Shared.github_cache import ListingCache, MetadataCache, fetch_all_pages, filter_names, list_commits_since
+from Shared.github_tree import GitHubError
+
+URL = "http://127.0.0.1:9/users/u/repos"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, etag=None, links=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = {"ETag": etag} if etag else {}
+        self.links = {rel: {"url": url} for rel, url in (links or {}).items()}
+        self.text = ""
+
+    def json(self):
+        return self._body
+
+
+class FakeGitHub:
+    """Answers with the scripted responses in order and records request headers"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, params=None):
+        self.requests.append({"url": url, "headers": dict(headers or {}), "params": params})
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    def install(*responses, ttl=60, max_entries=16):
+        fake = FakeGitHub(*responses)
+        monkeypatch.setattr(github_cache, "github_client", fake)
+        metadata = MetadataCache(ttl, max_entries)
+        monkeypatch.setattr(github_cache, "metadata_cache", metadata)
+        return metadata, fake
+    monkeypatch.setattr(github_cache.config, "GIT_MIRROR", False)
+    return install
+
+
+def test_fresh_entries_are_served_without_a_call(cache):
+    metadata, fake = cache(FakeResponse(200, ["a"], etag='"1"'))
+
+    assert metadata.get_json(URL) == ["a"]
+    assert metadata.get_json(URL) == ["a"]
+    assert len(fake.requests) == 1
+    assert metadata.stats()["fresh_hits"] == 1
+
+
+def test_stale_entries_revalidate_with_their_etag(cache):
+    metadata, fake = cache(FakeResponse(200, ["a"], etag='"1"'), FakeResponse(304), ttl=0)
+
+    metadata.get_json(URL)
+    assert metadata.get_json(URL) == ["a"]
+
+    assert fake.requests[1]["headers"]["If-None-Match"] == '"1"'
+    stats = metadata.stats()
+    assert (stats["not_modified"], stats["full_responses"]) == (1, 1)
+    assert stats["served_without_download_ratio"] == 0.5
+
+
+def test_changed_bodies_replace_the_entry(cache):
+    metadata, _ = cache(FakeResponse(200, ["a"], etag='"1"'), FakeResponse(200, ["a", "b"], etag='"2"'), ttl=0)
+
+    metadata.get_json(URL)
+
+    assert metadata.get_json(URL) == ["a", "b"]
+
+
+def test_entries_are_keyed_by_params_and_credential(cache):
+    metadata, fake = cache(*(FakeResponse(200, [n]) for n in range(3)))
+
+    metadata.get_json(URL, params={"per_page": 10}, headers={"Authorization": "token a"})
+    metadata.get_json(URL, params={"per_page": 20}, headers={"Authorization": "token a"})
+    metadata.get_json(URL, params={"per_page": 10}, headers={"Authorization": "token b"})
+
+    assert len(fake.requests) == 3
+
+
+def test_errors_raise_and_are_not_cached(cache):
+    metadata, fake = cache(FakeResponse(404, {"message": "Not Found"}), FakeResponse(200, ["a"]))
+
+    with pytest.raises(GitHubError) as raised:
+        metadata.get_json(URL)
+    assert raised.value.status_code == 404
+    assert metadata.get_json(URL) == ["a"]
+    assert metadata.stats()["errors"] == 1
+
+
+def test_oldest_entries_are_evicted(cache):
+    metadata, fake = cache(*(FakeResponse(200, [n]) for n in range(4)), max_entries=2)
+
+    for n in range(3):
+        metadata.get_json(f"{URL}/{n}")
+    metadata.get_json(f"{URL}/0")
+
+    assert len(fake.requests) == 4
+    assert metadata.stats()["entries"] == 2
+
+
+def commit(n):
+    return {"sha": f"sha{n}", "commit": {"author": {"name": "dev", "date": "2024-01-01T00:00:00Z"},
+                                         "message": f"change {n}"}}
+
+
+def test_commits_since_follow_next_links_until_the_known_sha(cache):
+    _, fake = cache(FakeResponse(200, [commit(5), commit(4)], links={"next": f"{URL}?page=2"}),
+                    FakeResponse(200, [commit(3), commit(2)]))
+
+    commits, found = list_commits_since("u", "r", since_sha="sha3", limit=10)
+
+    assert [c["sha"] for c in commits] == ["sha5", "sha4"]
+    assert found
+    # The next link carries its own query string
+    assert fake.requests[1]["params"] is None
+
+
+def test_commits_since_stop_at_the_limit(cache):
+    cache(FakeResponse(200, [commit(n) for n in range(5, 0, -1)]))
+
+    commits, found = list_commits_since("u", "r", since_sha="sha1", limit=2)
+
+    assert [c["sha"] for c in commits] == ["sha5", "sha4"]
+    assert not found
+
+
+class FakePages:
+    """Serves items in pages by the page param or page URL, with next (and optionally last) links"""
+
+    def __init__(self, items, per_page, with_last=True):
+        self.items = items
+        self.per_page = per_page
+        self.with_last = with_last
+        self.pages = []
+
+    def get(self, url, headers=None, params=None):
+        page = int((params or {}).get("page") or (url.split("&page=")[1] if "&page=" in url else 1))
+        self.pages.append(page)
+        last = -(-len(self.items) // self.per_page)
+        links = {}
+        if page < last:
+            links["next"] = f"{URL}?per_page={self.per_page}&page={page + 1}"
+            if self.with_last:
+                links["last"] = f"{URL}?per_page={self.per_page}&page={last}"
+        return FakeResponse(200, self.items[(page - 1) * self.per_page:page * self.per_page], links=links)
+
+
+@pytest.fixture
+def pages(cache, monkeypatch):
+    def install(items, with_last=True, max_pages=10):
+        metadata, _ = cache()
+        fake = FakePages(items, github_cache.GITHUB_PER_PAGE, with_last)
+        monkeypatch.setattr(github_cache, "github_client", fake)
+        monkeypatch.setattr(github_cache, "GITHUB_LIST_MAX_PAGES", max_pages)
+        return fake
+    monkeypatch.setattr(github_cache, "GITHUB_PER_PAGE", 10)
+    return install
+
+
+def test_all_pages_are_fetched_in_order_when_the_last_page_is_known(pages):
+    fake = pages(list(range(45)))
+
+    assert fetch_all_pages(URL) == list(range(45))
+    assert sorted(fake.pages) == [1, 2, 3, 4, 5]
+
+
+def test_without_a_last_link_next_links_are_followed(pages):
+    fake = pages(list(range(25)), with_last=False)
+
+    assert fetch_all_pages(URL) == list(range(25))
+    assert fake.pages == [1, 2, 3]
+
+
+@pytest.mark.parametrize("with_last", [True, False])
+def test_pages_stop_at_the_limit(pages, with_last):
+    pages(list(range(100)), with_last=with_last, max_pages=3)
+
+    assert fetch_all_pages(URL) == list(range(30))
+
+
+def test_filter_names_matches_prefixes_ignoring_case():
+    names = ["MetricPage", "metrics-lib", "other"]
+
+    assert filter_names(names, "met") == ["MetricPage", "metrics-lib"]
+    assert filter_names(names) == names
+    assert filter_names(names, "x") == []
+
+
+def test_listings_are_cached_per_credential_until_they_expire():
+    listings = ListingCache(ttl=60, max_entries=4)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return ["a"]
+
+    assert listings.get(URL, {"Authorization": "token a"}, load) == ["a"]
+    assert listings.get(URL, {"Authorization": "token a"}, load) == ["a"]
+    listings.get(URL, {"Authorization": "token b"}, load)
+    assert len(loads) == 2
+
+    listings.ttl = 0
+    listings.get(URL, {"Authorization": "token a"}, load)
+    assert len(loads) == 3
+
+
+def test_concurrent_misses_share_one_fetch():
+    listings = ListingCache(ttl=60, max_entries=4)
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.2)
+        return ["a"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(listings.get(URL, {}, load))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [["a"]] * 4
+    assert len(loads) == 1
+    assert listings.stats()["shared_fetches"] == 3
+
+
+def test_failed_loads_are_not_cached():
+    listings = ListingCache(ttl=60, max_entries=4)
+
+    def fail():
+        raise GitHubError(502, "Bad Gateway")
+
+    with pytest.raises(GitHubError):
+        listings.get(URL, {}, fail)
+    assert listings.get(URL, {}, lambda: ["a"]) == ["a"]
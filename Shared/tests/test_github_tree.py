@@ -0,0 +1,121 @@
+import pytest
+
+from Shared import github_tree
+from Shared.github_tree import (GitHubError, filter_files, find_entry, get_tree, is_python_file, list_files,
+                                resolve_commit_sha)
+
+SHA = "a" * 40
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, text=""):
+        self.status_code = status_code
+        self._body = body
+        self.text = text
+
+    def json(self):
+        return self._body
+
+
+class FakeGitHub:
+    """Routes GET calls by URL suffix to canned responses and records them"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def get(self, url, headers=None, params=None):
+        self.calls.append((url, params))
+        for suffix, response in self.routes.items():
+            if url.endswith(suffix):
+                return response(params) if callable(response) else response
+        return FakeResponse(404, {"message": "Not Found"})
+
+
+@pytest.fixture
+def github(monkeypatch):
+    def install(routes):
+        fake = FakeGitHub(routes)
+        monkeypatch.setattr(github_tree, "github_client", fake)
+        return fake
+    monkeypatch.setattr(github_tree.config, "GIT_MIRROR", False)
+    github_tree._tree_cache.clear()
+    github_tree._ref_cache.clear()
+    return install
+
+
+def blob(path):
+    return {"path": path, "type": "blob", "sha": f"sha-{path}", "mode": "100644", "size": 1}
+
+
+def tree(path):
+    return {"path": path, "type": "tree", "sha": f"sha-{path}", "mode": "040000"}
+
+
+def test_filter_files_skips_excluded_dirs_and_trees():
+    entries = [tree("pkg"), blob("pkg/a.py"), blob("pkg/b.txt"), blob("venv/lib.py"),
+               blob("pkg/__pycache__/a.py"), blob("setup.py")]
+
+    assert filter_files(entries, is_python_file) == ["pkg/a.py", "setup.py"]
+    assert find_entry(entries, "pkg/b.txt")["sha"] == "sha-pkg/b.txt"
+    assert find_entry(entries, "missing") is None
+
+
+def test_a_full_sha_resolves_without_a_call(github):
+    fake = github({})
+
+    assert resolve_commit_sha("o", "r", SHA) == SHA
+    assert fake.calls == []
+
+
+def test_branch_resolution_is_cached(github):
+    fake = github({"/commits/main": FakeResponse(200, text=SHA + "\n")})
+
+    assert resolve_commit_sha("o", "r", "main") == SHA
+    assert resolve_commit_sha("O", "R", "main") == SHA
+    assert len(fake.calls) == 1
+
+
+def test_unknown_ref_raises_github_error(github):
+    github({"/commits/nope": FakeResponse(422, {"message": "No commit found"})})
+
+    with pytest.raises(GitHubError) as raised:
+        resolve_commit_sha("o", "r", "nope")
+    assert raised.value.status_code == 422
+    assert "No commit found" in raised.value.message
+
+
+def test_one_recursive_call_per_commit(github):
+    fake = github({f"/git/trees/{SHA}": FakeResponse(200, {"sha": SHA, "truncated": False,
+                                                           "tree": [blob("a.py"), tree("pkg"), blob("pkg/b.py")]})})
+
+    first = get_tree("o", "r", SHA)
+    second = get_tree("o", "r", SHA)
+
+    assert first is second
+    assert [e["path"] for e in first] == ["a.py", "pkg", "pkg/b.py"]
+    assert fake.calls == [(f"http://127.0.0.1:9/repos/o/r/git/trees/{SHA}", {"recursive": 1})]
+
+
+def test_truncated_trees_are_walked_subtree_by_subtree(github):
+    def root(params):
+        if params:
+            return FakeResponse(200, {"sha": "root", "truncated": True, "tree": []})
+        return FakeResponse(200, {"sha": "root", "tree": [blob("a.py"), {**tree("pkg"), "sha": "pkg-sha"},
+                                                          {**tree("venv"), "sha": "venv-sha"}]})
+
+    fake = github({f"/git/trees/{SHA}": root, "/git/trees/root": root,
+                   "/git/trees/pkg-sha": FakeResponse(200, {"sha": "pkg-sha", "tree": [blob("b.py")]})})
+
+    entries = get_tree("o", "r", SHA)
+
+    assert [e["path"] for e in entries] == ["a.py", "pkg", "pkg/b.py", "venv"]
+    # Excluded directories are listed but never walked into
+    assert not any(url.endswith("venv-sha") for url, _ in fake.calls)
+
+
+def test_list_files_resolves_then_filters(github):
+    github({"/commits/main": FakeResponse(200, text=SHA),
+            f"/git/trees/{SHA}": FakeResponse(200, {"sha": SHA, "tree": [blob("a.py"), blob("README.md")]})})
+
+    assert list_files("o", "r", "main", is_python_file) == (SHA, ["a.py"])
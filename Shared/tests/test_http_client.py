@@ -0,0 +1,155 @@
+import pytest
+import requests
+
+from Shared import http_client
+from Shared.http_client import UpstreamClient, github_headers
+from Shared.rate_limits import RateGovernor
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Answers each request with the next scripted response, or raises it"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.headers = {}
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def governor(monkeypatch):
+    # A 429 blocks its credential in the governor; keep that out of the other tests
+    fresh = RateGovernor(max_wait=0)
+    monkeypatch.setattr(http_client, "governor", fresh)
+    return fresh
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(http_client.time, "sleep", delays.append)
+    return delays
+
+
+def make_client(outcomes, **kwargs):
+    client = UpstreamClient("test", max_retries=2, backoff=0.5, backoff_cap=4.0, **kwargs)
+    client.session = FakeSession(outcomes)
+    return client
+
+
+def test_retries_transient_status_then_returns_success(sleeps):
+    failed = FakeResponse(503)
+    client = make_client([failed, FakeResponse(200)])
+
+    response = client.get("http://upstream/x")
+
+    assert response.status_code == 200
+    assert failed.closed
+    assert len(client.session.calls) == 2
+    assert len(sleeps) == 1
+    assert client.stats()["retries"] == 1
+
+
+def test_returns_last_retryable_response_when_retries_run_out(sleeps):
+    client = make_client([FakeResponse(502), FakeResponse(502), FakeResponse(502)])
+
+    response = client.get("http://upstream/x")
+
+    assert response.status_code == 502
+    assert not response.closed
+    assert len(client.session.calls) == 3
+
+
+def test_client_errors_are_not_retried(sleeps):
+    client = make_client([FakeResponse(404)])
+
+    assert client.get("http://upstream/x").status_code == 404
+    assert sleeps == []
+
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    error = requests.exceptions.ConnectionError("refused")
+    client = make_client([error, error, error])
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get("http://upstream/x")
+    assert len(client.session.calls) == 3
+    assert client.stats()["errors"] == 1
+
+
+def test_backoff_is_full_jitter_and_capped(sleeps, monkeypatch):
+    bounds = []
+    monkeypatch.setattr(http_client.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    client = UpstreamClient("test", max_retries=5, backoff=0.5, backoff_cap=4.0)
+    client.session = FakeSession([FakeResponse(500)] * 5 + [FakeResponse(200)])
+
+    client.get("http://upstream/x")
+
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 4.0), (0, 4.0)]
+    assert sleeps == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+
+def test_retry_after_raises_the_delay_up_to_the_cap(sleeps, monkeypatch, governor):
+    monkeypatch.setattr(http_client.random, "uniform", lambda low, high: 0.0)
+    # Only the client's own backoff; the governor would also hold the credential back
+    monkeypatch.setattr(governor, "observe", lambda *args: None)
+    client = make_client([FakeResponse(429, {"Retry-After": "3"}), FakeResponse(429, {"Retry-After": "60"}),
+                          FakeResponse(200)])
+
+    client.get("http://upstream/x")
+
+    assert sleeps == [3.0, 4.0]
+
+
+def test_default_timeout_unless_the_call_passes_one(sleeps):
+    client = make_client([FakeResponse(200), FakeResponse(200)], timeout=(1, 2))
+
+    client.get("http://upstream/x")
+    client.get("http://upstream/x", timeout=9)
+
+    assert [call[2]["timeout"] for call in client.session.calls] == [(1, 2), 9]
+
+
+def test_github_headers_authenticate_with_the_given_token():
+    assert github_headers("abc")["Authorization"] == "token abc"
+    assert github_headers("abc")["Accept"] == "application/vnd.github.v3+json"
+
+
+class FakeMessagesResponse(FakeResponse):
+    def __init__(self, status_code, usage):
+        super().__init__(status_code)
+        self.usage = usage
+
+    def json(self):
+        return {"content": [], "usage": self.usage}
+
+
+def test_messages_calls_settle_their_token_charge(sleeps, governor):
+    client = make_client([FakeMessagesResponse(200, {"input_tokens": 30, "output_tokens": 200}),
+                          FakeMessagesResponse(400, {})])
+    client.name = "anthropic"
+    payload = {"max_tokens": 1000, "messages": [{"role": "user", "content": "x" * 400}]}
+
+    for _ in range(2):
+        client.post("http://upstream/v1/messages", json=payload)
+        buckets = governor._budgets[("anthropic", "anonymous")].buckets
+        # Charged max_tokens and the estimated prompt, left with what the response reported;
+        # the second call is rejected and uses nothing
+        assert buckets["output_tokens"].level == pytest.approx(8000 - 200, abs=1)
+        assert buckets["input_tokens"].level == pytest.approx(40000 - 30, abs=1)
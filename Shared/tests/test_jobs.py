@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+from Shared import jobs as jobs_module
+from Shared.jobs import JobError, JobQueue, job_event_stream
+
+
+@pytest.fixture
+def queue(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    jobs.register("echo", lambda params, progress: progress({"step": 1}) or params, concurrency=1)
+    jobs.register("fail", lambda params, progress: (_ for _ in ()).throw(JobError("bad input")), concurrency=1)
+    jobs.register("crash", lambda params, progress: 1 / 0, concurrency=1)
+    jobs.init_app(Flask(__name__))
+    return jobs
+
+
+def wait(jobs, job_id):
+    deadline = time.monotonic() + 5
+    while jobs.get(job_id)["status"] not in ("succeeded", "failed"):
+        assert time.monotonic() < deadline
+        jobs.wait_for_change(jobs.version, 0.1)
+    return jobs.get(job_id)
+
+
+def test_jobs_run_and_keep_progress_and_result(queue):
+    job = wait(queue, queue.submit("echo", {"x": 1}))
+
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"x": 1}
+    assert job["progress"] == {"step": 1}
+    assert queue.stats()["echo"]["succeeded"] == 1
+
+
+def test_failures_keep_job_errors_and_wrap_the_rest(queue):
+    assert wait(queue, queue.submit("fail", {}))["error"] == "bad input"
+    assert wait(queue, queue.submit("crash", {}))["error"] == "Server error: division by zero"
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+@pytest.fixture
+def other_worker():
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    yield proc.pid
+    proc.kill()
+    proc.wait()
+
+
+def test_startup_reaps_only_jobs_whose_process_is_gone(tmp_path, other_worker):
+    path = str(tmp_path / "jobs.sqlite3")
+    jobs = JobQueue(path)
+    now = time.time()
+    other_start = jobs_module._process_start(other_worker)
+    owners = {"mine": jobs_module.owner_token(), "other": f"{other_worker}:{other_start}",
+              "dead": f"{dead_pid()}:1", "legacy": None,
+              # An earlier process that had this PID (or another live one's) before a restart
+              "reused": f"{os.getpid()}:earlier", "reused_other": f"{other_worker}:earlier"}
+    for job_id, owner in owners.items():
+        jobs._execute("INSERT INTO jobs (id, type, status, params, created_at, updated_at, owner) "
+                      "VALUES (?, 'echo', 'running', '{}', ?, ?, ?)", (job_id, now, now, owner))
+
+    restarted = JobQueue(path)
+    restarted.init_app(Flask(__name__))
+
+    statuses = {job_id: restarted.get(job_id)["status"] for job_id in owners}
+    assert statuses == {"mine": "running", "other": "running", "dead": "failed", "legacy": "failed",
+                        "reused": "failed",
+                        "reused_other": "failed" if other_start is not None else "running"}
+    assert restarted.get("reused")["error"] == "Interrupted by a server restart"
+
+
+def test_a_job_is_claimed_by_one_process_only(queue):
+    job_id = "claimed"
+    queue._execute("INSERT INTO jobs (id, type, status, params, created_at, updated_at) "
+                   "VALUES (?, 'echo', 'queued', '{}', 0, 0)", (job_id,))
+
+    assert queue._claim(job_id, time.time())
+    queue._run(job_id)  # the other process's copy of the submission
+
+    job = queue.get(job_id)
+    assert job["status"] == "running"
+    assert job["result"] is None
+
+
+def test_event_stream_ends_with_the_finished_job(queue, monkeypatch):
+    monkeypatch.setattr(jobs_module, "job_queue", queue)
+    job_id = queue.submit("echo", {"x": 2})
+    wait(queue, job_id)
+
+    body = "".join(job_event_stream(job_id).response)
+
+    event, data = body.strip().split("\n")
+    assert event == "event: job"
+    assert json.loads(data[len("data: "):])["status"] == "succeeded"
+
+
+def test_jobs_count_as_background_work(queue):
+    from Shared import rate_limits
+    queue.register("probe", lambda params, progress: rate_limits._background.get(), concurrency=1)
+
+    assert wait(queue, queue.submit("probe", {}))["result"] is True
+    assert rate_limits._background.get() is False
@@ -0,0 +1,101 @@
+import pytest
+
+from Shared import llm_cache as llm_cache_module
+from Shared.llm_cache import LLMCache, cache_key, post_messages
+
+PAYLOAD = {"model": "m", "max_tokens": 100, "system": "Be brief.",
+           "messages": [{"role": "user", "content": "Explain this:\n\ndef f():\n    return 1\n"}]}
+
+
+def test_line_endings_and_trailing_whitespace_do_not_change_the_key():
+    messy = {**PAYLOAD, "messages": [{"role": "user",
+                                      "content": "Explain this:  \r\n\r\ndef f():\r\n    return 1   \r\n"}]}
+
+    assert cache_key(messy) == cache_key(PAYLOAD)
+
+
+@pytest.mark.parametrize("change", [{"model": "other"}, {"system": "Be verbose."}, {"max_tokens": 200},
+                                    {"temperature": 0.5},
+                                    {"messages": [{"role": "user", "content": "Something else"}]}])
+def test_anything_that_changes_the_answer_changes_the_key(change):
+    assert cache_key({**PAYLOAD, **change}) != cache_key(PAYLOAD)
+
+
+def test_key_material_stands_in_for_the_messages():
+    reworded = {**PAYLOAD, "messages": [{"role": "user", "content": "Reformatted"}]}
+
+    assert cache_key(reworded, ["function", "f", "hash"]) == cache_key(PAYLOAD, ["function", "f", "hash"])
+    assert cache_key(PAYLOAD, ["function", "f", "hash"]) != cache_key(PAYLOAD, ["method", "A.f", "hash"])
+    # The model and sampling parameters still count
+    assert cache_key({**PAYLOAD, "model": "other"}, ["k"]) != cache_key(PAYLOAD, ["k"])
+
+
+def test_entries_expire(monkeypatch):
+    cache = LLMCache(ttl=10, max_entries=4)
+    clock = [100.0]
+    monkeypatch.setattr(llm_cache_module.time, "monotonic", lambda: clock[0])
+    cache.put("k", {"content": [{"text": "x"}]})
+
+    assert cache.get("k") is not None
+    clock[0] += 10
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = LLMCache(ttl=60, max_entries=2)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.get("a")
+    cache.put("c", {})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {}
+    assert cache.stats()["evictions"] == 1
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeAnthropic:
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, json=None, headers=None, **kwargs):
+        self.calls += 1
+        return FakeResponse({"content": [{"type": "text", "text": "answer"}],
+                             "usage": {"input_tokens": 3, "output_tokens": 2}})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeAnthropic()
+    monkeypatch.setattr(llm_cache_module, "anthropic_client", fake)
+    monkeypatch.setattr(llm_cache_module, "llm_cache", LLMCache(ttl=60, max_entries=8))
+    return fake
+
+
+def test_post_messages_answers_repeats_from_the_cache(upstream):
+    first = post_messages(PAYLOAD)
+    second = post_messages(PAYLOAD)
+
+    assert upstream.calls == 1
+    assert "cached" not in first
+    assert second["cached"] is True
+    assert llm_cache_module.llm_cache.stats()["output_tokens_saved"] == 2
+
+
+def test_bypass_always_calls_upstream(upstream):
+    post_messages(PAYLOAD)
+    post_messages(PAYLOAD, bypass=True)
+
+    assert upstream.calls == 2
+    assert llm_cache_module.llm_cache.stats()["bypassed"] == 1
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+import requests
+from flask import Flask
+
+from Shared import llm_stream
+from Shared.llm_cache import LLMCache
+from Shared.llm_stream import format_sse, sse_response
+
+PAYLOAD = {"model": "test-model", "max_tokens": 64, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def upstream_events(*texts, input_tokens=7, output_tokens=3):
+    """Lines of an Anthropic streaming response with one text delta per text"""
+    events = [("message_start", {"type": "message_start", "message": {"usage": {"input_tokens": input_tokens}}})]
+    events += [("content_block_delta", {"type": "content_block_delta", "delta": {"type": "text_delta", "text": t}})
+               for t in texts]
+    events += [("message_delta", {"type": "message_delta", "usage": {"output_tokens": output_tokens}}),
+               ("message_stop", {"type": "message_stop"})]
+    lines = []
+    for event, data in events:
+        lines += [f"event: {event}", f"data: {json.dumps(data)}", ""]
+    return lines
+
+
+class FakeStream:
+    def __init__(self, lines, status_code=200):
+        self.lines = lines
+        self.status_code = status_code
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAnthropic:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.bodies = []
+        self.settled = []
+
+    def post(self, url, json=None, headers=None, stream=False):
+        self.bodies.append(json)
+        return self.streams.pop(0)
+
+    def settle_usage(self, response, usage):
+        self.settled.append(usage)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def install(*streams):
+        fake = FakeAnthropic(*streams)
+        monkeypatch.setattr(llm_stream, "anthropic_client", fake)
+        return fake
+    monkeypatch.setattr(llm_stream, "llm_cache", LLMCache(ttl=60, max_entries=8))
+    return install
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def relay(**kwargs):
+    app = Flask(__name__)
+
+    @app.route("/relay")
+    def relay_route():
+        return sse_response(PAYLOAD, **kwargs)
+
+    response = app.test_client().get("/relay")
+    return response, parse_sse(response.get_data(as_text=True))
+
+
+def test_format_sse_frames_one_event():
+    assert format_sse("delta", {"text": "a\nb"}) == 'event: delta\ndata: {"text": "a\\nb"}\n\n'
+
+
+def test_deltas_are_relayed_then_done_with_usage(upstream):
+    fake = upstream(FakeStream(upstream_events("Hel", "lo")))
+
+    response, events = relay(on_complete=lambda text, usage: {"echo": text})
+
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["X-Accel-Buffering"] == "no"
+    assert events == [("delta", {"text": "Hel"}), ("delta", {"text": "lo"}),
+                      ("done", {"usage": {"input_tokens": 7, "output_tokens": 3, "total_tokens": 10},
+                                "cached": False, "echo": "Hello"})]
+    assert fake.bodies[0]["stream"] is True
+    assert fake.settled == [{"input_tokens": 7, "output_tokens": 3}]
+
+
+def test_a_repeated_request_replays_the_cache_as_one_delta(upstream):
+    fake = upstream(FakeStream(upstream_events("Hel", "lo")))
+
+    relay()
+    _, events = relay()
+
+    assert len(fake.bodies) == 1
+    assert events[0] == ("delta", {"text": "Hello"})
+    assert events[-1][1]["cached"] is True
+
+
+def test_upstream_failures_become_an_error_event(upstream):
+    stream = FakeStream([], status_code=529)
+    upstream(stream)
+
+    _, events = relay()
+
+    assert events == [("error", {"error": "529 error"})]
+    assert stream.closed
+
+
+def test_error_events_from_the_stream_end_it(upstream):
+    lines = upstream_events("partial")[:6] + [
+        "event: error", 'data: {"type": "error", "error": {"message": "overloaded"}}', ""]
+    upstream(FakeStream(lines))
+
+    _, events = relay()
+
+    assert events == [("delta", {"text": "partial"}), ("error", {"error": "overloaded"})]
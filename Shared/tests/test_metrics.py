@@ -0,0 +1,75 @@
+from flask import Flask
+
+from Shared import metrics
+from Shared.metrics import Registry
+
+
+def test_counters_render_labels_sorted_and_escaped():
+    registry = Registry()
+    counter = registry.counter("c_total", "Calls", ("upstream", "status"))
+    counter.inc(upstream="github", status=200)
+    counter.inc(2, upstream="github", status=200)
+    counter.inc(upstream='a"b\\c', status="shed")
+
+    assert registry.render().splitlines() == [
+        "# HELP c_total Calls", "# TYPE c_total counter",
+        'c_total{upstream="a\\"b\\\\c",status="shed"} 1',
+        'c_total{upstream="github",status="200"} 3']
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("h_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert lines[2:] == ['h_seconds_bucket{le="0.1"} 2', 'h_seconds_bucket{le="1"} 3',
+                         'h_seconds_bucket{le="+Inf"} 4', "h_seconds_sum 5.65", "h_seconds_count 4"]
+
+
+def test_collectors_run_at_scrape_time_and_replace_by_name():
+    registry = Registry()
+    registry.register_collector("g", "Gauge", ("type",), lambda: [(("a",), 1)])
+    registry.register_collector("g", "Gauge", ("type",), lambda: [(("a",), 2)])
+    registry.register_collector("broken", "Fails", (), lambda: 1 / 0)
+
+    assert registry.render().splitlines() == ["# HELP g Gauge", "# TYPE g gauge", 'g{type="a"} 2',
+                                              "# HELP broken Fails", "# TYPE broken gauge"]
+
+
+def test_cached_completions_count_no_tokens(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, "llm_tokens", registry.counter("t", "Tokens", ("module", "model", "direction")))
+    monkeypatch.setattr(metrics, "llm_requests", registry.counter("r", "Calls", ("module", "model", "cached")))
+
+    metrics.record_completion("chatbot", "m", {"input_tokens": 10, "output_tokens": 2})
+    metrics.record_completion("chatbot", "m", {"input_tokens": 10, "output_tokens": 2}, cached=True)
+    metrics.record_completion("tester", None, None)
+
+    lines = registry.render().splitlines()
+    assert 't{module="chatbot",model="m",direction="input"} 10' in lines
+    assert 'r{module="chatbot",model="m",cached="true"} 1' in lines
+    assert 'r{module="tester",model="unknown",cached="false"} 1' in lines
+
+
+def test_requests_are_timed_by_route_rule(monkeypatch):
+    registry = Registry()
+    histogram = registry.histogram("d", "Duration", ("route", "method", "status"))
+    monkeypatch.setattr(metrics, "http_request_duration", histogram)
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route("/items/<int:n>")
+    def item(n):
+        return "ok"
+
+    client = app.test_client()
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+
+    lines = registry.render().splitlines()
+    assert 'd_count{route="/items/<int:n>",method="GET",status="200"} 2' in lines
+    assert 'd_count{route="unmatched",method="GET",status="404"} 1' in lines
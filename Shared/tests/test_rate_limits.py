@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+from Shared import rate_limits
+from Shared.rate_limits import (GITHUB_RATE_RESERVE, RateGovernor, TokenBucket, UpstreamRateLimited,
+                                background_calls, credential_id)
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def github_quota(remaining, reset_in=60):
+    return FakeResponse(200, {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": str(remaining),
+                              "X-RateLimit-Reset": str(time.time() + reset_in), "X-RateLimit-Resource": "core"})
+
+
+def test_credentials_are_hashed_not_kept():
+    assert credential_id({}) == "anonymous"
+    assert credential_id({"Authorization": "token a"}) != credential_id({"Authorization": "token b"})
+    assert "token" not in credential_id({"Authorization": "token a"})
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1) == 0.0
+    # Costs above the capacity wait for a full bucket rather than forever
+    assert bucket.wait_time(600, now + 1) == pytest.approx(59.0)
+
+
+def test_token_bucket_adopts_the_reported_limit():
+    bucket = TokenBucket(50)
+    bucket.sync(remaining=10, limit=1000)
+
+    assert (bucket.per_minute, bucket.capacity, bucket.level) == (1000, 1000, 10)
+
+
+def test_calls_past_the_budget_are_shed_with_a_retry_hint():
+    governor = RateGovernor(max_wait=0)
+    cost = {"requests": 1, "output_tokens": 8000}
+    governor.admit("anthropic", "k", cost)
+
+    with pytest.raises(UpstreamRateLimited) as raised:
+        governor.admit("anthropic", "k", cost)
+    assert raised.value.reason == "output tokens"
+    assert raised.value.retry_after == 60
+    assert "retry in 60s" in str(raised.value)
+    counters = governor.stats()["upstreams"]["anthropic"]["k"]
+    assert (counters["admitted"], counters["shed"]) == (1, 1)
+
+
+def test_short_waits_are_queued(monkeypatch):
+    governor = RateGovernor(max_wait=5)
+    slept = []
+
+    def sleep(seconds):
+        # Time passes: the bucket refills while the call is queued
+        slept.append(seconds)
+        governor._budgets[("anthropic", "k")].buckets["requests"].level = 50
+
+    monkeypatch.setattr(rate_limits.time, "sleep", sleep)
+    governor.admit("anthropic", "k", {"requests": 50})
+
+    governor.admit("anthropic", "k", {"requests": 1})
+
+    assert len(slept) == 1
+    assert governor.stats()["upstreams"]["anthropic"]["k"]["queued"] == 1
+
+
+def test_retry_after_blocks_the_credential():
+    governor = RateGovernor(max_wait=0)
+    governor.observe("anthropic", "k", FakeResponse(429, {"Retry-After": "30"}))
+
+    with pytest.raises(UpstreamRateLimited) as raised:
+        governor.admit("anthropic", "k")
+    assert raised.value.reason == "retry-after"
+    governor.admit("anthropic", "other")
+
+
+def test_anthropic_headers_set_the_buckets():
+    governor = RateGovernor(max_wait=0)
+    governor.observe("anthropic", "k", FakeResponse(200, {"anthropic-ratelimit-input-tokens-limit": "1000",
+                                                          "anthropic-ratelimit-input-tokens-remaining": "0"}))
+
+    with pytest.raises(UpstreamRateLimited) as raised:
+        governor.admit("anthropic", "k", {"requests": 1, "input_tokens": 10})
+    assert raised.value.reason == "input tokens"
+
+
+def test_the_github_reserve_is_kept_for_interactive_calls():
+    governor = RateGovernor(max_wait=0)
+    governor.observe("github", "k", github_quota(int(GITHUB_RATE_RESERVE) + 1))
+
+    with background_calls():
+        governor.admit("github", "k")
+        with pytest.raises(UpstreamRateLimited) as raised:
+            governor.admit("github", "k")
+    assert raised.value.reason == "core quota"
+
+    for _ in range(int(GITHUB_RATE_RESERVE)):
+        governor.admit("github", "k")
+    with pytest.raises(UpstreamRateLimited):
+        governor.admit("github", "k")
+
+
+def test_background_marking_ends_with_the_block():
+    governor = RateGovernor(max_wait=0)
+    governor.observe("github", "k", github_quota(1))
+
+    with background_calls():
+        pass
+
+    governor.admit("github", "k")
+    assert governor.stats()["upstreams"]["github"]["k"]["quotas"]["core"]["remaining"] == 0
+
+
+def test_unused_tokens_are_refunded_and_overruns_taken():
+    governor = RateGovernor(max_wait=0)
+    cost = {"requests": 1, "input_tokens": 100, "output_tokens": 4000}
+    governor.admit("anthropic", "k", cost)
+    governor.admit("anthropic", "k", cost)
+
+    governor.refund("anthropic", "k", cost, {"input_tokens": 300, "output_tokens": 250})
+
+    buckets = governor._budgets[("anthropic", "k")].buckets
+    assert buckets["output_tokens"].level == pytest.approx(3750, abs=1)
+    assert buckets["input_tokens"].level == pytest.approx(40000 - 400, abs=1)
+    assert governor.stats()["upstreams"]["anthropic"]["k"]["refunded_tokens"] == 3750
+    governor.admit("anthropic", "k", {"requests": 1, "output_tokens": 3000})
+
+
+def test_background_calls_queue_past_the_interactive_limit(monkeypatch):
+    governor = RateGovernor(max_wait=0, background_max_wait=120)
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        governor._budgets[("anthropic", "k")].buckets["output_tokens"].level = 8000
+
+    monkeypatch.setattr(rate_limits.time, "sleep", sleep)
+    governor.admit("anthropic", "k", {"requests": 1, "output_tokens": 8000})
+
+    with pytest.raises(UpstreamRateLimited):
+        governor.admit("anthropic", "k", {"requests": 1, "output_tokens": 8000})
+    with background_calls():
+        governor.admit("anthropic", "k", {"requests": 1, "output_tokens": 8000})
+
+    assert len(slept) == 1
+    assert governor.stats()["background_max_wait"] == 120
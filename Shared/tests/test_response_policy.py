@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, jsonify, url_for
+
+from Shared import response_policy
+from Shared.response_policy import IMMUTABLE, NO_STORE, REVALIDATE, cache_policy, static_page
+
+BIG = {"items": ["x" * 40] * 100}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "page.html").write_text("<p>" + "page " * 400 + "</p>")
+    (tmp_path / "static").mkdir()
+    (tmp_path / "static" / "app.js").write_text("console.log(1)")
+    monkeypatch.setattr(response_policy, "_static_versions", {})
+    monkeypatch.setattr(response_policy, "page_cache", response_policy.PageCache())
+
+    app = Flask(__name__, template_folder=str(tmp_path / "templates"), static_folder=str(tmp_path / "static"))
+    response_policy.init_app(app)
+
+    @app.route("/page")
+    def page():
+        return static_page("page.html")
+
+    @app.route("/data", methods=["GET", "POST"])
+    def data():
+        return jsonify(BIG)
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/private")
+    @cache_policy(NO_STORE)
+    def private():
+        return jsonify(BIG)
+
+    @app.route("/stream")
+    def stream():
+        return Response((chunk for chunk in ["a", "b"]), mimetype="text/event-stream")
+
+    @app.route("/script")
+    def script():
+        return url_for("static", filename="app.js")
+
+    return app.test_client()
+
+
+def test_get_json_revalidates_with_an_etag(client):
+    first = client.get("/data")
+    second = client.get("/data", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.headers["Cache-Control"] == REVALIDATE
+    assert second.status_code == 304
+    assert second.get_data() == b""
+
+
+def test_large_bodies_are_gzipped_for_clients_that_accept_it(client):
+    plain = client.get("/data")
+    zipped = client.get("/data", headers={"Accept-Encoding": "gzip, br"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    # The two encodings must not share an ETag
+    assert zipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert zipped.headers["Vary"] == "Accept-Encoding"
+
+
+def test_small_bodies_go_out_as_they_are(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_no_store_for_posts_marked_views_and_streams(client):
+    for response in (client.post("/data"), client.get("/private"), client.get("/stream")):
+        assert response.headers["Cache-Control"] == NO_STORE
+        assert "ETag" not in response.headers
+    assert client.get("/stream", headers={"Accept-Encoding": "gzip"}).get_data() == b"ab"
+
+
+def test_static_pages_are_rendered_once_and_served_conditionally(client):
+    first = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    again = client.get("/page", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+    plain = client.get("/page")
+
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert again.status_code == 304
+    assert plain.headers["ETag"] != first.headers["ETag"]
+    assert gzip.decompress(first.get_data()) == plain.get_data()
+
+
+def test_static_urls_are_fingerprinted_and_immutable(client):
+    url = client.get("/script").get_data(as_text=True)
+
+    assert "?v=" in url
+    assert client.get(url).headers["Cache-Control"] == IMMUTABLE
+    assert client.get("/static/app.js").headers["Cache-Control"] == REVALIDATE
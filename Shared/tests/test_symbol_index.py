@@ -0,0 +1,153 @@
+import pytest
+
+from Shared import symbol_index as symbol_index_module
+from Shared.github_tree import GitHubError
+from Shared.symbol_index import SymbolIndex, extract_references, extract_symbols, git_blob_sha
+
+SHA = "c" * 40
+
+SOURCE = '''import os
+
+
+class Store:
+    """Keeps items"""
+
+    @property
+    def size(self):
+        return 0
+
+    async def load(self, key):
+        def inner():
+            pass
+        return key
+
+
+def top(a, b=1) -> int:
+    return a
+'''
+
+
+def test_extract_symbols_covers_classes_methods_async_and_locals():
+    symbols = {s["qualname"]: s for s in extract_symbols(SOURCE)}
+
+    assert list(symbols) == ["Store", "Store.size", "Store.load", "Store.load.<locals>.inner", "top"]
+    assert symbols["Store.load"]["kind"] == "async_method"
+    assert symbols["Store.size"]["decorators"] == ["property"]
+    assert symbols["Store.size"]["lineno"] == 7
+    assert symbols["top"]["signature"] == "def top(a, b=1) -> int"
+    assert symbols["Store"]["has_docstring"] and not symbols["top"]["has_docstring"]
+
+
+def test_body_hash_ignores_formatting():
+    assert extract_symbols("def f(a):\n    return a\n")[0]["body_hash"] == \
+        extract_symbols("def f( a ):\n\n    return (a)\n")[0]["body_hash"]
+
+
+def test_references_include_attributes_and_imports():
+    assert {"os", "path", "join", "Store"} <= extract_references("import os.path\nos.path.join(Store)\n")
+
+
+def test_git_blob_sha_matches_git():
+    assert git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SymbolIndex(str(tmp_path / "symbols.sqlite3"), source_cache_entries=2)
+
+
+def test_pasted_source_is_parsed_in_memory_not_stored(index):
+    first = index.symbols_for_source(SOURCE)
+
+    assert index.symbols_for_source(SOURCE) is first
+    stats = index.stats()
+    assert (stats["sources_parsed"], stats["source_hits"], stats["blobs"], stats["symbols"]) == (1, 1, 0, 0)
+
+
+def test_the_source_cache_is_bounded(index):
+    for n in range(3):
+        index.symbols_for_source(f"def f{n}():\n    pass\n")
+    index.symbols_for_source("def f0():\n    pass\n")
+
+    assert index.stats()["sources_parsed"] == 4
+    assert index.stats()["cached_sources"] == 2
+
+
+def test_pasted_source_raises_syntax_errors_every_time(index):
+    for _ in range(2):
+        with pytest.raises(SyntaxError):
+            index.symbols_for_source("def f(:\n")
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    """Fake tree and blobs; a blob whose value is an exception raises it when fetched"""
+    files = {}
+    fetched = []
+
+    def get_blob(username, repo_name, blob_sha, headers=None):
+        fetched.append(blob_sha)
+        data = files[blob_sha]
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def get_tree(username, repo_name, commit_sha, headers=None):
+        return [{"path": path, "type": "blob", "sha": path} for path in files]
+
+    monkeypatch.setattr(symbol_index_module, "resolve_commit_sha", lambda username, repo_name, ref, headers: SHA)
+    monkeypatch.setattr(symbol_index_module, "get_tree", get_tree)
+    monkeypatch.setattr(symbol_index_module, "get_blob", get_blob)
+    monkeypatch.setattr(symbol_index_module, "prefetch_blobs", lambda *args: None)
+    return files, fetched
+
+
+def test_commits_are_indexed_once_and_queried(index, repo):
+    files, fetched = repo
+    files.update({"pkg/a.py": SOURCE.encode(), "tests/test_a.py": b"from pkg.a import top\n\ndef test_top():\n"
+                  b"    top(1)\n", "venv/x.py": b"def hidden():\n    pass\n", "bin.py": b"\xff\xfe"})
+
+    _, found = index.query("o", "r", "main", untested=True)
+    index.file_symbols("o", "r", "main")
+
+    assert sorted(fetched) == ["bin.py", "pkg/a.py", "tests/test_a.py"]
+    assert [s["qualname"] for s in found] == ["Store.size", "Store.load"]
+    assert index.stats()["commit_hits"] == 1
+
+
+def test_a_failed_fetch_leaves_the_commit_to_be_retried(index, repo):
+    files, fetched = repo
+    files.update({"a.py": b"def a():\n    pass\n", "b.py": GitHubError(502, "Bad Gateway")})
+
+    _, first = index.file_symbols("o", "r", "main")
+    files["b.py"] = b"def b():\n    pass\n"
+    _, second = index.file_symbols("o", "r", "main")
+    index.file_symbols("o", "r", "main")
+
+    assert list(first) == ["a.py"]
+    assert list(second) == ["a.py", "b.py"]
+    assert fetched == ["a.py", "b.py", "b.py"]
+    stats = index.stats()
+    assert (stats["fetch_failures"], stats["commits_indexed"], stats["commit_hits"]) == (1, 1, 1)
+
+
+def test_symbols_for_blobs_fetches_only_the_given_files(index, repo):
+    files, fetched = repo
+    files.update({"a.py": b"def a():\n    pass\n", "b.py": b"def b():\n    pass\n", "bad.py": b"def (:\n"})
+
+    symbols = index.symbols_for_blobs("o", "r", SHA, {"a.py": "a.py", "bad.py": "bad.py"})
+
+    assert [s["qualname"] for s in symbols["a.py"]] == ["a"]
+    assert "bad.py" not in symbols
+    assert fetched == ["a.py", "bad.py"]
+    assert index.stats()["commits"] == 0
+
+
+def test_pasted_copies_of_repository_files_reuse_their_entries(index, repo):
+    files, _ = repo
+    blob_sha = git_blob_sha(SOURCE.encode())
+    files[blob_sha] = SOURCE.encode()
+    index.symbols_for_blobs("o", "r", SHA, {"pkg/a.py": blob_sha})
+
+    assert [s["qualname"] for s in index.symbols_for_source(SOURCE)][0] == "Store"
+    assert index.stats()["sources_parsed"] == 0
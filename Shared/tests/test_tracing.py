@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask
+
+from Shared import tracing
+from Shared.tracing import TraceBuffer, current_trace, propagate, span, start_trace
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    fresh = TraceBuffer(3)
+    monkeypatch.setattr(tracing, "trace_buffer", fresh)
+    return fresh
+
+
+def test_spans_outside_a_trace_do_nothing():
+    with span("github"):
+        assert current_trace() is None
+
+
+def test_spans_add_up_per_name(buffer):
+    with start_trace("job:x", "JOB") as trace:
+        with span("github", path="/a"):
+            pass
+        with span("github", path="/b"):
+            pass
+        with span("llm"):
+            pass
+
+    totals = trace.summary()["totals"]
+    assert (totals["github"]["count"], totals["llm"]["count"]) == (2, 1)
+    assert [s["path"] for s in trace.to_dict()["spans"][:2]] == ["/a", "/b"]
+    header = trace.server_timing()
+    assert header.startswith('github;dur=') and 'desc="2 calls"' in header and 'desc="1 call"' in header
+    assert header.split(", ")[-1].startswith("total;dur=")
+    assert trace.status == "ok" and current_trace() is None
+
+
+def test_failed_work_is_marked_and_spans_past_the_cap_are_counted(buffer, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_MAX_SPANS", 1)
+    with pytest.raises(ValueError):
+        with start_trace("job:x") as trace:
+            for _ in range(3):
+                with span("ast"):
+                    pass
+            raise ValueError
+
+    assert trace.status == "error"
+    assert trace.to_dict()["dropped_spans"] == 2
+    assert trace.summary()["totals"]["ast"]["count"] == 3
+
+
+def test_propagate_carries_the_trace_into_worker_threads(buffer):
+    def work():
+        with span("blob"):
+            return threading.current_thread().name
+
+    with start_trace("job:x") as trace, ThreadPoolExecutor(2, thread_name_prefix="pool") as executor:
+        names = list(executor.map(propagate(lambda _: work()), range(4)))
+        list(executor.map(lambda _: work(), range(2)))  # not propagated: not recorded
+
+    assert all(name.startswith("pool") for name in names)
+    assert trace.summary()["totals"]["blob"]["count"] == 4
+
+
+def test_the_buffer_keeps_the_newest_traces(buffer):
+    for n in range(5):
+        with start_trace(f"job:{n}"):
+            pass
+
+    assert [t["name"] for t in buffer.recent()] == ["job:4", "job:3", "job:2"]
+    assert buffer.get(buffer.recent()[0]["id"]).name == "job:4"
+    assert buffer.active() == []
+
+
+def test_requests_get_server_timing_and_a_trace_id(buffer):
+    app = Flask(__name__)
+    tracing.init_app(app)
+
+    @app.route("/items/<n>")
+    def item(n):
+        with span("github"):
+            pass
+        return "ok"
+
+    response = app.test_client().get("/items/1")
+
+    assert response.headers["Server-Timing"].startswith('github;dur=')
+    trace = buffer.get(response.headers["X-Trace-Id"])
+    assert (trace.name, trace.method, trace.status) == ("/items/<n>", "GET", 200)
+    assert current_trace() is None
@@ -0,0 +1,240 @@
+"""
+Lightweight per-request trace spans.
+
+Each request (and each background job) gets a trace; span(name) blocks
+around GitHub calls, LLM calls, blob decoding, AST parsing and pytest runs
+add timed spans to it. Totals per span name go out in a Server-Timing
+header, and the last TRACE_BUFFER_SIZE traces stay in a ring buffer for
+/debug/traces. Outside a trace span() costs one context variable lookup.
+
+Traces follow the request into asyncio.to_thread calls on their own; work
+handed to a ThreadPoolExecutor is wrapped with propagate(). With
+TRACE_PROFILE_THRESHOLD_MS set, a sampler thread records the request
+thread's stacks once it runs past the threshold.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, request
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 200))
+# Requests slower than this get stack samples; 0 turns the sampler off
+TRACE_PROFILE_THRESHOLD_MS = float(os.getenv("TRACE_PROFILE_THRESHOLD_MS", 0))
+TRACE_PROFILE_INTERVAL_MS = float(os.getenv("TRACE_PROFILE_INTERVAL_MS", 10))
+# Spans kept per trace; the totals still count the ones past the cap
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+
+_current = contextvars.ContextVar("metricpage_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name, method=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.method = method
+        self.status = None
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.thread_id = threading.get_ident()
+        self.spans = []
+        self.dropped = 0
+        self.totals = {}
+        self.samples = Counter()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def add(self, name, start, duration, attrs):
+        with self._lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += duration
+            total[1] += 1
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append({"name": name, "start_ms": round((start - self._start) * 1000, 2),
+                                   "duration_ms": round(duration * 1000, 2),
+                                   "thread": threading.current_thread().name, **attrs})
+            else:
+                self.dropped += 1
+
+    def finish(self, status=None):
+        self.status = status
+        self.duration = self.elapsed()
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per span name plus the total"""
+        with self._lock:
+            entries = [f'{name};dur={total * 1000:.1f};desc="{count} call{"s" if count != 1 else ""}"'
+                       for name, (total, count) in sorted(self.totals.items())]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "method": self.method,
+                "status": self.status,
+                "started_at": self.started_at,
+                "duration_ms": round((self.duration if self.duration is not None else self.elapsed()) * 1000, 2),
+                "in_progress": self.duration is None,
+                "totals": {name: {"duration_ms": round(total * 1000, 2), "count": count}
+                           for name, (total, count) in self.totals.items()},
+            }
+
+    def to_dict(self):
+        result = self.summary()
+        with self._lock:
+            result["spans"] = list(self.spans)
+            result["dropped_spans"] = self.dropped
+            if self.samples:
+                result["profile"] = [{"stack": stack, "samples": n} for stack, n in self.samples.most_common(20)]
+        return result
+
+
+class TraceBuffer:
+    """Ring buffer of recent traces, newest last"""
+
+    def __init__(self, size):
+        self._traces = deque(maxlen=size)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def start(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+            self._active[trace.thread_id] = trace
+
+    def end(self, trace):
+        with self._lock:
+            if self._active.get(trace.thread_id) is trace:
+                del self._active[trace.thread_id]
+
+    def active(self):
+        with self._lock:
+            return list(self._active.values())
+
+    def recent(self, limit=50, min_ms=0.0):
+        with self._lock:
+            traces = list(self._traces)
+        summaries = [t.summary() for t in reversed(traces)]
+        return [s for s in summaries if s["duration_ms"] >= min_ms][:limit]
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._traces:
+                if trace.id == trace_id:
+                    return trace
+        return None
+
+
+trace_buffer = TraceBuffer(TRACE_BUFFER_SIZE)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the block as a span of the current trace (no-op without one)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, attrs)
+
+
+@contextmanager
+def start_trace(name, method=None):
+    """Trace a unit of work outside a request, e.g. a background job"""
+    trace = Trace(name, method)
+    token = _current.set(trace)
+    trace_buffer.start(trace)
+    status = "ok"
+    try:
+        yield trace
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        trace.finish(status)
+        trace_buffer.end(trace)
+        _current.reset(token)
+
+
+def propagate(func):
+    """Wrap func so it runs inside the caller's trace when executed on another thread"""
+    context = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call gets its own copy
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def _sample_forever():
+    interval = TRACE_PROFILE_INTERVAL_MS / 1000
+    threshold = TRACE_PROFILE_THRESHOLD_MS / 1000
+    while True:
+        time.sleep(interval)
+        slow = [t for t in trace_buffer.active() if t.elapsed() >= threshold]
+        if not slow:
+            continue
+        frames = sys._current_frames()
+        for trace in slow:
+            frame = frames.get(trace.thread_id)
+            if frame is None:
+                continue
+            stack = ";".join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}"
+                             for f in traceback.extract_stack(frame, limit=25))
+            with trace._lock:
+                trace.samples[stack] += 1
+
+
+_sampler = None
+
+
+def init_app(app):
+    """Trace every request and report span totals in Server-Timing"""
+    global _sampler
+    if TRACE_PROFILE_THRESHOLD_MS > 0 and _sampler is None:
+        _sampler = threading.Thread(target=_sample_forever, name="trace-sampler", daemon=True)
+        _sampler.start()
+
+    @app.before_request
+    def begin_trace():
+        trace = Trace(request.path, request.method)
+        g.trace_token = _current.set(trace)
+        trace_buffer.start(trace)
+
+    @app.after_request
+    def add_server_timing(response):
+        trace = _current.get()
+        if trace is not None:
+            if request.url_rule is not None:
+                trace.name = request.url_rule.rule
+            # Streamed bodies keep adding spans to the buffered trace after this
+            response.headers["Server-Timing"] = trace.server_timing()
+            response.headers["X-Trace-Id"] = trace.id
+            trace.finish(response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        trace = _current.get()
+        if trace is not None:
+            trace_buffer.end(trace)
+        token = g.pop('trace_token', None)
+        if token is not None:
+            _current.reset(token)
@@ -0,0 +1,167 @@
+"""
+Batch execution of generated tests for /tester/run_tests.
+
+The module and every generated test are written once into a single sandbox,
+one test file per generated test. The files are spread across the warm
+pytest workers, and each group writes a JUnit XML report that is parsed into
+structured per-test results instead of returning raw pytest output.
+"""
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from Shared.tracing import propagate
+from TestBot.worker_pool import pytest_pool, run_pytest_subprocess, WorkerUnavailable, TESTBOT_RUN_TIMEOUT
+
+# xunit1 keeps the file attribute on each testcase; out-err records captured output
+JUNIT_ARGS = ["--continue-on-collection-errors", "-o", "junit_logging=out-err", "-o", "junit_family=xunit1"]
+
+CAPTURE_HEADER = re.compile(r"^-+ Captured \w+ -+$\n?", re.MULTILINE)
+TEST_FILE = re.compile(r"test_(\d+)_")
+
+
+def create_mock_files(tmpdir, test_code):
+    """Create placeholder files for open("name") calls so file-reading tests can run"""
+    file_matches = re.findall(r'open\(["\']([^"\']+)["\']', test_code)
+    for filename in set(file_matches):
+        # Only create files with safe names (no directories), never over the sandbox's own files
+        file_path = os.path.join(tmpdir, filename)
+        if os.path.sep not in filename and not os.path.exists(file_path):
+            with open(file_path, "w") as mockf:
+                mockf.write("dummy content\n")
+
+
+def write_sandbox(tmpdir, code, tests):
+    """
+    Lay out module.py and one test_<index>_<function>.py per test.
+    Returns: (files, invalid) where files lists (index, filename) to run and
+    invalid maps index -> result for tests that do not compile.
+    """
+    with open(os.path.join(tmpdir, "module.py"), "w") as f:
+        f.write(code)
+    files = []
+    invalid = {}
+    for index, test in enumerate(tests):
+        test_code = test.get('test_code') or ''
+        try:
+            compile(test_code, "<test_code>", "exec")
+        except SyntaxError as e:
+            invalid[index] = {'outcome': 'error', 'duration': 0.0,
+                              'output': f"SyntaxError in generated test code: {e}", 'cases': []}
+            continue
+        filename = f"test_{index}_{re.sub(r'[^0-9A-Za-z_]', '_', test.get('function') or 'generated')}.py"
+        with open(os.path.join(tmpdir, filename), "w") as f:
+            f.write("import module\n" + test_code)
+        files.append((index, filename))
+    for index, _ in files:
+        create_mock_files(tmpdir, tests[index]['test_code'])
+    return files, invalid
+
+
+def parse_junit(report_path):
+    """Map test index -> list of testcase dicts read from a JUnit XML report"""
+    cases = {}
+    try:
+        root = ET.parse(report_path).getroot()
+    except (OSError, ET.ParseError):
+        return cases
+    for testcase in root.iter('testcase'):
+        match = TEST_FILE.match(os.path.basename(testcase.get('file') or testcase.get('name') or ''))
+        if not match:
+            continue
+        outcome, message, details = 'passed', None, None
+        for tag, name in (('error', 'error'), ('failure', 'failed'), ('skipped', 'skipped')):
+            element = testcase.find(tag)
+            if element is not None:
+                outcome, message, details = name, element.get('message'), element.text
+                break
+        output = "".join(CAPTURE_HEADER.sub("", el.text or "")
+                         for el in testcase if el.tag in ('system-out', 'system-err')).strip()
+        cases.setdefault(int(match.group(1)), []).append({
+            'name': testcase.get('name'),
+            'outcome': outcome,
+            'duration': float(testcase.get('time') or 0),
+            'message': message,
+            'details': details,
+            'output': output,
+        })
+    return cases
+
+
+def _run_group(tmpdir, group_id, filenames):
+    """
+    Run one group of test files.
+    Returns: (cases, outputs) mapping test index -> testcases / raw pytest output.
+    """
+    report = os.path.join(tmpdir, f".junit-{group_id}.xml")
+    extra_args = [f"--junitxml={report}", *JUNIT_ARGS]
+    # The single-test limit scales with the number of files in the group
+    timeout = TESTBOT_RUN_TIMEOUT * len(filenames)
+    output = None
+    if pytest_pool.size > 0:
+        try:
+            output = pytest_pool.run(tmpdir, filenames, extra_args, timeout)
+        except WorkerUnavailable:
+            pass
+    if output is None:
+        output = run_pytest_subprocess(tmpdir, filenames, extra_args, timeout)
+
+    cases = parse_junit(report)
+    outputs = {}
+    for filename in filenames:
+        index = int(TEST_FILE.match(filename).group(1))
+        if index in cases:
+            continue
+        if len(filenames) > 1:
+            # A hang or crash in one file loses the whole report; rerun the
+            # unreported files alone so the failure stays with its own test
+            single_cases, single_outputs = _run_group(tmpdir, f"{group_id}-{index}", [filename])
+            cases.update(single_cases)
+            outputs.update(single_outputs)
+        else:
+            outputs[index] = output
+    return cases, outputs
+
+
+def _aggregate(cases):
+    outcomes = {case['outcome'] for case in cases}
+    for outcome in ('error', 'failed'):
+        if outcome in outcomes:
+            return outcome
+    return 'skipped' if outcomes == {'skipped'} else 'passed'
+
+
+def run_batch(code, tests):
+    """
+    Run every generated test against code in one sandbox.
+    Returns: {'results': [...], 'summary': {...}} with one result per test, in input order.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files, results = write_sandbox(tmpdir, code, tests)
+        groups = max(1, min(pytest_pool.size or 1, len(files)))
+        grouped = [[name for _, name in files[i::groups]] for i in range(groups) if files[i::groups]]
+        with ThreadPoolExecutor(max_workers=groups) as executor:
+            runs = list(executor.map(propagate(lambda args: _run_group(tmpdir, *args)), enumerate(grouped)))
+
+    for cases_by_index, outputs in runs:
+        for index, output in outputs.items():
+            # No report entry: the file timed out or its worker crashed
+            results[index] = {'outcome': 'error', 'duration': 0.0, 'output': output, 'cases': []}
+        for index, cases in cases_by_index.items():
+            results[index] = {
+                'outcome': _aggregate(cases),
+                'duration': round(sum(case['duration'] for case in cases), 3),
+                'output': "\n".join(case['output'] for case in cases if case['output']),
+                'cases': cases,
+            }
+
+    ordered = []
+    summary = {'passed': 0, 'failed': 0, 'error': 0, 'skipped': 0, 'duration': 0.0}
+    for index, test in enumerate(tests):
+        result = {'index': index, 'function': test.get('function'), **results[index]}
+        summary[result['outcome']] += 1
+        summary['duration'] = round(summary['duration'] + result['duration'], 3)
+        ordered.append(result)
+    return {'results': ordered, 'summary': summary}
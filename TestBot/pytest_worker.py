@@ -0,0 +1,73 @@
+"""
+Long-lived pytest worker used by TestBot.worker_pool.
+
+Started once with pytest already imported, it reads one JSON job per line on
+stdin, runs pytest in-process inside the job's directory with stdout/stderr
+redirected to the job's capture files, and answers with one JSON line.
+The protocol uses a private copy of the original stdout so nothing a test
+prints can corrupt it.
+"""
+import json
+import os
+import sys
+
+
+def _redirect(path, fd):
+    """Point fd at path; returns a dup of the old fd to restore later"""
+    saved = os.dup(fd)
+    target = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(target, fd)
+    os.close(target)
+    return saved
+
+
+def _restore(saved, fd):
+    os.dup2(saved, fd)
+    os.close(saved)
+
+
+def run_job(job, pytest):
+    directory = job["dir"]
+    cwd = os.getcwd()
+    saved_path = list(sys.path)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_out = _redirect(job["stdout"], 1)
+    saved_err = _redirect(job["stderr"], 2)
+    try:
+        os.chdir(directory)
+        exit_code = int(pytest.main(job["args"]))
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _restore(saved_out, 1)
+        _restore(saved_err, 2)
+        os.chdir(cwd)
+        sys.path[:] = saved_path
+        # Jobs reuse names like module/test_module; forget the previous ones
+        for name, mod in list(sys.modules.items()):
+            if (getattr(mod, "__file__", None) or "").startswith(directory):
+                del sys.modules[name]
+    return exit_code
+
+
+def main():
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    import pytest  # the import this worker exists to pay for once
+
+    protocol.write(json.dumps({"ready": True}) + "\n")
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            reply = {"status": "ok", "exit_code": run_job(job, pytest)}
+        except Exception as e:
+            reply = {"status": "error", "error": str(e)}
+        protocol.write(json.dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,34 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 import requests
+from Shared.llm_cache import post_messages, cache_bypass
+from Shared.jobs import job_queue, wants_async, submit_job_response
+from Shared.github_tree import list_files, is_python_file, GitHubError
+from Shared.blob_cache import read_file
+from Shared.symbol_index import symbol_index, FUNCTION_KINDS
+from Shared.tracing import propagate
+from Shared.github_cache import list_repo_names, list_branch_names
+from Shared.response_policy import static_page
+from Shared.config import config
 import os
-import tempfile
-import subprocess
-from dotenv import load_dotenv
-import ast
+import json
 import re
+import textwrap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-load_dotenv()
+# TestBot.worker_pool and TestBot.batch_runner (subprocess, XML parsing) are
+# imported by the routes that run tests, not at startup
 tester_bp = Blueprint('tester', __name__, template_folder='templates')
 
-GITHUB_API = "https://api.github.com"
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL")
-MODEL = os.getenv("MODEL")
-VERSION = os.getenv("VERSION")
+GITHUB_TOKEN = config.GITHUB_TOKEN
+ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY
+ANTHROPIC_API_URL = config.ANTHROPIC_API_URL
+MODEL = config.MODEL
+VERSION = config.VERSION
+
+# Per-function Claude calls in flight at once, shared by every request so the
+# total stays within the Anthropic rate limit
+TESTGEN_MAX_IN_FLIGHT = int(os.getenv("TESTGEN_MAX_IN_FLIGHT", 4))
+test_executor = ThreadPoolExecutor(max_workers=TESTGEN_MAX_IN_FLIGHT, thread_name_prefix="testgen")
 
 def get_github_headers():
     """Get headers for GitHub API requests with authentication"""
@@ -46,7 +59,7 @@ def validate_github_params(username, repo=None):
 
 @tester_bp.route('/')
 def index():
-    return render_template('testpage.html')
+    return static_page('testpage.html')
 
 @tester_bp.route('/repos')
 def list_repos():
@@ -56,22 +69,14 @@ def list_repos():
     
     headers = get_github_headers()
     try:
-        r = requests.get(f"{GITHUB_API}/users/{username}/repos", headers=headers)
-        if r.status_code == 404:
+        repos = list_repo_names(username, headers, prefix=request.args.get('prefix'))
+        return jsonify({'repos': repos})
+    except GitHubError as e:
+        if e.status_code == 404:
             return jsonify({'error': f'User "{username}" not found'}), 404
-        elif r.status_code == 403:
+        elif e.status_code == 403:
             return jsonify({'error': 'GitHub API rate limit exceeded or insufficient permissions'}), 403
-        elif r.status_code != 200:
-            error_msg = f'GitHub API error: {r.status_code}'
-            try:
-                error_detail = r.json().get('message', 'Unknown error')
-                error_msg += f' - {error_detail}'
-            except:
-                pass
-            return jsonify({'error': error_msg}), 500
-        
-        repos = [repo['name'] for repo in r.json()]
-        return jsonify({'repos': repos})
+        return jsonify({'error': e.message}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 500
 
@@ -84,22 +89,14 @@ def list_branches():
     
     headers = get_github_headers()
     try:
-        r = requests.get(f"{GITHUB_API}/repos/{username}/{repo}/branches", headers=headers)
-        if r.status_code == 404:
+        branches = list_branch_names(username, repo, headers, prefix=request.args.get('prefix'))
+        return jsonify({'branches': branches})
+    except GitHubError as e:
+        if e.status_code == 404:
             return jsonify({'error': f'Repository "{username}/{repo}" not found'}), 404
-        elif r.status_code == 403:
+        elif e.status_code == 403:
             return jsonify({'error': 'GitHub API rate limit exceeded or insufficient permissions'}), 403
-        elif r.status_code != 200:
-            error_msg = f'GitHub API error: {r.status_code}'
-            try:
-                error_detail = r.json().get('message', 'Unknown error')
-                error_msg += f' - {error_detail}'
-            except:
-                pass
-            return jsonify({'error': error_msg}), 500
-        
-        branches = [b['name'] for b in r.json()]
-        return jsonify({'branches': branches})
+        return jsonify({'error': e.message}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 500
 
@@ -113,23 +110,15 @@ def repo_files():
     
     headers = get_github_headers()
     try:
-        r = requests.get(f"{GITHUB_API}/repos/{username}/{repo}/contents", 
-                        headers=headers, params={'ref': branch})
-        if r.status_code == 404:
+        # One recursive tree call lists nested files, not only the top level
+        _, py_files = list_files(username, repo, branch, is_python_file, headers)
+        return jsonify({'files': py_files})
+    except GitHubError as e:
+        if e.status_code in (404, 422):
             return jsonify({'error': f'Repository "{username}/{repo}" or branch "{branch}" not found'}), 404
-        elif r.status_code == 403:
+        elif e.status_code == 403:
             return jsonify({'error': 'GitHub API rate limit exceeded or insufficient permissions'}), 403
-        elif r.status_code != 200:
-            error_msg = f'GitHub API error: {r.status_code}'
-            try:
-                error_detail = r.json().get('message', 'Unknown error')
-                error_msg += f' - {error_detail}'
-            except:
-                pass
-            return jsonify({'error': error_msg}), 500
-        
-        py_files = [f['path'] for f in r.json() if f['name'].endswith('.py')]
-        return jsonify({'files': py_files})
+        return jsonify({'error': f'GitHub API error: {e.message}'}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 500
 
@@ -144,71 +133,81 @@ def file_content():
     
     headers = get_github_headers()
     try:
-        r = requests.get(f"{GITHUB_API}/repos/{username}/{repo}/contents/{path}", 
-                        headers=headers, params={'ref': branch})
-        if r.status_code == 404:
+        content = read_file(username, repo, branch, path, headers)
+        return jsonify({'content': content})
+    except GitHubError as e:
+        if e.status_code in (404, 422):
             return jsonify({'error': f'File "{path}" not found in repository "{username}/{repo}" on branch "{branch}"'}), 404
-        elif r.status_code == 403:
+        elif e.status_code == 403:
             return jsonify({'error': 'GitHub API rate limit exceeded or insufficient permissions'}), 403
-        elif r.status_code != 200:
-            error_msg = f'GitHub API error: {r.status_code}'
-            try:
-                error_detail = r.json().get('message', 'Unknown error')
-                error_msg += f' - {error_detail}'
-            except:
-                pass
-            return jsonify({'error': error_msg}), 500
-        
-        import base64
-        content = base64.b64decode(r.json()['content']).decode('utf-8')
-        return jsonify({'content': content})
+        return jsonify({'error': f'GitHub API error: {e.message}'}), 500
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': f'Network error: {str(e)}'}), 500
+
+@tester_bp.route('/symbols')
+def symbols():
+    # Functions and methods of the repo at branch from the persistent symbol
+    # index; untested=1 lists those no test file in the repo references
+    username = request.args.get('username')
+    repo = request.args.get('repo')
+    branch = request.args.get('branch', 'main')
+    if not username or not repo:
+        return jsonify({'error': 'Missing username or repo parameter'}), 400
+    
+    headers = get_github_headers()
+    try:
+        commit_sha, found = symbol_index.query(username, repo, branch, headers, path=request.args.get('path'),
+                                               kinds=FUNCTION_KINDS, untested=request.args.get('untested') == '1')
+        return jsonify({'commit_sha': commit_sha, 'symbols': found})
+    except GitHubError as e:
+        if e.status_code in (404, 422):
+            return jsonify({'error': f'Repository "{username}/{repo}" or branch "{branch}" not found'}), 404
+        elif e.status_code == 403:
+            return jsonify({'error': 'GitHub API rate limit exceeded or insufficient permissions'}), 403
+        return jsonify({'error': f'GitHub API error: {e.message}'}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 500
 
 def extract_functions(code):
-    tree = ast.parse(code)
-    return [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    """
+    Testable functions of code from the shared symbol index: top-level
+    functions and methods of top-level classes, async ones included. Each
+    symbol gets its source as 'code'. Raises SyntaxError for unparsable code.
+    """
+    lines = code.split('\n')
+    functions = []
+    for symbol in symbol_index.symbols_for_source(code):
+        if symbol['kind'] not in FUNCTION_KINDS or symbol['qualname'].count('.') > 1 or '<locals>' in symbol['qualname']:
+            continue
+        source = textwrap.dedent('\n'.join(lines[symbol['lineno'] - 1:symbol['end_lineno']]))
+        functions.append({**symbol, 'code': source})
+    return functions
 
-def call_claude(function_code, prompt):
-    """Call Claude API to generate test code"""
+def call_claude(prompt, key_material=None, bypass_cache=False):
+    """
+    Call Claude API to generate test code from prompt. key_material (the
+    function's kind, qualname and AST hash) keys the response cache so
+    formatting-only edits still hit.
+    """
     if not ANTHROPIC_API_KEY:
         return "# Error: Anthropic API key not configured", 0, 0
     
-    url = "https://api.anthropic.com/v1/messages"
+    url = ANTHROPIC_API_URL
     headers = {
         "x-api-key": ANTHROPIC_API_KEY,
-        "anthropic-version": "2023-06-01",
+        "anthropic-version": VERSION,
         "content-type": "application/json"
     }
     
-    full_prompt = (
-        "Given the following Python function, write a logical, non-trivial pytest test function for it. "
-        "Do not simply echo the function or use trivial asserts. "
-        "Include all necessary imports. "
-        "IMPORTANT: At the top of your test code, add 'from module import {func_name}'. "
-        "Only call the function by its correct name. "
-        "Only return the test code, nothing else.\n\n"
-        f"{function_code}"
-    )
-    
     data = {
         "model": MODEL or "claude-3-5-sonnet-20241022",
         "max_tokens": 1536,
-        "messages": [{"role": "user", "content": full_prompt}]
+        "messages": [{"role": "user", "content": prompt}]
     }
     
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=30)
-        if r.status_code != 200:
-            error_msg = f"Claude API error: {r.status_code}"
-            try:
-                error_detail = r.json().get('error', {}).get('message', 'Unknown error')
-                error_msg += f" - {error_detail}"
-            except:
-                error_msg += f" - {r.text}"
-            return f"# {error_msg}", 0, 0
-            
-        response = r.json()
+        response = post_messages(data, url=url, headers=headers, bypass=bypass_cache,
+                                 key_material=key_material, module="tester", timeout=30)
         
         # Extract content from response
         if 'content' in response and len(response['content']) > 0:
@@ -223,11 +222,107 @@ def call_claude(function_code, prompt):
 
         return response_text, input_tokens, output_tokens
         
+    except requests.exceptions.HTTPError as e:
+        error_msg = f"Claude API error: {e.response.status_code}"
+        try:
+            error_detail = e.response.json().get('error', {}).get('message', 'Unknown error')
+            error_msg += f" - {error_detail}"
+        except:
+            error_msg += f" - {e.response.text}"
+        return f"# {error_msg}", 0, 0
     except requests.exceptions.RequestException as e:
         return f"# Network error calling Claude API: {str(e)}", 0, 0
     except Exception as e:
         return f"# Error processing Claude response: {str(e)}", 0, 0
 
+def generate_test_for_function(func, bypass_cache=False):
+    """Generate a pytest test for one indexed function or method; failures are reported in its test_code"""
+    try:
+        func_code = func['code']
+        if func['kind'] in ('method', 'async_method'):
+            class_name = func['qualname'].split('.')[0]
+            target = (
+                f"This is the method {func['name']} of class {class_name}. "
+                f"IMPORTANT: At the top of your test code, add 'from module import {class_name}'. "
+                "Create an instance (or call it on the class for static/class methods) to test it. "
+            )
+        else:
+            target = f"IMPORTANT: At the top of your test code, add 'from module import {func['name']}'. "
+        if func['kind'] in ('async_function', 'async_method'):
+            target += "It is a coroutine: run it with asyncio.run inside a regular test function. "
+        prompt = (
+            "Given the following Python function, write a logical, non-trivial pytest test function for it. "
+            "Do not simply echo the function or use trivial asserts. "
+            "Include all necessary imports. "
+            f"{target}"
+            "Only call the function by its correct name. "
+            "Only return the test code, nothing else.\n\n"
+            f"{func_code}"
+        )
+        # The prompt names the class, so identical bodies in two classes need their own entries
+        key_material = [func['kind'], func['qualname'], func['body_hash']]
+        test_code, input_tokens, output_tokens = call_claude(prompt, key_material=key_material,
+                                                             bypass_cache=bypass_cache)
+        
+        # Remove markdown/code block formatting and non-code text
+        test_code = re.sub(r"^```python|^```|```$", "", test_code, flags=re.MULTILINE).strip()
+        
+        # Ensure import pytest is present
+        if "import pytest" not in test_code:
+            test_code = "import pytest\n" + test_code
+            
+        return {
+            'function': func['qualname'],
+            'function_code': func_code,
+            'test_code': test_code,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens
+        }
+    except Exception as e:
+        # Continue with other functions if one fails
+        return {
+            'function': func['qualname'],
+            'function_code': func['code'],
+            'test_code': f"# Error generating test for {func['qualname']}: {str(e)}",
+            'input_tokens': 0,
+            'output_tokens': 0
+        }
+
+def iter_generated_tests(functions, bypass_cache=False):
+    """
+    Yield (index, test) pairs in completion order. Calls run on the shared
+    executor, so at most TESTGEN_MAX_IN_FLIGHT are in flight across all requests.
+    """
+    futures = {test_executor.submit(propagate(generate_test_for_function), func, bypass_cache): index
+               for index, func in enumerate(functions)}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Client went away mid-stream: drop the calls that have not started yet
+        for future in futures:
+            future.cancel()
+
+def wants_ndjson(data):
+    """True when the JSON body or the Accept header asks for streamed NDJSON"""
+    if data.get('stream'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def generate_tests_job(params, progress):
+    """Background form of generate_tests; the route has already validated the code"""
+    functions = extract_functions(params['code'])
+    tests = [None] * len(functions)
+    done = 0
+    progress({'done': 0, 'total': len(functions)})
+    for index, test in iter_generated_tests(functions, bool(params.get('no_cache'))):
+        tests[index] = test
+        done += 1
+        progress({'done': done, 'total': len(functions), 'last_function': test['function']})
+    return {'tests': tests}
+
+job_queue.register('generate_tests', generate_tests_job, concurrency=int(os.getenv("JOBS_TESTS_CONCURRENCY", 2)))
+
 @tester_bp.route('/generate_tests', methods=['POST'])
 def generate_tests():
     try:
@@ -250,44 +345,21 @@ def generate_tests():
         if not functions:
             return jsonify({'error': 'No functions found in the provided code'}), 400
             
-        tests = []
-        for func in functions:
-            try:
-                func_code = ast.unparse(func)
-                prompt = (
-                    "Given the following Python function, write a logical, non-trivial pytest test function for it. "
-                    "Do not simply echo the function or use trivial asserts. "
-                    "Include all necessary imports. "
-                    f"IMPORTANT: At the top of your test code, add 'from module import {func.name}'. "
-                    "Only call the function by its correct name. "
-                    "Only return the test code, nothing else.\n\n"
-                    f"{func_code}"
-                )
-                test_code, input_tokens, output_tokens = call_claude(func_code, prompt)
-                
-                # Remove markdown/code block formatting and non-code text
-                test_code = re.sub(r"^```python|^```|```$", "", test_code, flags=re.MULTILINE).strip()
-                
-                # Ensure import pytest is present
-                if "import pytest" not in test_code:
-                    test_code = "import pytest\n" + test_code
-                    
-                tests.append({
-                    'function': func.name,
-                    'function_code': func_code,
-                    'test_code': test_code,
-                    'input_tokens': input_tokens,
-                    'output_tokens': output_tokens
-                })
-            except Exception as e:
-                # Continue with other functions if one fails
-                tests.append({
-                    'function': func.name,
-                    'function_code': ast.unparse(func) if hasattr(ast, 'unparse') else str(func),
-                    'test_code': f"# Error generating test for {func.name}: {str(e)}",
-                    'input_tokens': 0,
-                    'output_tokens': 0
-                })
+        if wants_async(data):
+            return submit_job_response('generate_tests', data)
+
+        bypass = cache_bypass(data)
+        if wants_ndjson(data):
+            # One JSON object per line, each test as soon as it is ready
+            def generate():
+                for index, test in iter_generated_tests(functions, bypass):
+                    yield json.dumps({'index': index, 'total': len(functions), **test}) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        tests = [None] * len(functions)
+        for index, test in iter_generated_tests(functions, bypass):
+            tests[index] = test
                 
         return jsonify({'tests': tests})
     except Exception as e:
@@ -307,7 +379,9 @@ def run_test():
     except SyntaxError as e:
         return jsonify({'output': f"SyntaxError in generated test code: {e}"}), 200
 
-    import tempfile, os, subprocess
+    import tempfile
+    from TestBot.worker_pool import pytest_pool, run_pytest_subprocess, WorkerUnavailable
+    from TestBot.batch_runner import create_mock_files
     with tempfile.TemporaryDirectory() as tmpdir:
         code_path = os.path.join(tmpdir, "module.py")
         test_path = os.path.join(tmpdir, "test_module.py")
@@ -316,25 +390,25 @@ def run_test():
         with open(test_path, "w") as f:
             f.write("import module\n" + test_code)
 
-        # --- MOCK FILE CREATION LOGIC ---
-        # Look for open("filename", ...) or open('filename', ...)
-        file_matches = re.findall(r'open\(["\']([^"\']+)["\']', test_code)
-        for filename in set(file_matches):
-            # Only create files with safe names (no directories)
-            if os.path.sep not in filename and filename not in ("module.py", "test_module.py"):
-                file_path = os.path.join(tmpdir, filename)
-                with open(file_path, "w") as mockf:
-                    mockf.write("dummy content\n")
-        # --- END MOCK FILE CREATION ---
+        create_mock_files(tmpdir, test_code)
 
-        try:
-            result = subprocess.run(
-                ["pytest", test_path, "-v", "--tb=short", "--disable-warnings"],
-                cwd=tmpdir,
-                capture_output=True,
-                timeout=10
-            )
-            output = result.stdout.decode() + result.stderr.decode()
-        except Exception as e:
-            output = str(e)
-    return jsonify({'output': output})
\ No newline at end of file
+        if pytest_pool.size > 0:
+            try:
+                return jsonify({'output': pytest_pool.run(tmpdir, test_path)})
+            except WorkerUnavailable:
+                pass
+        output = run_pytest_subprocess(tmpdir, test_path)
+    return jsonify({'output': output})
+
+@tester_bp.route('/run_tests', methods=['POST'])
+def run_tests():
+    """Run all generated tests in one sandbox and return structured per-test results"""
+    data = request.json or {}
+    code = data.get('code')
+    tests = data.get('tests')
+    if not code or not tests:
+        return jsonify({'error': 'Missing code or tests'}), 400
+    if not all(isinstance(test, dict) and test.get('test_code') for test in tests):
+        return jsonify({'error': 'Every test needs a test_code'}), 400
+    from TestBot.batch_runner import run_batch
+    return jsonify(run_batch(code, tests))
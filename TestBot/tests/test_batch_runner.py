@@ -0,0 +1,85 @@
+import pytest
+from flask import Flask
+
+from TestBot import batch_runner, tester
+from TestBot.batch_runner import parse_junit, run_batch, write_sandbox
+from TestBot.worker_pool import PytestWorkerPool
+
+CODE = "def add(a, b):\n    return a + b\n"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    warm = PytestWorkerPool(2, 25, 20)
+    monkeypatch.setattr(batch_runner, "pytest_pool", warm)
+    yield warm
+    while not warm._idle.empty():
+        warm._idle.get().kill()
+
+
+def test_write_sandbox_keeps_broken_tests_out_of_the_run(tmp_path):
+    tests = [{"function": "add", "test_code": "def test_a():\n    pass\n"},
+             {"function": "add", "test_code": "def test_b(:\n"},
+             {"function": "Cls.run", "test_code": "def test_c():\n    open('data.txt')\n"}]
+
+    files, invalid = write_sandbox(str(tmp_path), CODE, tests)
+
+    assert files == [(0, "test_0_add.py"), (2, "test_2_Cls_run.py")]
+    assert invalid[1]["outcome"] == "error"
+    assert "SyntaxError" in invalid[1]["output"]
+    assert (tmp_path / "test_0_add.py").read_text().startswith("import module\n")
+    assert (tmp_path / "data.txt").exists()
+
+
+def test_parse_junit_maps_testcases_back_to_their_test(tmp_path):
+    report = tmp_path / "report.xml"
+    report.write_text("""<testsuites><testsuite>
+      <testcase file="test_0_add.py" name="test_ok" time="0.5"><system-out>----- Captured Out -----
+hi</system-out></testcase>
+      <testcase file="test_3_add.py" name="test_bad" time="0.25"><failure message="assert 1 == 2">trace</failure></testcase>
+      <testcase file="conftest.py" name="unrelated" time="1"/>
+    </testsuite></testsuites>""")
+
+    cases = parse_junit(str(report))
+
+    assert sorted(cases) == [0, 3]
+    assert cases[0][0]["outcome"] == "passed" and cases[0][0]["output"] == "hi"
+    assert cases[3][0] == {"name": "test_bad", "outcome": "failed", "duration": 0.25,
+                           "message": "assert 1 == 2", "details": "trace", "output": ""}
+    assert parse_junit(str(tmp_path / "missing.xml")) == {}
+
+
+def test_run_batch_returns_one_result_per_test_in_order(pool):
+    tests = [{"function": "add", "test_code": "def test_ok():\n    assert module.add(1, 2) == 3\n"},
+             {"function": "add", "test_code": "def test_bad(:\n"},
+             {"function": "add", "test_code": "def test_fail():\n    assert module.add(1, 2) == 4\n"},
+             {"function": "add", "test_code": "import pytest\n\n@pytest.mark.skip\ndef test_skip():\n    pass\n"}]
+
+    batch = run_batch(CODE, tests)
+
+    assert [r["outcome"] for r in batch["results"]] == ["passed", "error", "failed", "skipped"]
+    assert [r["index"] for r in batch["results"]] == [0, 1, 2, 3]
+    assert batch["results"][2]["cases"][0]["name"] == "test_fail"
+    summary = batch["summary"]
+    assert (summary["passed"], summary["failed"], summary["error"], summary["skipped"]) == (1, 1, 1, 1)
+
+
+def test_a_file_that_loses_its_group_report_is_rerun_alone(pool, monkeypatch):
+    monkeypatch.setattr(batch_runner, "TESTBOT_RUN_TIMEOUT", 2)
+    tests = [{"function": "add", "test_code": "def test_ok():\n    assert module.add(1, 2) == 3\n"},
+             {"function": "hang", "test_code": "import time\n\ndef test_hang():\n    time.sleep(30)\n"},
+             {"function": "add", "test_code": "def test_ok2():\n    assert module.add(2, 2) == 4\n"}]
+
+    batch = run_batch(CODE, tests)
+
+    assert [r["outcome"] for r in batch["results"]] == ["passed", "error", "passed"]
+    assert "timed out" in batch["results"][1]["output"]
+
+
+def test_run_tests_route_validates_the_body():
+    app = Flask(__name__)
+    app.register_blueprint(tester.tester_bp, url_prefix="/tester")
+    client = app.test_client()
+
+    assert client.post("/tester/run_tests", json={"code": CODE}).status_code == 400
+    assert client.post("/tester/run_tests", json={"code": CODE, "tests": [{"function": "f"}]}).status_code == 400
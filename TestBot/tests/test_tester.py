@@ -0,0 +1,176 @@
+import json
+import threading
+
+import pytest
+from flask import Flask
+
+from Shared import http_client, rate_limits
+from Shared.rate_limits import RATE_LIMIT_MAX_WAIT, RateGovernor, credential_id
+from TestBot import tester
+
+CODE = '''
+def add(a, b):
+    return a + b
+
+
+def sub(a, b):
+    return a - b
+
+
+class Box:
+    def size(self):
+        return 1
+'''
+
+
+@pytest.fixture
+def claude(monkeypatch):
+    """Stand-in for the cached Messages API call: one test per prompt, key_material recorded"""
+    calls = []
+    lock = threading.Lock()
+
+    def post_messages(payload, key_material=None, **kwargs):
+        with lock:
+            calls.append(key_material)
+        name = payload["messages"][0]["content"].split("def ")[-1].split("(")[0]
+        return {"content": [{"type": "text", "text": f"```python\ndef test_{name}():\n    assert True\n```"}],
+                "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+    monkeypatch.setattr(tester, "post_messages", post_messages)
+    return calls
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(tester.tester_bp, url_prefix="/tester")
+    return app.test_client()
+
+
+def test_ndjson_streams_one_line_per_function(client, claude):
+    response = client.post("/tester/generate_tests", json={"code": CODE, "stream": True})
+
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert {line["total"] for line in lines} == {3}
+    assert {line["function"] for line in lines} == {"add", "sub", "Box.size"}
+    assert all(line["test_code"].startswith("import pytest\n") for line in lines)
+    assert "```" not in lines[0]["test_code"]
+
+
+def test_json_answer_keeps_source_order(client, claude):
+    response = client.post("/tester/generate_tests", json={"code": CODE})
+
+    assert [test["function"] for test in response.get_json()["tests"]] == ["add", "sub", "Box.size"]
+
+
+def test_invalid_code_is_a_400(client, claude):
+    response = client.post("/tester/generate_tests", json={"code": "def broken(:\n"})
+
+    assert response.status_code == 400
+    assert "Syntax error" in response.get_json()["error"]
+    assert claude == []
+
+
+def test_identical_methods_of_different_classes_are_cached_apart(client, claude):
+    code = '''
+class Reader:
+    def close(self):
+        self.closed = True
+
+
+class Writer:
+    def close(self):
+        self.closed = True
+'''
+    client.post("/tester/generate_tests", json={"code": code})
+
+    assert len(claude) == 2
+    assert sorted(key[1] for key in claude) == ["Reader.close", "Writer.close"]
+    assert claude[0][2] == claude[1][2]
+
+
+def test_method_and_coroutine_instructions_reach_the_model(client, monkeypatch):
+    payloads = []
+
+    def post_messages(payload, **kwargs):
+        payloads.append(payload)
+        return {"content": [{"type": "text", "text": "def test_m():\n    assert True"}], "usage": {}}
+
+    monkeypatch.setattr(tester, "post_messages", post_messages)
+
+    client.post("/tester/generate_tests", json={"code": "class A:\n    async def m(self):\n        return 1\n"})
+
+    prompt = payloads[0]["messages"][0]["content"]
+    assert "This is the method m of class A." in prompt
+    assert "'from module import A'" in prompt
+    assert "asyncio.run" in prompt
+    assert "{func_name}" not in prompt
+    assert prompt.endswith("async def m(self):\n    return 1")
+
+
+class FakeClock:
+    """Stands in for the time module in rate_limits: a sleep moves one shared virtual clock forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.lock = threading.Lock()
+        self.seen = threading.local()
+
+    def monotonic(self):
+        with self.lock:
+            self.seen.at = self.now
+            return self.now
+
+    def time(self):
+        return self.monotonic()
+
+    def sleep(self, seconds):
+        # Threads that looked at the clock together sleep side by side, not one after another;
+        # like a real sleep, even a tiny one lets some time pass
+        with self.lock:
+            self.now = max(self.now, getattr(self.seen, "at", self.now) + max(seconds, 0.001))
+
+
+class FakeMessagesResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, payload):
+        name = payload["messages"][0]["content"].split("def ")[-1].split("(")[0]
+        self.body = {"content": [{"type": "text", "text": f"def test_{name}():\n    assert True"}],
+                     "usage": {"input_tokens": 180, "output_tokens": 300}}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeAnthropicSession:
+    headers = {}
+
+    def request(self, method, url, json=None, **kwargs):
+        return FakeMessagesResponse(json)
+
+
+def test_a_large_batch_fits_the_default_anthropic_limits(client, monkeypatch):
+    governor = RateGovernor(RATE_LIMIT_MAX_WAIT)
+    clock = FakeClock()
+    monkeypatch.setattr(http_client, "governor", governor)
+    monkeypatch.setattr(rate_limits, "time", clock)
+    monkeypatch.setattr(http_client.anthropic_client, "session", FakeAnthropicSession())
+    code = "\n\n".join(f"def func_{n}(x):\n    return x + {n}" for n in range(40))
+
+    response = client.post("/tester/generate_tests", json={"code": code, "no_cache": True})
+
+    tests = response.get_json()["tests"]
+    assert [t for t in tests if "Error" in t["test_code"]] == []
+    counters = governor.stats()["upstreams"]["anthropic"][credential_id({"x-api-key": tester.ANTHROPIC_API_KEY})]
+    assert (counters["admitted"], counters["shed"]) == (40, 0)
+    # Each call is charged max_tokens until its usage comes back; 40 x 300 output tokens is
+    # over a minute of the default 8000/min, so the batch queued rather than finished at once
+    assert counters["queued"] > 0
+    assert clock.now - 1000 >= (40 * 300 - 8000) / 8000 * 60 - 1
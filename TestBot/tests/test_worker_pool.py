@@ -0,0 +1,83 @@
+import pytest
+
+from TestBot import worker_pool
+from TestBot.worker_pool import PytestWorkerPool, pytest_command
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def make(size=1, max_runs=25, timeout=20):
+        made = PytestWorkerPool(size, max_runs, timeout)
+        pools.append(made)
+        return made
+    yield make
+    for made in pools:
+        while not made._idle.empty():
+            made._idle.get().kill()
+
+
+def sandbox(tmp_path, test_code):
+    (tmp_path / "module.py").write_text("def add(a, b):\n    return a + b\n")
+    (tmp_path / "test_module.py").write_text("import module\n" + test_code)
+    return str(tmp_path), str(tmp_path / "test_module.py")
+
+
+def test_pytest_command_accepts_one_path_or_many():
+    assert pytest_command("t.py") == ["pytest", "t.py", "-v", "--tb=short", "--disable-warnings"]
+    assert pytest_command(["a.py", "b.py"], ["-x"])[1:3] == ["a.py", "b.py"]
+    assert pytest_command(["a.py"], ["-x"])[-1] == "-x"
+
+
+def test_a_warm_worker_runs_jobs_and_is_reused(pool, tmp_path):
+    warm = pool()
+    workdir, path = sandbox(tmp_path, "def test_add():\n    print('noise')\n    assert module.add(1, 2) == 3\n")
+
+    first = warm.run(workdir, path)
+    second = warm.run(workdir, path)
+
+    assert "1 passed" in first and "1 passed" in second
+    stats = warm.stats()
+    assert (stats["runs"], stats["spawned"], stats["recycled"], stats["idle"]) == (2, 1, 0, 1)
+    assert stats["latency_ms_p50"] is not None
+
+
+def test_failures_are_reported_like_the_subprocess_path(pool, tmp_path):
+    workdir, path = sandbox(tmp_path, "def test_add():\n    assert module.add(1, 2) == 4\n")
+
+    output = pool().run(workdir, path)
+
+    assert "1 failed" in output
+    assert "assert 3 == 4" in output
+
+
+def test_workers_are_replaced_after_max_runs(pool, tmp_path):
+    warm = pool(max_runs=1)
+    workdir, path = sandbox(tmp_path, "def test_add():\n    assert module.add(1, 2) == 3\n")
+
+    warm.run(workdir, path)
+
+    stats = warm.stats()
+    assert (stats["recycled"], stats["spawned"]) == (1, 2)
+
+
+def test_a_hanging_test_times_out_and_retires_its_worker(pool, tmp_path):
+    warm = pool(timeout=20)
+    workdir, path = sandbox(tmp_path, "import time\n\ndef test_hang():\n    time.sleep(30)\n")
+
+    output = warm.run(workdir, path, timeout=3)
+
+    assert "timed out after 3 seconds" in output
+    stats = warm.stats()
+    assert (stats["timeouts"], stats["recycled"], stats["spawned"]) == (1, 1, 2)
+
+
+def test_a_worker_that_never_starts_is_unavailable(pool, monkeypatch):
+    warm = pool()
+    monkeypatch.setattr(worker_pool, "WORKER_SCRIPT", "-c")
+    monkeypatch.setattr(worker_pool, "TESTBOT_WORKER_READY_TIMEOUT", 5)
+
+    with pytest.raises(worker_pool.WorkerUnavailable):
+        warm.run("/tmp", "test_x.py")
+    assert warm.stats()["spawn_failures"] == 1
@@ -0,0 +1,228 @@
+"""
+Pool of pre-warmed pytest worker processes for /tester/run_test.
+
+Each worker (TestBot/pytest_worker.py) imports pytest once and then runs
+jobs in-process, which skips interpreter startup and plugin discovery on
+every click. A worker is replaced after TESTBOT_WORKER_MAX_RUNS jobs, on a
+crash and on a timeout; replacements start warming immediately.
+"""
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from Shared.metrics import observe_upstream
+from Shared.tracing import span
+
+TESTBOT_WORKERS = int(os.getenv("TESTBOT_WORKERS", 2))
+TESTBOT_WORKER_MAX_RUNS = int(os.getenv("TESTBOT_WORKER_MAX_RUNS", 25))
+TESTBOT_RUN_TIMEOUT = int(os.getenv("TESTBOT_RUN_TIMEOUT", 10))
+TESTBOT_WORKER_READY_TIMEOUT = float(os.getenv("TESTBOT_WORKER_READY_TIMEOUT", 30))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_worker.py")
+
+
+def pytest_command(test_paths, extra_args=()):
+    """The command line the subprocess path runs, also used in timeout messages"""
+    if isinstance(test_paths, str):
+        test_paths = [test_paths]
+    return ["pytest", *test_paths, "-v", "--tb=short", "--disable-warnings", *extra_args]
+
+
+class WorkerUnavailable(Exception):
+    """No worker could be started; callers fall back to a pytest subprocess"""
+
+
+class PytestWorker:
+    def __init__(self):
+        self.proc = subprocess.Popen([sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True, bufsize=1)
+        self.runs = 0
+        self.ready = False
+
+    def _read_line(self, timeout):
+        """One protocol line, '' on EOF, or None when timeout passes first"""
+        readable, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not readable:
+            return None
+        return self.proc.stdout.readline()
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            line = self._read_line(timeout)
+            self.ready = bool(line) and json.loads(line).get("ready", False)
+        return self.ready
+
+    def run(self, job, timeout):
+        """Returns 'ok', 'timeout' or 'crashed'"""
+        self.runs += 1
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return "crashed"
+        line = self._read_line(timeout)
+        if line is None:
+            return "timeout"
+        if not line or json.loads(line).get("status") != "ok":
+            return "crashed"
+        return "ok"
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+class PytestWorkerPool:
+    """
+    size: int, worker processes kept warm
+    max_runs: int, jobs a worker runs before it is replaced
+    timeout: int, seconds a job may run before its worker is killed
+    """
+
+    def __init__(self, size, max_runs, timeout):
+        self.size = size
+        self.max_runs = max_runs
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._latencies = deque(maxlen=500)
+        self._counters = {"runs": 0, "timeouts": 0, "crashes": 0, "recycled": 0,
+                          "spawned": 0, "spawn_failures": 0}
+
+    def _spawn(self):
+        with self._lock:
+            self._counters["spawned"] += 1
+        self._idle.put(PytestWorker())
+
+    def _start(self):
+        with self._lock:
+            if self._started_at is not None:
+                return
+            self._started_at = time.monotonic()
+        for _ in range(self.size):
+            self._spawn()
+
+    def _retire(self, worker, reason=None):
+        worker.kill()
+        with self._lock:
+            self._counters["recycled"] += 1
+            if reason:
+                self._counters[reason] += 1
+        self._spawn()
+
+    def run(self, workdir, test_paths, extra_args=(), timeout=None):
+        """
+        Run test_paths (one path or a list) inside workdir on a warm worker.
+        Returns the combined stdout+stderr, formatted like the subprocess path.
+        Raises WorkerUnavailable when no worker comes up.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        command = pytest_command(test_paths, extra_args)
+        self._start()
+        worker = self._idle.get()
+        if not worker.wait_ready(TESTBOT_WORKER_READY_TIMEOUT):
+            with self._lock:
+                self._counters["spawn_failures"] += 1
+            self._retire(worker)
+            raise WorkerUnavailable("pytest worker failed to start")
+
+        fd_out, out_path = tempfile.mkstemp(prefix="testbot-out-")
+        fd_err, err_path = tempfile.mkstemp(prefix="testbot-err-")
+        os.close(fd_out)
+        os.close(fd_err)
+        with self._lock:
+            self._busy += 1
+        started = time.monotonic()
+        status = "crashed"
+        try:
+            with span('pytest', worker='warm'):
+                status = worker.run({"dir": workdir, "args": command[1:],
+                                     "stdout": out_path, "stderr": err_path}, timeout)
+            if status == "timeout":
+                output = str(subprocess.TimeoutExpired(command, timeout))
+            else:
+                with open(out_path, errors="replace") as f_out, open(err_path, errors="replace") as f_err:
+                    output = f_out.read() + f_err.read()
+        finally:
+            elapsed = time.monotonic() - started
+            observe_upstream("pytest", status, elapsed)
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += elapsed
+                self._counters["runs"] += 1
+                self._latencies.append(elapsed)
+            os.remove(out_path)
+            os.remove(err_path)
+
+        if status == "timeout":
+            self._retire(worker, "timeouts")
+        elif status == "crashed":
+            self._retire(worker, "crashes")
+        elif worker.runs >= self.max_runs:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return output
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+            capacity = uptime * self.size
+
+            def percentile(p):
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+            return {
+                **self._counters,
+                "size": self.size,
+                "busy": self._busy,
+                "idle": self._idle.qsize(),
+                "max_runs": self.max_runs,
+                "timeout": self.timeout,
+                "utilization": round(self._busy_seconds / capacity, 4) if capacity else 0.0,
+                "latency_ms_p50": percentile(0.5),
+                "latency_ms_p95": percentile(0.95),
+            }
+
+
+def run_pytest_subprocess(tmpdir, test_paths, extra_args=(), timeout=TESTBOT_RUN_TIMEOUT):
+    """Cold path: a fresh pytest process, used when no warm worker is available"""
+    started = time.monotonic()
+    status = "subprocess"
+    try:
+        with span('pytest', worker='subprocess'):
+            result = subprocess.run(
+                pytest_command(test_paths, extra_args),
+                cwd=tmpdir,
+                capture_output=True,
+                timeout=timeout
+            )
+        return result.stdout.decode() + result.stderr.decode()
+    except subprocess.TimeoutExpired as e:
+        status = "timeout"
+        return str(e)
+    except Exception as e:
+        status = "crashed"
+        return str(e)
+    finally:
+        observe_upstream("pytest", status, time.monotonic() - started)
+
+
+pytest_pool = PytestWorkerPool(TESTBOT_WORKERS, TESTBOT_WORKER_MAX_RUNS, TESTBOT_RUN_TIMEOUT)
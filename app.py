@@ -1,28 +1,175 @@
-from flask import Flask, render_template
-from ChatBot.chatbot import chatbot_bp
-from AgentLogger.log import logger_bp
-from Docuwriter.docuwriter import docuwriter_bp
-from TestBot.tester import tester_bp
-
-app = Flask(__name__)
-
-# Add cache control headers to prevent browser caching during development
-@app.after_request
-def after_request(response):
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
-
-# Register blueprints for each module
-app.register_blueprint(chatbot_bp, url_prefix='/chatbot')
-app.register_blueprint(logger_bp, url_prefix='/logger')
-app.register_blueprint(docuwriter_bp, url_prefix='/writer')
-app.register_blueprint(tester_bp, url_prefix='/tester')
-
-@app.route('/')
-def index():
-    return render_template('index.html')
+"""
+Application factory.
+
+create_app() loads the settings once (Shared.config), imports only the
+blueprints the deployment enables (METRICPAGE_MODULES, default all) and
+wires the shared routes. `app` is built on first access, so
+`gunicorn app:app` and `from app import app` keep working while tools and
+tests that only need create_app() don't pay for a default app.
+"""
+import importlib
+
+from flask import Flask, Response, jsonify, request
+
+from Shared.config import config
+from Shared.response_policy import cache_policy, static_page, NO_STORE
+
+# name -> (module, blueprint attribute, url prefix); modules are imported on registration
+MODULES = {
+    'chatbot': ('ChatBot.chatbot', 'chatbot_bp', '/chatbot'),
+    'logger': ('AgentLogger.log', 'logger_bp', '/logger'),
+    'writer': ('Docuwriter.docuwriter', 'docuwriter_bp', '/writer'),
+    'tester': ('TestBot.tester', 'tester_bp', '/tester'),
+}
+
+
+def create_app(modules=None):
+    """
+    Build the app with the given blueprints (names from MODULES; default
+    config.MODULES). Raises ValueError for an unknown module name.
+    """
+    modules = list(config.MODULES if modules is None else modules)
+    unknown = [name for name in modules if name not in MODULES]
+    if unknown:
+        raise ValueError(f"Unknown module(s) {', '.join(unknown)}; choose from {', '.join(MODULES)}")
+
+    from Shared.http_client import pool_stats
+    from Shared.rate_limits import governor, UpstreamRateLimited
+    from Shared.blob_cache import blob_cache
+    from Shared.github_cache import metadata_cache, listing_cache
+    from Shared.llm_cache import llm_cache
+    from Shared.symbol_index import symbol_index
+    from Shared.jobs import job_queue, job_event_stream
+    from Shared import metrics, tracing, response_policy
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config['METRICPAGE_MODULES'] = modules
+
+    # Cache-Control per route class, ETags/304s and gzip
+    response_policy.init_app(app)
+
+    # Register blueprints for each enabled module
+    for name in modules:
+        module_name, attribute, url_prefix = MODULES[name]
+        app.register_blueprint(getattr(importlib.import_module(module_name), attribute), url_prefix=url_prefix)
+
+    # Resume background jobs persisted by a previous run
+    job_queue.init_app(app)
+    # Per-route latency histograms for /metrics
+    metrics.init_app(app)
+    # Trace spans, Server-Timing headers and /debug/traces
+    tracing.init_app(app)
+
+    metrics.registry.register_collector(
+        "metricpage_cache_hit_ratio", "Hit ratio of each shared cache since startup", ("cache",),
+        lambda: [(("blobs",), blob_cache.stats()["hit_ratio"]),
+                 (("github_metadata",), metadata_cache.stats()["served_without_download_ratio"]),
+                 (("llm_responses",), llm_cache.stats()["hit_ratio"])])
+    metrics.registry.register_collector(
+        "metricpage_job_queue_depth", "Queued background jobs per type", ("type",),
+        lambda: [((job_type,), s["queue_depth"]) for job_type, s in job_queue.stats().items()])
+
+    @app.route('/')
+    def index():
+        return static_page('index.html')
+
+    @app.route('/metrics')
+    @cache_policy(NO_STORE)
+    def metrics_endpoint():
+        # Prometheus text format: route/upstream latency, token usage, cache ratios
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/debug/traces')
+    @cache_policy(NO_STORE)
+    def debug_traces():
+        # Most recent traces first; ?min_ms= keeps only the slow ones
+        limit = request.args.get('limit', 50, type=int)
+        min_ms = request.args.get('min_ms', 0.0, type=float)
+        return jsonify({'traces': tracing.trace_buffer.recent(limit, min_ms)})
+
+    @app.route('/debug/traces/<trace_id>')
+    @cache_policy(NO_STORE)
+    def debug_trace(trace_id):
+        trace = tracing.trace_buffer.get(trace_id)
+        if trace is None:
+            return jsonify({'error': 'Unknown trace'}), 404
+        return jsonify(trace.to_dict())
+
+    @app.route('/upstream/pool_stats')
+    def upstream_pool_stats():
+        # Connection reuse per upstream host (GitHub, Anthropic)
+        return jsonify(pool_stats())
+
+    @app.route('/upstream/rate_limits')
+    def upstream_rate_limits():
+        # Remaining budget and queue/shed counts per upstream and credential
+        return jsonify(governor.stats())
+
+    @app.errorhandler(UpstreamRateLimited)
+    def upstream_rate_limited(e):
+        # Shed by the governor before the upstream would have answered 403/429
+        response = jsonify({'error': str(e), 'upstream': e.upstream, 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    @app.route('/cache/stats')
+    def cache_stats():
+        # Hit/miss/eviction counters for sizing the shared caches
+        stats = {'blobs': blob_cache.stats(), 'github_metadata': metadata_cache.stats(),
+                 'github_listings': listing_cache.stats(), 'llm_responses': llm_cache.stats(),
+                 'symbol_index': symbol_index.stats()}
+        if config.GIT_MIRROR:
+            from Shared.git_mirror import mirror
+            stats['git_mirror'] = mirror.stats()
+        return jsonify(stats)
+
+    if 'tester' in modules:
+        def pytest_stats():
+            # The worker pool (and subprocess) is only imported once someone asks
+            from TestBot.worker_pool import pytest_pool
+            return pytest_pool.stats()
+
+        metrics.registry.register_collector(
+            "metricpage_pytest_workers", "Warm pytest workers by state", ("state",),
+            lambda: [((state,), pytest_stats()[state]) for state in ("busy", "idle")])
+
+        @app.route('/tester/worker_stats')
+        def tester_worker_stats():
+            # Per-run latency and utilization of the warm pytest workers
+            return jsonify(pytest_stats())
+
+    @app.route('/jobs/<job_id>')
+    @cache_policy(NO_STORE)
+    def job_status(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify(job)
+
+    @app.route('/jobs/<job_id>/events')
+    def job_events(job_id):
+        if job_queue.get(job_id) is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return job_event_stream(job_id)
+
+    @app.route('/jobs/stats')
+    def job_stats():
+        # Queue depth, wait and run times per job type
+        return jsonify(job_queue.stats())
+
+    return app
+
+
+def __getattr__(name):
+    # The default app, built when something first asks for it (gunicorn app:app)
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5003)
+    create_app().run(debug=True, port=5003)
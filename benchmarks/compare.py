@@ -0,0 +1,88 @@
+"""
+Compare two saved benchmark runs.
+
+    python -m benchmarks.compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+Prints throughput, p50/p95/p99 and upstream calls per unit for every scenario
+the runs share, with the relative change. Exits 1 when a p95 got slower by
+more than --threshold percent, so the comparison can gate a change.
+"""
+import argparse
+import json
+import sys
+
+METRICS = [
+    ("throughput", lambda r: r["throughput_rps"], True),
+    ("p50 ms", lambda r: r["latency_ms"]["p50"], False),
+    ("p95 ms", lambda r: r["latency_ms"]["p95"], False),
+    ("p99 ms", lambda r: r["latency_ms"]["p99"], False),
+    ("github/unit", lambda r: r["upstream_calls_per_unit"]["github"], False),
+    ("llm/unit", lambda r: r["upstream_calls_per_unit"]["anthropic"], False),
+    ("errors", lambda r: r["errors"], False),
+]
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    """Relative change in percent, or None when it is undefined"""
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def regressions(before, after, threshold):
+    """Scenarios whose p95 latency grew by more than threshold percent"""
+    slower = []
+    for name, result in after["scenarios"].items():
+        baseline = before["scenarios"].get(name)
+        if baseline is None:
+            continue
+        delta = change(baseline["latency_ms"]["p95"], result["latency_ms"]["p95"])
+        if delta is not None and delta > threshold:
+            slower.append((name, delta))
+    return slower
+
+
+def print_comparison(before, after):
+    print(f"before: {before.get('started_at')} {before.get('revision') or ''} {before.get('label') or ''}")
+    print(f"after:  {after.get('started_at')} {after.get('revision') or ''} {after.get('label') or ''}")
+    for name, result in after["scenarios"].items():
+        baseline = before["scenarios"].get(name)
+        if baseline is None:
+            print(f"\n{name}: not in the earlier run")
+            continue
+        print(f"\n{name}")
+        for label, read, higher_is_better in METRICS:
+            old, new = read(baseline), read(result)
+            delta = change(old, new)
+            if delta is None:
+                verdict = ""
+            elif abs(delta) < 1:
+                verdict = "="
+            else:
+                verdict = "better" if (delta > 0) == higher_is_better else "worse"
+            shown = f"{delta:+.1f}%" if delta is not None else ""
+            print(f"  {label:<12} {old!s:>10} -> {new!s:>10}  {shown:>8} {verdict}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two saved benchmark runs")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="p95 slowdown (percent) that fails the check")
+    args = parser.parse_args(argv)
+    before, after = load(args.before), load(args.after)
+    print_comparison(before, after)
+    slower = regressions(before, after, args.threshold)
+    if slower:
+        print("\np95 regressions: " + ", ".join(f"{name} ({delta:+.1f}%)" for name, delta in slower))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Cold-start benchmark: import time and first-request time of the app.
+
+Every trial is a fresh interpreter, the way a new worker or a test run
+starts. It measures:
+- importing Flask;
+- importing app.py and building the app (create_app(), or the module-level app
+  of older checkouts);
+- the first request through the test client.
+
+Nothing here calls an upstream.
+
+    python -m benchmarks.startup
+    METRICPAGE_MODULES=chatbot python -m benchmarks.startup --label chatbot-only
+    python -m benchmarks.startup --root ../checkout-before --label before
+
+Results are saved under benchmarks/results/ like benchmarks.run; pass
+--compare to print the change against an earlier startup run.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import flask
+framework = time.perf_counter()
+import app as app_module
+factory = getattr(app_module, "create_app", None)
+application = factory() if factory else app_module.app
+ready = time.perf_counter()
+response = application.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    "framework_ms": (framework - start) * 1000,
+    "app_ms": (ready - framework) * 1000,
+    "first_request_ms": (done - ready) * 1000,
+    "total_ms": (done - start) * 1000,
+    "status": response.status_code,
+    "modules_loaded": len(sys.modules),
+}))
+"""
+
+MEASURES = ("framework_ms", "app_ms", "first_request_ms", "total_ms", "modules_loaded")
+
+
+def trial(root, path, workdir):
+    env = dict(os.environ)
+    # Keep the job queue and caches of the probe out of the checkout
+    env.setdefault("JOBS_DB_PATH", os.path.join(workdir, "jobs.sqlite3"))
+    env.setdefault("SYMBOL_INDEX_DB_PATH", os.path.join(workdir, "symbols.sqlite3"))
+    env.setdefault("BLOB_CACHE_DIR", os.path.join(workdir, "blobs"))
+    result = subprocess.run([sys.executable, "-c", PROBE, path], cwd=root, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"startup probe failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(trials):
+    summary = {}
+    for name in MEASURES:
+        values = sorted(t[name] for t in trials)
+        summary[name] = {"median": round(statistics.median(values), 1), "min": round(values[0], 1),
+                         "max": round(values[-1], 1)}
+    return summary
+
+
+def print_comparison(before, after):
+    for name in MEASURES:
+        old, new = before["summary"][name]["median"], after["summary"][name]["median"]
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        print(f"  {name:<18} {old:>9} -> {new:>9}  {delta}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of the app")
+    parser.add_argument("-n", "--trials", type=int, default=10)
+    parser.add_argument("--path", default="/", help="route for the first request")
+    parser.add_argument("--root", default=ROOT, help="checkout to measure (default: this one)")
+    parser.add_argument("--label")
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="earlier startup results file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="metricpage-startup-")
+    # The first trial warms the OS file cache and the bytecode cache; it is not counted
+    trial(args.root, args.path, workdir)
+    trials = [trial(args.root, args.path, workdir) for _ in range(args.trials)]
+    run = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "label": args.label,
+        "root": os.path.abspath(args.root),
+        "modules": os.getenv("METRICPAGE_MODULES") or "all",
+        "path": args.path,
+        "status": trials[-1]["status"],
+        "summary": summarize(trials),
+        "trials": trials,
+    }
+    for name, values in run["summary"].items():
+        print(f"{name:<18} median {values['median']:>8}  min {values['min']:>8}  max {values['max']:>8}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = "startup-" + time.strftime("%Y%m%d-%H%M%S") + (f"-{args.label}" if args.label else "") + ".json"
+    path = os.path.join(args.output_dir, name)
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print(f"\nmedians vs {args.compare}")
+        print_comparison(before, run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+"""
+Local stand-ins for the GitHub REST API and the Anthropic Messages API.
+
+Both are stdlib HTTP servers on 127.0.0.1 with configurable latency, so the
+benchmark runner can drive the app under load without network access or
+API quota. They answer just the endpoints the blueprints call, count every
+call per endpoint, and send the same rate-limit headers as the real
+services (with limits high enough not to get in the way by default).
+
+Synthetic repositories are generated deterministically from their size, so
+blob and tree shas are stable across runs and the app's caches behave as
+they would against GitHub.
+"""
+import calendar
+import hashlib
+import json
+import re
+import subprocess
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def fake_sha(*parts):
+    return hashlib.sha1("/".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def python_module(index, functions, documented_every=3):
+    """Source of a module with `functions` functions and one class; every third one has a docstring"""
+    lines = [f'"""Synthetic module {index}."""', "import math", ""]
+    for n in range(functions):
+        lines.append(f"def func_{index}_{n}(x, y={n}):")
+        if n % documented_every == 0:
+            lines.append(f'    """Scale x by {n} and offset it by y."""')
+        lines += [f"    total = x * {n} + y", "    if total > 100:", "        return math.sqrt(total)",
+                  "    return total", "", ""]
+    lines += [f"class Model{index}:", "    def __init__(self, size):", "        self.size = size", "",
+              "    def area(self):", "        return self.size * self.size", ""]
+    return "\n".join(lines)
+
+
+class SyntheticRepo:
+    """
+    name: str
+    files: int, number of Python modules (spread over directories of 50)
+    functions: int, functions per module
+    commits: int, length of the commit history
+    """
+
+    def __init__(self, name, files=100, functions=8, commits=100):
+        self.name = name
+        self.blobs = {}
+        self.entries = []
+        paths = ["README.md", "requirements.txt", "setup.py"]
+        contents = {"README.md": f"# {name}\n\nSynthetic repository for benchmarks.\n",
+                    "requirements.txt": "requests\n",
+                    "setup.py": f"from setuptools import setup\n\nsetup(name='{name}')\n"}
+        for i in range(files):
+            path = f"pkg{i // 50}/module_{i}.py"
+            paths.append(path)
+            contents[path] = python_module(i, functions)
+        for i in range(0, files, 10):
+            path = f"tests/test_module_{i}.py"
+            paths.append(path)
+            contents[path] = f"from pkg{i // 50}.module_{i} import func_{i}_0\n\n\ndef test_func():\n" \
+                             f"    assert func_{i}_0(1) == 0\n"
+        dirs = set()
+        for path in paths:
+            data = contents[path].encode("utf-8")
+            sha = git_blob_sha(data)
+            self.blobs[sha] = data
+            self.entries.append({"path": path, "mode": "100644", "type": "blob", "sha": sha, "size": len(data)})
+            parts = path.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                dirs.add("/".join(parts[:depth]))
+        for d in dirs:
+            self.entries.append({"path": d, "mode": "040000", "type": "tree", "sha": fake_sha(name, "tree", d)})
+        self.entries.sort(key=lambda e: e["path"])
+        self.tree_sha = fake_sha(name, "tree", "")
+        self.subtrees = {fake_sha(name, "tree", d): d for d in dirs}
+        self.head = fake_sha(name, "commit", 0)
+        self.commits = [{
+            "sha": fake_sha(name, "commit", n),
+            "commit": {"author": {"name": f"dev{n % 7}", "date": f"2024-01-{n % 28 + 1:02d}T12:00:00Z"},
+                       "message": f"Change {n}: adjust module_{n % max(files, 1)} and its tests"},
+        } for n in range(commits)]
+
+    def children(self, tree_sha):
+        """Direct entries of a tree (non-recursive listing), paths relative to it"""
+        prefix = "" if tree_sha == self.tree_sha else self.subtrees.get(tree_sha)
+        if prefix is None:
+            return None
+        prefix = f"{prefix}/" if prefix else ""
+        return [{**e, "path": e["path"][len(prefix):]} for e in self.entries
+                if e["path"].startswith(prefix) and "/" not in e["path"][len(prefix):]]
+
+
+def export_bare_repo(repo, path):
+    """
+    Write a SyntheticRepo as a real bare git repository at path, for the git
+    mirror backend (GIT_MIRROR_REMOTE=file://...). Every file is added by the
+    oldest commit and the rest of the history follows it. Blob SHAs match
+    the stub's; tree and commit SHAs are git's own.
+    """
+    subprocess.run(["git", "init", "--bare", "--quiet", path], check=True)
+    subprocess.run(["git", "-C", path, "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+    # Let clones ask for --filter=blob:none, as GitHub does
+    subprocess.run(["git", "-C", path, "config", "uploadpack.allowFilter", "true"], check=True)
+
+    def data(raw):
+        return b"data %d\n" % len(raw) + raw + b"\n"
+
+    stream = []
+    for n, commit in enumerate(reversed(repo.commits)):
+        author = commit["commit"]["author"]
+        when = calendar.timegm(time.strptime(author["date"], "%Y-%m-%dT%H:%M:%SZ"))
+        ident = f"{author['name']} <{author['name']}@example.com> {when} +0000".encode("utf-8")
+        stream += [b"commit refs/heads/main\n", b"author " + ident + b"\n", b"committer " + ident + b"\n",
+                   data(commit["commit"]["message"].encode("utf-8"))]
+        if n == 0:
+            for entry in repo.entries:
+                if entry["type"] == "blob":
+                    stream += [f"M 100644 inline {entry['path']}\n".encode("utf-8"), data(repo.blobs[entry["sha"]])]
+        stream.append(b"\n")
+    subprocess.run(["git", "-C", path, "fast-import", "--quiet"], input=b"".join(stream), check=True)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The app keeps pooled connections open; don't let the default backlog of 5 refuse them
+    request_queue_size = 128
+
+    def __init__(self, handler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.calls[key] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8") if content_type == "application/json" else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class GitHubStub(StubServer):
+    """
+    repos: list of SyntheticRepo, all owned by every username
+    latency_ms: added to every response
+    rate_limit: reported X-RateLimit-Limit per hour
+    extra_repos: empty repositories also listed for every username, so
+      /users/<name>/repos spans several pages
+    """
+
+    def __init__(self, repos, latency_ms=40, rate_limit=1_000_000, extra_repos=0):
+        super().__init__(GitHubHandler)
+        self.repos = {repo.name: repo for repo in repos}
+        self.repo_names = sorted(list(self.repos) + [f"project-{n:04d}" for n in range(extra_repos)])
+        self.latency = latency_ms / 1000
+        self.rate_limit = rate_limit
+        self.reset_at = int(time.time()) + 3600
+
+
+class GitHubHandler(_Handler):
+    routes = [
+        ("GET", r"/users/[^/]+/repos", "repos"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/branches", "branches"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/commits", "commits"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/commits/(?P<ref>.+)", "commit_sha"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/git/trees/(?P<sha>\w+)", "tree"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/git/blobs/(?P<sha>\w+)", "blob"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/git/ref/heads/(?P<branch>.+)", "ref"),
+        ("GET", r"/repos/[^/]+/(?P<repo>[^/]+)/git/commits/(?P<sha>\w+)", "git_commit"),
+        ("POST", r"/repos/[^/]+/(?P<repo>[^/]+)/git/blobs", "create_blob"),
+        ("POST", r"/repos/[^/]+/(?P<repo>[^/]+)/git/trees", "create_tree"),
+        ("POST", r"/repos/[^/]+/(?P<repo>[^/]+)/git/commits", "create_commit"),
+        ("PATCH", r"/repos/[^/]+/(?P<repo>[^/]+)/git/refs/heads/(?P<branch>.+)", "update_ref"),
+    ]
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                self.server.count(f"github {name}")
+                time.sleep(self.server.latency)
+                repo = self.server.repos.get(match.groupdict().get("repo", ""))
+                if "repo" in match.groupdict() and repo is None:
+                    return self.reply(404, {"message": "Not Found"})
+                return getattr(self, f"handle_{name}")(repo, **{k: v for k, v in match.groupdict().items()
+                                                                if k != "repo"})
+        self.server.count("github unmatched")
+        self.reply(404, {"message": "Not Found"})
+
+    def reply(self, status, body, content_type="application/json", headers=None):
+        server = self.server
+        used = sum(v for k, v in server.snapshot().items() if k.startswith("github "))
+        headers = {
+            "X-RateLimit-Limit": str(server.rate_limit),
+            "X-RateLimit-Remaining": str(max(0, server.rate_limit - used)),
+            "X-RateLimit-Reset": str(server.reset_at),
+            "X-RateLimit-Resource": "core",
+            **(headers or {}),
+        }
+        self.send_body(status, body, content_type, headers)
+
+    def reply_cacheable(self, body, links=None):
+        """Metadata responses carry an ETag and answer If-None-Match with 304"""
+        raw = json.dumps(body).encode("utf-8")
+        etag = f'"{hashlib.sha1(raw).hexdigest()}"'
+        headers = {"ETag": etag}
+        if links:
+            headers["Link"] = ", ".join(f'<{url}>; rel="{rel}"' for rel, url in links.items())
+        if self.headers.get("If-None-Match") == etag:
+            self.server.count("github not_modified")
+            return self.reply(304, b"", headers=headers)
+        self.reply(200, raw, headers=headers)
+
+    def reply_paged(self, items, with_last=True):
+        """One page of items with GitHub's next/last Link headers"""
+        per_page = int(self.query.get("per_page", 30))
+        page = int(self.query.get("page", 1))
+        last = max(1, -(-len(items) // per_page))
+        links = {}
+        base = f"{self.server.url}{urlsplit(self.path).path}?per_page={per_page}"
+        if page < last:
+            links["next"] = f"{base}&page={page + 1}"
+            if with_last:
+                links["last"] = f"{base}&page={last}"
+        self.reply_cacheable(items[(page - 1) * per_page:page * per_page], links)
+
+    def handle_repos(self, repo):
+        self.reply_paged([{"name": name} for name in self.server.repo_names])
+
+    def handle_branches(self, repo):
+        self.reply_paged([{"name": "main", "commit": {"sha": repo.head}}])
+
+    def handle_commits(self, repo):
+        # Like GitHub, commit lists only link to the next page
+        self.reply_paged(repo.commits, with_last=False)
+
+    def handle_commit_sha(self, repo, ref):
+        self.reply(200, repo.head, content_type="application/vnd.github.sha")
+
+    def handle_tree(self, repo, sha):
+        if self.query.get("recursive"):
+            # Any commit of the repo resolves to the same tree
+            return self.reply(200, {"sha": repo.tree_sha, "tree": repo.entries, "truncated": False})
+        children = repo.children(repo.tree_sha if sha not in repo.subtrees else sha)
+        self.reply(200, {"sha": sha, "tree": children, "truncated": False})
+
+    def handle_blob(self, repo, sha):
+        data = repo.blobs.get(sha)
+        if data is None:
+            return self.reply(404, {"message": "Not Found"})
+        self.reply(200, data, content_type="application/vnd.github.raw")
+
+    def handle_ref(self, repo, branch):
+        self.reply(200, {"ref": f"refs/heads/{branch}", "object": {"sha": repo.head, "type": "commit"}})
+
+    def handle_git_commit(self, repo, sha):
+        self.reply(200, {"sha": sha, "tree": {"sha": repo.tree_sha}})
+
+    def handle_create_blob(self, repo):
+        content = self.read_json().get("content", "")
+        self.reply(201, {"sha": git_blob_sha(content.encode("utf-8"))})
+
+    def handle_create_tree(self, repo):
+        self.reply(201, {"sha": fake_sha(repo.name, "tree", json.dumps(self.read_json(), sort_keys=True))})
+
+    def handle_create_commit(self, repo):
+        body = self.read_json()
+        self.reply(201, {"sha": fake_sha(repo.name, "commit", body.get("tree"), time.time())})
+
+    def handle_update_ref(self, repo, branch):
+        # Commits are accepted without changing the synthetic tree, so every run sees the same repo
+        sha = self.read_json().get("sha")
+        self.reply(200, {"ref": f"refs/heads/{branch}", "object": {"sha": sha, "type": "commit"}})
+
+
+class AnthropicStub(StubServer):
+    """
+    first_token_ms: latency before the first token (the whole reply waits for it too)
+    tokens_per_second: output speed after the first token
+    output_tokens: length of free-text replies (chat, summaries, READMEs)
+    rate_limits: (requests, input tokens, output tokens) per minute reported in headers
+    """
+
+    def __init__(self, first_token_ms=300, tokens_per_second=200, output_tokens=200,
+                 rate_limits=(100_000, 100_000_000, 100_000_000)):
+        super().__init__(AnthropicHandler)
+        self.first_token = first_token_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.rate_limits = rate_limits
+
+
+LOREM = ("the service reads the repository tree once and keeps every blob it decoded so "
+         "later requests only pay for what changed since then ").split()
+
+
+class AnthropicHandler(_Handler):
+    def do_POST(self):
+        if urlsplit(self.path).path != "/v1/messages":
+            self.server.count("anthropic unmatched")
+            return self.send_body(404, {"type": "error", "error": {"message": "Not Found"}})
+        payload = self.read_json()
+        stream = bool(payload.get("stream"))
+        self.server.count("anthropic messages_stream" if stream else "anthropic messages")
+        text = self.reply_text(payload)
+        input_tokens = (len(json.dumps(payload.get("messages", []))) + len(json.dumps(payload.get("system") or ""))) // 4
+        output_tokens = max(1, len(text) // 4)
+        self.server.count("anthropic input_tokens", input_tokens)
+        self.server.count("anthropic output_tokens", output_tokens)
+        if stream:
+            self.stream(text, input_tokens, output_tokens)
+        else:
+            time.sleep(self.server.first_token + output_tokens / self.server.tokens_per_second)
+            self.send_body(200, {
+                "id": f"msg_{fake_sha(time.time())[:24]}", "type": "message", "role": "assistant",
+                "model": payload.get("model"), "stop_reason": "end_turn",
+                "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }, headers=self.rate_limit_headers())
+
+    def reply_text(self, payload):
+        """A plausible reply for the prompt: a pytest test, a docstring, or filler text"""
+        prompt = json.dumps(payload.get("messages", []))
+        system = json.dumps(payload.get("system") or "")
+        if "pytest test function" in prompt:
+            names = re.findall(r"def (\w+)\(", json.loads(prompt)[-1]["content"]) or ["func"]
+            name = names[0]
+            return (f"from module import {name}\n\n\ndef test_{name}():\n"
+                    f"    assert {name} is not None\n")
+        if "docstring" in system.lower() and "suggest" not in system.lower():
+            return "Scale x and offset it by y.\n\nReturns the square root once the total passes 100."
+        words = [LOREM[i % len(LOREM)] for i in range(self.server.output_tokens)]
+        return " ".join(words).capitalize() + "."
+
+    def rate_limit_headers(self):
+        requests_limit, input_limit, output_limit = self.server.rate_limits
+        headers = {}
+        for name, limit in (("requests", requests_limit), ("input-tokens", input_limit),
+                            ("output-tokens", output_limit)):
+            headers[f"anthropic-ratelimit-{name}-limit"] = str(limit)
+            headers[f"anthropic-ratelimit-{name}-remaining"] = str(limit)
+        return headers
+
+    def stream(self, text, input_tokens, output_tokens):
+        time.sleep(self.server.first_token)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        for name, value in self.rate_limit_headers().items():
+            self.send_header(name, value)
+        # No Content-Length: the body ends when the connection closes
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event("message_start", {"message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}})
+        event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        words = text.split(" ")
+        chunk = 5
+        for i in range(0, len(words), chunk):
+            piece = " ".join(words[i:i + chunk]) + (" " if i + chunk < len(words) else "")
+            event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": piece}})
+            time.sleep(len(piece) / 4 / self.server.tokens_per_second)
+        event("content_block_stop", {"index": 0})
+        event("message_delta", {"delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": output_tokens}})
+        event("message_stop", {})
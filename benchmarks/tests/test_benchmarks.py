@@ -0,0 +1,103 @@
+import json
+
+import pytest
+import requests
+
+from benchmarks import compare
+from benchmarks.run import percentile, summarize
+from benchmarks.stubs import AnthropicStub, GitHubStub, SyntheticRepo, git_blob_sha
+
+
+@pytest.fixture(scope="module")
+def github():
+    stub = GitHubStub([SyntheticRepo("repo", files=60, functions=2, commits=5)], latency_ms=0,
+                      rate_limit=1000, extra_repos=40).start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture(scope="module")
+def anthropic():
+    stub = AnthropicStub(first_token_ms=0, tokens_per_second=100000, output_tokens=12).start()
+    yield stub
+    stub.stop()
+
+
+def test_synthetic_repos_are_deterministic_with_real_blob_shas():
+    first, second = SyntheticRepo("r", files=3), SyntheticRepo("r", files=3)
+
+    assert first.entries == second.entries
+    assert all(git_blob_sha(first.blobs[e["sha"]]) == e["sha"] for e in first.entries if e["type"] == "blob")
+    assert [e["path"] for e in first.children(first.tree_sha)] == [
+        "README.md", "pkg0", "requirements.txt", "setup.py", "tests"]
+
+
+def test_github_stub_serves_trees_blobs_and_counts_calls(github):
+    repo = github.repos["repo"]
+    before = github.snapshot()
+
+    tree = requests.get(f"{github.url}/repos/u/repo/git/trees/{repo.head}", params={"recursive": 1}).json()
+    blob_sha = next(e["sha"] for e in tree["tree"] if e["path"] == "README.md")
+    blob = requests.get(f"{github.url}/repos/u/repo/git/blobs/{blob_sha}")
+
+    assert blob.content == repo.blobs[blob_sha]
+    assert blob.headers["X-RateLimit-Limit"] == "1000"
+    assert requests.get(f"{github.url}/repos/u/missing/git/trees/x").status_code == 404
+    after = github.snapshot()
+    assert after["github tree"] - before.get("github tree", 0) == 2
+    assert after["github blob"] - before.get("github blob", 0) == 1
+
+
+def test_github_stub_pages_with_links_and_etags(github):
+    first = requests.get(f"{github.url}/users/u/repos", params={"per_page": 30})
+    again = requests.get(f"{github.url}/users/u/repos", params={"per_page": 30},
+                         headers={"If-None-Match": first.headers["ETag"]})
+    last = requests.get(first.links["last"]["url"])
+
+    assert len(first.json()) == 30
+    assert again.status_code == 304
+    assert len(last.json()) == 11 and "next" not in last.links
+
+
+def test_anthropic_stub_replies_with_usage_and_streams(anthropic):
+    payload = {"model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+
+    reply = requests.post(f"{anthropic.url}/v1/messages", json=payload).json()
+    streamed = requests.post(f"{anthropic.url}/v1/messages", json={**payload, "stream": True}).text
+
+    assert reply["usage"]["output_tokens"] > 0
+    text = "".join(json.loads(line[6:])["delta"]["text"] for line in streamed.splitlines()
+                   if line.startswith("data: ") and "text_delta" in line)
+    assert text == reply["content"][0]["text"]
+    assert streamed.rstrip().endswith('"type": "message_stop"}')
+
+
+def test_summaries_use_nearest_rank_percentiles():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 99) == 4
+    assert percentile([], 50) is None
+
+    samples = [{"started": n, "latency": n / 10, "ok": n != 3, "status": 200 if n != 3 else 500}
+               for n in range(1, 5)]
+    result = summarize(samples, 2.0, {"github tree": 4, "github not_modified": 2, "anthropic messages": 2}, 2)
+
+    assert (result["requests"], result["errors"], result["throughput_rps"]) == (4, 1, 2.0)
+    assert result["latency_ms"]["first"] == 100.0
+    assert result["upstream_calls_per_unit"] == {"github": 2.0, "anthropic": 1.0}
+
+
+def run_file(tmp_path, name, p95):
+    path = tmp_path / name
+    path.write_text(json.dumps({"scenarios": {"filetree": {
+        "throughput_rps": 10, "errors": 0, "latency_ms": {"p50": 1, "p95": p95, "p99": p95},
+        "upstream_calls_per_unit": {"github": 1, "anthropic": 0}}}}))
+    return str(path)
+
+
+def test_compare_fails_on_a_p95_regression(tmp_path, capsys):
+    before = run_file(tmp_path, "before.json", 100)
+
+    assert compare.main([before, run_file(tmp_path, "same.json", 105)]) == 0
+    assert compare.main([before, run_file(tmp_path, "slower.json", 150)]) == 1
+    assert "filetree (+50.0%)" in capsys.readouterr().out
+    assert compare.change(0, 5) is None
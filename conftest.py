@@ -0,0 +1,24 @@
+"""
+Settings for every test under the packages' tests/ directories.
+
+The modules read their configuration from the environment when they are
+imported, so anything that would write into the checkout or reach a real
+upstream is pointed at a throwaway directory and an unroutable address
+before the first of them loads.
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="metricpage-tests-")
+
+os.environ.update({
+    "GITHUB_API_URL": "http://127.0.0.1:9",
+    "ANTHROPIC_API_URL": "http://127.0.0.1:9/v1/messages",
+    "GITHUB_TOKEN": "test-github-token",
+    "ANTHROPIC_API_KEY": "test-anthropic-key",
+    "MODEL": "test-model",
+    "BLOB_CACHE_DIR": os.path.join(_workdir, "blobs"),
+    "JOBS_DB_PATH": os.path.join(_workdir, "jobs.sqlite3"),
+    "SYMBOL_INDEX_DB_PATH": os.path.join(_workdir, "symbols.sqlite3"),
+    "REPO_BASE": os.path.join(_workdir, "cloned_repos"),
+})
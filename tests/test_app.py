@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app as app_module
+from app import create_app
+from Shared.rate_limits import UpstreamRateLimited
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_only_the_enabled_blueprints_are_registered():
+    app = create_app(["chatbot"])
+
+    assert set(app.blueprints) == {"chatbot"}
+    client = app.test_client()
+    assert client.get("/chatbot/").status_code == 200
+    assert client.get("/writer/").status_code == 404
+    assert client.get("/tester/worker_stats").status_code == 404
+
+
+def test_unknown_modules_are_rejected():
+    with pytest.raises(ValueError, match="Unknown module"):
+        create_app(["chatbot", "nope"])
+
+
+def test_importing_the_factory_leaves_the_blueprints_unloaded():
+    code = ("import sys, app\n"
+            "loaded = [m for m in ('ChatBot.chatbot', 'Docuwriter.docuwriter', 'TestBot.tester', "
+            "'AgentLogger.log', 'TestBot.worker_pool') if m in sys.modules]\n"
+            "app.create_app(['logger'])\n"
+            "print(loaded, 'TestBot.tester' in sys.modules, 'AgentLogger.log' in sys.modules)")
+
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[] False True"
+
+
+def test_shed_calls_become_429_with_retry_after():
+    app = create_app(["chatbot"])
+
+    @app.route("/limited")
+    def limited():
+        raise UpstreamRateLimited("github", 2.2, "core quota")
+
+    response = app.test_client().get("/limited")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert response.get_json()["upstream"] == "github"
+
+
+def test_shared_routes_report_state():
+    client = create_app(["tester"]).test_client()
+
+    metrics = client.get("/metrics")
+    assert metrics.mimetype == "text/plain"
+    assert "metricpage_cache_hit_ratio" in metrics.get_data(as_text=True)
+    assert "no-store" in metrics.headers["Cache-Control"]
+    assert set(client.get("/cache/stats").get_json()) >= {"blobs", "github_metadata", "llm_responses"}
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.get("/debug/traces/unknown").status_code == 404
+    assert "utilization" in client.get("/tester/worker_stats").get_json()
+
+
+def test_the_default_app_is_built_on_first_access(monkeypatch):
+    # Recorded first so the app built here is dropped again afterwards
+    monkeypatch.setitem(app_module.__dict__, "app", None)
+    monkeypatch.delitem(app_module.__dict__, "app")
+    built = []
+    monkeypatch.setattr(app_module, "create_app", lambda: built.append(1) or "the app")
+
+    assert app_module.app == "the app"
+    assert app_module.app == "the app"
+    assert built == [1]